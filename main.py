@@ -1,19 +1,127 @@
 import argparse
+import datetime
+import json
 import sys
 import yaml
 import os
+import signal
 import time
 
-# Import service modules from the src/ directory
-from src.local_client_manager import LocalClientManager
-from src.oci_manager import OCIManager  
-from src.config_parser import ConfigParser  
-from src.usage_tracker import UsageTracker  
+from src.config_parser import ConfigParser
+
+# Service modules are imported by the command that needs them, so that e.g.
+# `report` never loads the OCI SDK; `python -m src.import_bench` measures
+# what each command actually imports.
+
+# Commands that act as thin clients of the control daemon when it is running.
+DAEMON_COMMANDS = ('status', 'stop', 'report')
+
+
+def _daemon_client(config):
+    from src.control_daemon import DaemonClient, socket_path_from_config
+    return DaemonClient.connect(socket_path_from_config(config))
+
+
+def _rules_settings(config):
+    """
+    Returns (mode, rules_file, pac_file) from the 'routing' config section.
+    """
+    routing = config.get('routing') or {}
+    rules_file = routing.get('rules_file', 'routing_rules.yaml')
+    if not os.path.isabs(rules_file) and not os.path.exists(rules_file):
+        # Relative rules files live next to config.yaml.
+        rules_file = os.path.join('config', rules_file)
+    return routing.get('mode', 'disabled'), rules_file, routing.get('pac_file_path', 'proxy.pac')
+
+
+def _write_pac(config, local_client_manager, rule_cache=None):
+    """
+    Writes the PAC file for routing.mode 'selective' or 'global'; returns its path or None.
+    """
+    mode, rules_file, pac_file = _rules_settings(config)
+    if mode not in ('selective', 'global'):
+        return None
+    if rule_cache is None:
+        from src.rule_cache import RuleCache
+        rule_cache = RuleCache((config.get('routing') or {}).get('rules_cache_dir', '.rule_cache'))
+    if local_client_manager.generate_pac_file(rules_file, pac_file, mode, rule_cache=rule_cache):
+        return pac_file
+    return None
+
+
+def _watch_rules(config, local_client_manager):
+    """
+    Starts a RulesWatcher that keeps the PAC file in step with the rules; returns it or None.
+    """
+    mode, rules_file, pac_file = _rules_settings(config)
+    if mode != 'selective' or not (config.get('routing') or {}).get('watch_rules', True):
+        return None
+    from src.rule_cache import RuleCache, RulesWatcher
+    rule_cache = RuleCache((config.get('routing') or {}).get('rules_cache_dir', '.rule_cache'))
+
+    def publish():
+        if _write_pac(config, local_client_manager, rule_cache) is None:
+            return None
+        return rule_cache.inputs
+
+    if publish() is None:
+        return None
+    watcher = RulesWatcher(publish, rule_cache.inputs, on_event=print)
+    watcher.start()
+    return watcher
+
+
+def _server_ip(config, server_ip=None):
+    """
+    Returns `server_ip`, else the last known instance IP; exits when neither is known.
+    """
+    if server_ip is None:
+        from src.instance_state import InstanceStateStore, project_tag
+        server_ip = (InstanceStateStore().get(project_tag(config)) or {}).get('public_ip')
+    if not server_ip:
+        print("No known server IP; run `start` first or pass --server-ip.")
+        sys.exit(1)
+    return server_ip
+
+
+def _export_profiles(config, server_ip, fmt=None, output_dir=None, workers=None):
+    """
+    Exports a profile and QR code per configured device; returns (profiles, rendered count).
+    """
+    from src.profile_exporter import ProfileExporter
+    export = config.get('export') or {}
+    exporter = ProfileExporter(config.get('shadowsocks', {}), output_dir=output_dir or export.get('output_dir', 'profiles'),
+                               fmt=fmt or export.get('format', 'svg'), workers=workers or export.get('workers'))
+    return exporter.export(server_ip, export.get('devices'))
+
+
+def _oci_manager(config, daemon=None):
+    if daemon is not None:
+        from src.control_daemon import RemoteOCIManager
+        return RemoteOCIManager(daemon)
+    from src.oci_manager import OCIManager
+    return OCIManager(config)
+
+
+def _local_client_manager(config):
+    from src.local_client_manager import LocalClientManager
+    return LocalClientManager(config.get('shadowsocks', {}),
+                              meter_port=(config.get('monitoring') or {}).get('meter_port'))
+
+
+def _usage_tracker(config, daemon=None):
+    if daemon is not None:
+        from src.control_daemon import RemoteUsageTracker
+        return RemoteUsageTracker(daemon)
+    from src.usage_tracker import UsageTracker
+    return UsageTracker(config.get('monitoring', {}))
 
 # --- Main Application Logic ---
 
 def main():
     parser = argparse.ArgumentParser(description="OCI Shadowsocks Manager CLI")
+    parser.add_argument('--no-daemon', action='store_true', help='Do not use a running control daemon')
+    parser.add_argument('--member', default=None, help='Act on this pool member instead of the default instance')
     subparsers = parser.add_subparsers(dest='command', help='Available commands')
 
     # Start command
@@ -27,66 +135,417 @@ def main():
 
     # Export Android details command
     export_android_parser = subparsers.add_parser('export-android', help='Generate Android connection details and QR code')
+    export_android_parser.add_argument('--server-ip', default=None, help='Server address; defaults to the last known instance IP')
+
+    # Batch profile export command
+    export_profiles_parser = subparsers.add_parser('export-profiles', help='Export SIP002 URLs and QR codes for every configured device')
+    export_profiles_parser.add_argument('--server-ip', default=None, help='Server address; defaults to the last known instance IP')
+    export_profiles_parser.add_argument('--format', choices=['svg', 'png', 'terminal'], default=None, help='QR code format')
+    export_profiles_parser.add_argument('--output-dir', default=None, help='Where to write the QR codes and profiles.json')
+    export_profiles_parser.add_argument('--workers', type=int, default=None, help='QR rendering processes')
+    export_profiles_parser.add_argument('--print', action='store_true', help='Also print each QR code to the terminal')
 
     # Test connection command
     test_connection_parser = subparsers.add_parser('test-connection', help='Test proxy connectivity')
     test_connection_parser.add_argument('url', nargs='?', default='https://api.openai.com', help='URL to test the proxy connection against')
 
+    # Benchmark command
+    bench_parser = subparsers.add_parser('bench', help='Benchmark latency and throughput through the local SOCKS proxy')
+    bench_parser.add_argument('--url', default='https://speed.cloudflare.com/__down?bytes=1000000', help='Download URL')
+    bench_parser.add_argument('--upload-url', default=None, help='Optional URL accepting POST uploads')
+    bench_parser.add_argument('--upload-bytes', type=int, default=1 << 20, help='Bytes per upload request')
+    bench_parser.add_argument('--streams', type=int, default=4, help='Number of concurrent streams')
+    bench_parser.add_argument('--requests', type=int, default=5, help='Requests per stream')
+    bench_parser.add_argument('--proxy', default=None, help='SOCKS5 proxy as host:port (defaults to the local client)')
+    bench_parser.add_argument('--output', default=None, help='Write the JSON results to this file')
+    bench_parser.add_argument('--baseline', default=None, help='Compare against an earlier JSON result')
+    bench_parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative regression')
+
+    # Supervised local client command
+    client_parser = subparsers.add_parser('client', help='Run and supervise the local ss-local client until interrupted')
+
+    # Idle auto-shutdown command
+    watch_parser = subparsers.add_parser('watch', help='Run the supervised client and stop the instance once the proxy is idle')
+    watch_parser.add_argument('--interval', type=float, default=30, help='Seconds between activity checks')
+
+    # PAC command
+    pac_parser = subparsers.add_parser('pac', help='Compile the routing rules and write the PAC file')
+    pac_parser.add_argument('--watch', action='store_true', help='Keep the PAC file updated as the rules change')
+
+    # Server pool command
+    pool_parser = subparsers.add_parser('pool', help='Probe the pool members and pick the fastest healthy one')
+    pool_parser.add_argument('--connect', action='store_true', help='Run the supervised client on the fastest member and keep re-evaluating')
+
+    # Fleet command
+    fleet_parser = subparsers.add_parser('fleet', help='Run start, stop or status on all pool members concurrently')
+    fleet_parser.add_argument('action', choices=['start', 'stop', 'status'])
+    fleet_parser.add_argument('--members', default=None, help='Comma-separated member names (default: all)')
+    fleet_parser.add_argument('--workers', type=int, default=None, help='Members handled at once')
+    fleet_parser.add_argument('--api-stats', action='store_true', help='Print OCI API call statistics afterwards')
+
+    # Control daemon command
+    daemon_parser = subparsers.add_parser('daemon', help='Run the local control daemon that keeps OCI clients warm')
+    daemon_parser.add_argument('--stop', action='store_true', help='Ask a running daemon to exit')
+    daemon_parser.add_argument('--stats', action='store_true', help="Print a running daemon's OCI API call statistics")
+
     # Report command
     report_parser = subparsers.add_parser('report', help='Generate usage report')
+    report_parser.add_argument('--since', type=datetime.date.fromisoformat, default=None, help='First day to include (YYYY-MM-DD)')
+    report_parser.add_argument('--until', type=datetime.date.fromisoformat, default=None, help='Last day to include (YYYY-MM-DD)')
+    report_parser.add_argument('--format', choices=['text', 'csv', 'json'], default='text', help='Report format')
+    report_parser.add_argument('--output', default=None, help='Write the report to this file instead of stdout')
+    report_parser.add_argument('--summary', action='store_true', help='Only print monthly and per-instance totals')
 
     args = parser.parse_args()
 
     # Load configuration
-    config_parser = ConfigParser()
+    config_parser = ConfigParser("config/config.yaml")
     success, message = config_parser.load_config()
     if not success:
         print(message)
         sys.exit(1)
 
-    oci_manager = OCIManager(config_parser.config)
-    local_client_manager = LocalClientManager(config_parser.config.get('shadowsocks', {}))
-    usage_tracker = UsageTracker()
-    
+    config = config_parser.config
+    if args.member:
+        from src.server_pool import member_config
+        try:
+            config_parser.config = config = member_config(config, args.member)
+        except KeyError as e:
+            print(e.args[0])
+            sys.exit(1)
+    daemon = None
+    # The daemon serves the default instance only.
+    if args.command in DAEMON_COMMANDS and not args.no_daemon and not args.member:
+        daemon = _daemon_client(config)
+
     # Process commands
     if args.command == 'start':
+        from src.start_pipeline import StartPipeline, format_timings
+        oci_manager = _oci_manager(config)
+        local_client_manager = _local_client_manager(config)
+        usage_tracker = _usage_tracker(config)
         print("Starting OCI Shadowsocks Manager...")
-        server_details = oci_manager.create_or_get_instance()
-        oci_manager.update_network_security_list(server_details['server_ip'], config_parser.config['shadowsocks']['server_port'])
-        
+        pipeline = StartPipeline(oci_manager, local_client_manager,
+                                 config_parser.config['shadowsocks']['server_port'],
+                                 config_parser.config['compute'].get('readiness_timeout', 300))
+        try:
+            result = pipeline.run()
+        except Exception as e:
+            print(f"Start failed: {e}")
+            print(format_timings(pipeline.timings))
+            sys.exit(1)
+        # The instance is running from here on, so the session is logged
+        # before anything optional below gets a chance to fail.
+        if usage_tracker.open_session() is None:
+            usage_tracker.log_start(result['instance'].id)
+
         # Now, generate connection details for the user to manually enter into ShadowsocksX-NG
         print("\nOCI instance is provisioned and secure.")
         print("Please use the following details to configure your ShadowsocksX-NG client:")
-        ss_url, qr_file = local_client_manager.generate_connection_details()
-        print(f"\nShadowsocks URL: {ss_url}")
-        print(f"A QR code for mobile setup has been saved to: {qr_file}")
+        print(f"\nShadowsocks URL: {result['ss_url']}")
+        print(f"A QR code for mobile setup has been saved to: {result['qr_file']}")
+        print(f"ss-local configuration written to: {result['client_config']}")
+        try:
+            pac_file = _write_pac(config, local_client_manager)
+            if pac_file:
+                print(f"PAC file for selective routing written to: {pac_file}")
+        except Exception as e:
+            print(f"Warning: could not write the PAC file: {e}")
+        if (config.get('export') or {}).get('devices'):
+            try:
+                profiles, rendered = _export_profiles(config, result['server_ip'])
+                print(f"Device profiles refreshed: {rendered} of {len(profiles)} changed.")
+            except Exception as e:
+                print(f"Warning: could not export device profiles: {e}")
+        print("\nStart-up timings:")
+        print(format_timings(result['timings']))
+        if result['launch']:
+            print("\nLaunch attempts:")
+            for label, outcome, seconds in result['launch']['attempts']:
+                print(f"  {label}: {outcome} ({seconds:.0f}s)")
         print("\nNote: The local Shadowsocks client (ShadowsocksX-NG) is a GUI application that you must start manually.")
 
     elif args.command == 'stop':
-        success, message = oci_manager.stop_instance()
+        from src.control_daemon import DaemonError
+        try:
+            success, message = _oci_manager(config, daemon).stop_instance()
+        except (DaemonError, OSError) as e:
+            print(f"Control daemon call failed ({e}); stopping in-process.")
+            daemon = None
+            success, message = _oci_manager(config).stop_instance()
         if success:
+            try:
+                _usage_tracker(config, daemon).log_stop()
+            except (DaemonError, OSError) as e:
+                print(f"Control daemon call failed ({e}); logging the stop in-process.")
+                _usage_tracker(config).log_stop()
             print(f"Stop command successful: {message}")
         else:
             print(f"Stop command failed: {message}")
 
     elif args.command == 'status':
-        status = oci_manager.get_instance_status()
-        print(f"OCI instance status: {status}")
+        # A record verified within the TTL answers without loading the OCI SDK.
+        from src.instance_state import InstanceStateStore, project_tag
+        store = InstanceStateStore(ttl_seconds=config['compute'].get('state_ttl_seconds', 60))
+        record = store.get(project_tag(config))
+        if store.is_fresh(record):
+            status = record['lifecycle_state']
+            message = f"Instance is currently {status} (verified {store.clock() - record['last_verified']:.0f}s ago)."
+        else:
+            from src.control_daemon import DaemonError
+            try:
+                status, message = _oci_manager(config, daemon).get_instance_status()
+            except (DaemonError, OSError) as e:
+                print(f"Control daemon call failed ({e}); checking in-process.")
+                status, message = _oci_manager(config).get_instance_status()
+        print(f"OCI instance status: {status} - {message}")
 
     elif args.command == 'export-android':
-        ss_url, qr_file = local_client_manager.generate_connection_details()
+        server_ip = _server_ip(config, args.server_ip)
+        try:
+            ss_url, qr_file = _local_client_manager(config).generate_connection_details(server_ip)
+        except ImportError as e:
+            print(f"Export failed: {e}")
+            sys.exit(1)
         print("Android Connection Details:")
         print(f"Shadowsocks URL: {ss_url}")
         print(f"QR code saved to: {qr_file}")
 
+    elif args.command == 'export-profiles':
+        server_ip = _server_ip(config, args.server_ip)
+        fmt = 'terminal' if args.print and not args.format else args.format
+        try:
+            profiles, rendered = _export_profiles(config, server_ip, fmt, args.output_dir, args.workers)
+        except (KeyError, ValueError, ImportError) as e:
+            print(f"Export failed: {e}")
+            sys.exit(1)
+        for profile in profiles:
+            print(f"{profile['name']}: {profile['url']}")
+            if args.print:
+                from src.profile_exporter import render_qr
+                print(render_qr(profile['url'], 'terminal').decode('utf-8'))
+        print(f"{len(profiles)} profiles exported ({rendered} QR codes rendered, {len(profiles) - rendered} unchanged).")
+
     elif args.command == 'test-connection':
-        success, message = local_client_manager.test_connection(args.url)
+        success, message = _local_client_manager(config).test_connection(args.url)
         print(message)
         
+    elif args.command in ('client', 'watch'):
+        from src.client_supervisor import ClientSupervisor
+        from src.traffic_meter import TrafficMeter, UsageRecorder
+        monitoring = config.get('monitoring', {})
+        if args.command == 'watch' and not monitoring.get('meter_port'):
+            print("The watch command needs monitoring.meter_port to observe proxy activity.")
+            sys.exit(1)
+        oci_manager = _oci_manager(config)
+        local_client_manager = _local_client_manager(config)
+        usage_tracker = _usage_tracker(config)
+        instance = oci_manager.find_existing_instance()
+        if instance is None:
+            print("No running Shadowsocks instance found. Run `start` first.")
+            sys.exit(1)
+        supervisor = ClientSupervisor(local_client_manager, on_event=print)
+        success, message = supervisor.start(oci_manager.get_public_ip(instance.id))
+        if not success:
+            print(f"Client failed to start: {message}")
+            sys.exit(1)
+        meter = recorder = None
+        if monitoring.get('meter_port'):
+            quota_gb = monitoring.get('monthly_traffic_quota_gb')
+            recorder = UsageRecorder(usage_tracker,
+                                     monthly_quota_bytes=quota_gb * 10**9 if quota_gb else None,
+                                     alert_threshold=monitoring.get('resource_alert_threshold', 80),
+                                     flush_interval=monitoring.get('traffic_flush_seconds', 60))
+            meter = TrafficMeter(monitoring['meter_port'], local_client_manager.config['local_port'],
+                                 sample_interval=monitoring.get('traffic_sample_seconds', 5), on_sample=recorder)
+            print(f"Metering SOCKS proxy on 127.0.0.1:{meter.start()}; only traffic through this port is counted.")
+        def stop_meter():
+            # The last traffic must reach the usage log while its session is still open.
+            if meter is not None:
+                meter.stop()
+                recorder.flush()
+
+        rules_watcher = _watch_rules(config, local_client_manager)
+        try:
+            if args.command == 'watch':
+                from src.idle_watcher import IdleWatcher
+                idle_minutes = config_parser.config['compute'].get('auto_shutdown_minutes', 30)
+                watcher = IdleWatcher(oci_manager, usage_tracker, meter.snapshot, idle_minutes=idle_minutes,
+                                      check_interval=args.interval, on_event=print, on_stopped=stop_meter)
+                signal.signal(signal.SIGTERM, lambda signum, frame: watcher.stop())
+                print(f"Watching proxy activity; the instance stops after {idle_minutes} idle minutes.")
+                print(watcher.run()[1])
+            else:
+                print("Supervising ss-local; press Ctrl+C to stop.")
+                supervisor.wait()
+        except KeyboardInterrupt:
+            pass
+        if rules_watcher is not None:
+            rules_watcher.stop()
+        stop_meter()
+        print(supervisor.stop()[1])
+
+    elif args.command == 'bench':
+        from src import proxy_bench
+        if args.proxy:
+            proxy_host, _, proxy_port = args.proxy.rpartition(':')
+        else:
+            proxy_host, proxy_port = '127.0.0.1', _local_client_manager(config).proxy_port()
+        results = proxy_bench.run_benchmark(
+            args.url, proxy_host, int(proxy_port), streams=args.streams, requests_per_stream=args.requests,
+            upload_url=args.upload_url, upload_bytes=args.upload_bytes,
+            timeout=config_parser.config['monitoring'].get('connection_timeout', 30)
+        )
+        print(json.dumps(results, indent=4))
+        if args.output:
+            proxy_bench.save_results(results, args.output)
+        if args.baseline:
+            regressions = proxy_bench.compare_results(proxy_bench.load_results(args.baseline), results, args.tolerance)
+            for regression in regressions:
+                print(f"REGRESSION: {regression}")
+            if regressions:
+                sys.exit(1)
+
     elif args.command == 'report':
-        report = usage_tracker.generate_report()
-        print(report)
+        from src.control_daemon import DaemonError
+
+        def report_lines(usage_tracker):
+            if not args.summary:
+                return usage_tracker.iter_report(args.since, args.until, args.format)
+            rollups = usage_tracker.rollups()
+            lines = [f"{month}: {seconds / 3600:.2f} h" for month, seconds in sorted(rollups['months'].items())]
+            lines += [f"{instance_id}: {seconds / 3600:.2f} h" for instance_id, seconds in rollups['instances'].items()]
+            return lines + [f"Hours this month: {usage_tracker.hours_this_month():.2f}"]
+
+        try:
+            lines = report_lines(_usage_tracker(config, daemon))
+        except (DaemonError, OSError) as e:
+            print(f"Control daemon call failed ({e}); reporting in-process.")
+            lines = report_lines(_usage_tracker(config))
+        out = open(args.output, 'w') if args.output and not args.summary else sys.stdout
+        try:
+            for line in lines:
+                print(line, file=out)
+        finally:
+            if out is not sys.stdout:
+                out.close()
         
+    elif args.command == 'pac':
+        local_client_manager = _local_client_manager(config)
+        if args.watch:
+            rules_watcher = _watch_rules(config, local_client_manager)
+            if rules_watcher is None:
+                print("Nothing to watch; routing.mode must be 'selective' and the rules must compile.")
+                sys.exit(1)
+            print(f"PAC file written to: {_rules_settings(config)[2]}; watching the rules, press Ctrl+C to stop.")
+            try:
+                while True:
+                    time.sleep(3600)
+            except KeyboardInterrupt:
+                rules_watcher.stop()
+            return
+        pac_file = _write_pac(config, local_client_manager)
+        if pac_file is None:
+            print("No PAC file written; check routing.mode and the rules file.")
+            sys.exit(1)
+        print(f"PAC file written to: {pac_file}")
+
+    elif args.command == 'pool':
+        from src.server_pool import ServerPool
+        if not (config.get('pool') or {}).get('members'):
+            print("No pool members configured; add them under pool.members.")
+            sys.exit(1)
+        pool = ServerPool.from_config(config, on_event=print)
+        best = pool.evaluate()
+        for name, result in pool.ranking():
+            if result['healthy']:
+                throughput = f", {result['throughput'] / 125000:.1f} Mbit/s" if result['throughput'] else ""
+                print(f"{name}: {result['address']} {result['rtt'] * 1000:.1f} ms{throughput}")
+            else:
+                print(f"{name}: {result['address'] or 'no running instance'} unhealthy")
+        if best is None:
+            print("No healthy pool member.")
+            sys.exit(1)
+        print(f"Fastest healthy member: {best}")
+        if args.connect:
+            from src.client_supervisor import ClientSupervisor
+            from src.server_pool import member_config
+            local_client_manager = _local_client_manager(config)
+
+            def use_member(name):
+                # Members may override the server port, password or cipher; the local port stays.
+                local_client_manager.config = dict(member_config(config, name)['shadowsocks'],
+                                                   local_port=config['shadowsocks']['local_port'])
+
+            def switch(name, address):
+                use_member(name)
+                return supervisor.switch_server(address)
+
+            use_member(best)
+            supervisor = ClientSupervisor(local_client_manager, on_event=print)
+            success, message = supervisor.start(pool.results[best]['address'])
+            if not success:
+                print(f"Client failed to start: {message}")
+                sys.exit(1)
+            pool.current = best
+            signal.signal(signal.SIGTERM, lambda signum, frame: pool.stop())
+            print("Supervising ss-local on the fastest member; press Ctrl+C to stop.")
+            try:
+                print(pool.run(switch, (config.get('pool') or {}).get('reevaluate_seconds', 300))[1])
+            except KeyboardInterrupt:
+                pass
+            print(supervisor.stop()[1])
+
+    elif args.command == 'fleet':
+        from src.fleet import Fleet, format_table
+        try:
+            fleet = Fleet(config, names=args.members.split(',') if args.members else None,
+                          max_workers=args.workers, on_event=print)
+        except KeyError as e:
+            print(e.args[0])
+            sys.exit(1)
+        if not fleet.names:
+            print("No pool members configured; add them under pool.members.")
+            sys.exit(1)
+        started = time.monotonic()
+        rows = fleet.run(args.action)
+        print()
+        print(format_table(rows))
+        print(f"\n{len(rows)} members in {time.monotonic() - started:.1f}s.")
+        if args.api_stats:
+            from src.oci_api import METRICS, format_metrics
+            print()
+            print(format_metrics(METRICS.snapshot()))
+        if not all(row['ok'] for row in rows):
+            sys.exit(1)
+
+    elif args.command == 'daemon':
+        from src.control_daemon import ControlDaemon, socket_path_from_config
+        if args.stop or args.stats:
+            client = _daemon_client(config)
+            if client is None:
+                print("No control daemon is running.")
+                sys.exit(1)
+            if args.stats:
+                from src.oci_api import format_metrics
+                print(format_metrics(client.call('oci.api_metrics')))
+                return
+            client.call('shutdown')
+            print("Control daemon stopped.")
+            return
+        control_daemon = ControlDaemon(config)
+        try:
+            control_daemon.bind()
+        except RuntimeError as e:
+            print(e)
+            sys.exit(1)
+        signal.signal(signal.SIGTERM, lambda signum, frame: control_daemon.shutdown())
+        print(f"Control daemon listening on {control_daemon.socket_path}; press Ctrl+C to stop.")
+        try:
+            control_daemon.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
     else:
         parser.print_help()
 
@@ -0,0 +1,141 @@
+# client_supervisor.py
+#
+# This module keeps the local ss-local client alive. It starts the client,
+# waits until the SOCKS port accepts connections, then watches the process
+# and the port from a background thread. A dead or unresponsive client is
+# restarted with exponential backoff, and the server can be switched
+# without tearing down the local listener first.
+
+import threading
+import time
+
+from src.net_probe import probe_port, wait_for_port
+
+
+class ClientSupervisor:
+    """
+    Supervises the ss-local process managed by a LocalClientManager.
+    """
+
+    def __init__(self, client_manager, ready_timeout=10, check_interval=1, port_check_every=5,
+                 min_backoff=1, max_backoff=30, stable_after=60, on_event=None):
+        """
+        Args:
+            client_manager (LocalClientManager): Owner of the ss-local process.
+            ready_timeout (float): How long to wait for the SOCKS port after a (re)start.
+            check_interval (float): Seconds between liveness checks.
+            port_check_every (int): Probe the SOCKS port on every n-th check.
+            min_backoff (float): First restart delay after a crash.
+            max_backoff (float): Upper bound of the doubling restart delay.
+            stable_after (float): Uptime after which the backoff is reset.
+            on_event (callable): Called with a message for every start, crash and restart.
+        """
+        self.client_manager = client_manager
+        self.local_port = client_manager.config['local_port']
+        self.ready_timeout = ready_timeout
+        self.check_interval = check_interval
+        self.port_check_every = port_check_every
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.stable_after = stable_after
+        self.on_event = on_event or (lambda message: None)
+        self.server_ip = None
+        self.restart_count = 0
+        self._backoff = min_backoff
+        self._started_at = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self, server_ip=None):
+        """
+        Starts the client, waits for its SOCKS port and begins monitoring.
+
+        Returns:
+            tuple: A tuple (bool, str) indicating success and a status message.
+        """
+        self.server_ip = server_ip
+        with self._lock:
+            success, message = self._start_and_wait()
+        if not success:
+            return False, message
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._monitor, name="ss-local-supervisor", daemon=True)
+        self._thread.start()
+        return True, message
+
+    def stop(self):
+        """
+        Stops monitoring and then the client itself.
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            return self.client_manager.stop_client()
+
+    def switch_server(self, server_ip):
+        """
+        Hot-swaps the client to a new server IP.
+        """
+        with self._lock:
+            self.server_ip = server_ip
+            success, message = self.client_manager.switch_server(server_ip)
+            if success:
+                self._started_at = time.monotonic()
+                self.on_event(message)
+            return success, message
+
+    def wait(self):
+        """
+        Blocks until `stop` is called from another thread or a signal handler.
+        """
+        while not self._stop_event.wait(1):
+            pass
+
+    def _start_and_wait(self):
+        success, message = self.client_manager.start_client(self.server_ip)
+        if not success:
+            return False, message
+        try:
+            waited = wait_for_port('127.0.0.1', self.local_port, timeout=self.ready_timeout,
+                                   interval=0.05, connect_timeout=0.5)
+        except TimeoutError as e:
+            self.client_manager.stop_client()
+            return False, str(e)
+        self._started_at = time.monotonic()
+        message = f"{message} SOCKS port {self.local_port} ready after {waited:.2f}s."
+        self.on_event(message)
+        return True, message
+
+    def _healthy(self, check_number):
+        """
+        Returns False when the process died or its port stopped accepting.
+        """
+        status, _ = self.client_manager.get_client_status()
+        if status != "RUNNING":
+            return False
+        if check_number % self.port_check_every == 0:
+            return probe_port('127.0.0.1', self.local_port, timeout=1) is not None
+        return True
+
+    def _monitor(self):
+        check_number = 0
+        while not self._stop_event.wait(self.check_interval):
+            check_number += 1
+            with self._lock:
+                if self._healthy(check_number):
+                    if self._started_at and time.monotonic() - self._started_at >= self.stable_after:
+                        self._backoff = self.min_backoff
+                    continue
+                self.on_event(f"ss-local is not healthy; restarting in {self._backoff:.0f}s.")
+                self.client_manager.stop_client()
+            if self._stop_event.wait(self._backoff):
+                return
+            self._backoff = min(self._backoff * 2, self.max_backoff)
+            with self._lock:
+                self.restart_count += 1
+                success, message = self._start_and_wait()
+                if not success:
+                    self.on_event(f"Restart failed: {message}")
@@ -0,0 +1,51 @@
+# cloud_init.py
+#
+# This module renders the user-data script that makes a freshly launched
+# instance install and start Shadowsocks during its first boot, so no SSH
+# round-trips are needed before the proxy is usable. The script is built
+# from the same idempotent steps the SSH provisioner runs.
+
+import base64
+
+from src.provisioner import shadowsocks_steps
+
+
+def render_user_data(ss_config):
+    """
+    Renders the cloud-init user-data shell script for the `shadowsocks` config.
+
+    Args:
+        ss_config (dict): The `shadowsocks` configuration section.
+
+    Returns:
+        str: A bash script suitable for `LaunchInstanceDetails.metadata['user_data']`.
+    """
+    lines = [
+        "#!/bin/bash",
+        "# Generated by OCI Shadowsocks Manager; runs once on first boot.",
+        "set -eu",
+        "exec >>/var/log/shadowsocks-bootstrap.log 2>&1",
+        "changed=0",
+    ]
+    for step in shadowsocks_steps(ss_config):
+        condition = f"! ( {step.check} )" if step.check else "true"
+        if step.rerun_on_change:
+            condition = f"[ \"$changed\" = 1 ] || {condition}"
+        lines.extend([
+            "",
+            f"# {step.name}",
+            f"if {condition}; then",
+            f"  echo \"applying {step.name}\"",
+            f"  {step.command}",
+            "  changed=1",
+            "fi",
+        ])
+    lines.extend(["", "echo \"shadowsocks bootstrap complete\"", ""])
+    return "\n".join(lines)
+
+
+def encode_user_data(script):
+    """
+    Base64-encodes a user-data script as the instance metadata expects.
+    """
+    return base64.b64encode(script.encode('utf-8')).decode('ascii')
@@ -0,0 +1,303 @@
+# control_daemon.py
+#
+# This module implements an optional local control daemon. It keeps one
+# OCIManager (with its signed SDK clients, pooled HTTP connections and
+# instance state cache) and one UsageTracker alive, and serves them over a
+# Unix socket using newline-delimited JSON-RPC 2.0. While it runs, the
+# `status`, `stop` and `report` commands talk to it instead of building
+# their own clients, and OCI calls from every local tool are serialised
+# through it.
+#
+# The client side only needs the standard library, so a thin-client CLI
+# invocation does not import the OCI SDK at all.
+
+import datetime
+import json
+import os
+import socket
+import socketserver
+import threading
+
+DEFAULT_SOCKET_PATH = "~/.oci-shadowsocks/control.sock"
+
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+SERVER_ERROR = -32000
+
+
+class DaemonError(Exception):
+    """
+    Raised by DaemonClient when the daemon returns a JSON-RPC error.
+    """
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+def socket_path_from_config(config):
+    """
+    Returns the expanded control socket path from the 'daemon' config section.
+    """
+    return os.path.expanduser((config.get('daemon') or {}).get('socket_path', DEFAULT_SOCKET_PATH))
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            response = self.server.daemon.dispatch(line)
+            self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+            self.wfile.flush()
+            if self.server.daemon.stopping.is_set():
+                break
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class ControlDaemon:
+    """
+    Serves a warm OCIManager and UsageTracker over a Unix socket.
+    """
+
+    def __init__(self, config, socket_path=None, oci_manager=None, usage_tracker=None):
+        """
+        Args:
+            config (dict): The full application configuration.
+            socket_path (str): Where to listen; defaults to daemon.socket_path.
+            oci_manager (OCIManager): Optional pre-built manager (used by tests).
+            usage_tracker (UsageTracker): Optional pre-built tracker (used by tests).
+        """
+        if oci_manager is None:
+            from src.oci_manager import OCIManager
+            oci_manager = OCIManager(config)
+        if usage_tracker is None:
+            from src.usage_tracker import UsageTracker
+            usage_tracker = UsageTracker(config.get('monitoring', {}))
+        self.oci_manager = oci_manager
+        self.usage_tracker = usage_tracker
+        self.socket_path = socket_path or socket_path_from_config(config)
+        self.stopping = threading.Event()
+        # One OCI call at a time, whichever local tool asked for it.
+        self._oci_lock = threading.Lock()
+        self._usage_lock = threading.Lock()
+        self._server = None
+        self.methods = {
+            'ping': lambda: 'pong',
+            'shutdown': self.shutdown,
+            'oci.get_instance_status': self._oci(self.oci_manager.get_instance_status),
+            'oci.stop_instance': self._oci(self.oci_manager.stop_instance),
+            'oci.api_metrics': self._api_metrics,
+            'usage.log_stop': self._usage(self.usage_tracker.log_stop),
+            'usage.open_session': self._usage(self.usage_tracker.open_session),
+            'usage.rollups': self._usage(self.usage_tracker.rollups),
+            'usage.hours_this_month': self._usage(self.usage_tracker.hours_this_month),
+            'usage.report': self._usage(self._report),
+        }
+
+    def _oci(self, method):
+        def call(*args, **kwargs):
+            with self._oci_lock:
+                return method(*args, **kwargs)
+        return call
+
+    def _api_metrics(self):
+        from src.oci_api import METRICS
+        return METRICS.snapshot()
+
+    def _usage(self, method):
+        def call(*args, **kwargs):
+            with self._usage_lock:
+                return method(*args, **kwargs)
+        return call
+
+    def _report(self, since=None, until=None, fmt='text'):
+        since = datetime.date.fromisoformat(since) if since else None
+        until = datetime.date.fromisoformat(until) if until else None
+        return list(self.usage_tracker.iter_report(since, until, fmt))
+
+    def dispatch(self, line):
+        """
+        Handles one JSON-RPC request line and returns the response object.
+        """
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            return {'jsonrpc': '2.0', 'id': None, 'error': {'code': PARSE_ERROR, 'message': str(e)}}
+        if not isinstance(request, dict):
+            return {'jsonrpc': '2.0', 'id': None,
+                    'error': {'code': INVALID_REQUEST, 'message': "The request must be a JSON object."}}
+        request_id = request.get('id')
+        method = self.methods.get(request.get('method'))
+        if method is None:
+            return {'jsonrpc': '2.0', 'id': request_id,
+                    'error': {'code': METHOD_NOT_FOUND, 'message': f"Unknown method '{request.get('method')}'."}}
+        params = request.get('params') or {}
+        try:
+            result = method(*params) if isinstance(params, list) else method(**params)
+        except TypeError as e:
+            return {'jsonrpc': '2.0', 'id': request_id, 'error': {'code': INVALID_PARAMS, 'message': str(e)}}
+        except Exception as e:
+            return {'jsonrpc': '2.0', 'id': request_id, 'error': {'code': SERVER_ERROR, 'message': str(e)}}
+        return {'jsonrpc': '2.0', 'id': request_id, 'result': result}
+
+    def bind(self):
+        """
+        Creates the socket (owner-only), replacing a stale one left by a crashed daemon.
+
+        Raises:
+            RuntimeError: If another daemon is already listening on the path.
+        """
+        if DaemonClient.connect(self.socket_path) is not None:
+            raise RuntimeError(f"A control daemon is already listening on {self.socket_path}.")
+        os.makedirs(os.path.dirname(self.socket_path), mode=0o700, exist_ok=True)
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        old_umask = os.umask(0o177)
+        try:
+            self._server = _UnixServer(self.socket_path, _RequestHandler)
+        finally:
+            os.umask(old_umask)
+        self._server.daemon = self
+
+    def serve_forever(self):
+        """
+        Serves requests until `shutdown` is called, then removes the socket.
+        """
+        if self._server is None:
+            self.bind()
+        try:
+            self._server.serve_forever(poll_interval=0.2)
+        finally:
+            self._server.server_close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def shutdown(self):
+        """
+        Stops serving; safe to call from a request handler or a signal handler.
+        """
+        self.stopping.set()
+        if self._server is not None:
+            threading.Thread(target=self._server.shutdown, daemon=True).start()
+        return True
+
+
+class DaemonClient:
+    """
+    A blocking JSON-RPC client for the control daemon.
+    """
+
+    def __init__(self, sock, timeout=30):
+        self._sock = sock
+        self._file = sock.makefile('rb')
+        self._next_id = 0
+        self.timeout = timeout
+
+    @classmethod
+    def connect(cls, socket_path, timeout=30):
+        """
+        Connects to a running daemon.
+
+        Args:
+            socket_path (str): The daemon's socket.
+            timeout (float): Default time limit of each call (see `call_blocking`).
+
+        Returns:
+            DaemonClient: A connected client, or None when no daemon is listening.
+        """
+        if not os.path.exists(socket_path):
+            return None
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        try:
+            sock.connect(socket_path)
+        except OSError:
+            sock.close()
+            return None
+        return cls(sock, timeout)
+
+    def call(self, method, *args, **kwargs):
+        """
+        Calls `method` on the daemon and returns its result.
+
+        Raises:
+            DaemonError: If the daemon reports an error.
+            OSError: If the daemon cannot be reached or does not answer in time;
+                     the client is unusable afterwards.
+        """
+        return self._request(method, args, kwargs, self.timeout)
+
+    def call_blocking(self, method, *args, **kwargs):
+        """
+        Like `call`, without a time limit, for calls that wait on OCI (e.g. a
+        stop waiting for STOPPED); the daemon's own waiter timeout bounds them.
+        """
+        return self._request(method, args, kwargs, None)
+
+    def _request(self, method, args, kwargs, timeout):
+        self._next_id += 1
+        request = {'jsonrpc': '2.0', 'id': self._next_id, 'method': method, 'params': list(args) or kwargs}
+        self._sock.settimeout(timeout)
+        try:
+            self._sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+            line = self._file.readline()
+        except OSError:
+            # A late answer would be read as the reply to the next call.
+            self.close()
+            raise
+        if not line:
+            raise DaemonError(SERVER_ERROR, "The control daemon closed the connection.")
+        response = json.loads(line)
+        if 'error' in response:
+            raise DaemonError(response['error']['code'], response['error']['message'])
+        return response['result']
+
+    def close(self):
+        self._file.close()
+        self._sock.close()
+
+
+class RemoteOCIManager:
+    """
+    The subset of OCIManager used by thin-client commands, backed by the daemon.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def get_instance_status(self):
+        return tuple(self.client.call('oci.get_instance_status'))
+
+    def stop_instance(self):
+        return tuple(self.client.call_blocking('oci.stop_instance'))
+
+
+class RemoteUsageTracker:
+    """
+    The subset of UsageTracker used by thin-client commands, backed by the daemon.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def log_stop(self):
+        return self.client.call('usage.log_stop')
+
+    def open_session(self):
+        return self.client.call('usage.open_session')
+
+    def rollups(self):
+        return self.client.call('usage.rollups')
+
+    def hours_this_month(self):
+        return self.client.call('usage.hours_this_month')
+
+    def iter_report(self, since=None, until=None, fmt='text'):
+        return iter(self.client.call('usage.report', since=since.isoformat() if since else None,
+                                     until=until.isoformat() if until else None, fmt=fmt))
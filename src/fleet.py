@@ -0,0 +1,146 @@
+# fleet.py
+#
+# This module runs `start`, `stop` and `status` across every proxy listed
+# under `pool.members` at once. Each member may use its own tenancy, region,
+# shape and Shadowsocks settings (see server_pool.member_config). Members
+# are handled by a bounded thread pool, and a per-region semaphore caps how
+# many of them work against the same regional API endpoint at a time, so a
+# fleet of ten proxies takes about as long as its slowest member instead of
+# the sum of all of them.
+#
+# Results come back as one row per member and are printed as a single table.
+
+import concurrent.futures
+import os
+import threading
+import time
+
+from src.server_pool import member_config, member_names
+
+ACTIONS = ('start', 'stop', 'status')
+
+
+class Fleet:
+    """
+    Fans an action out across the pool members with bounded concurrency.
+    """
+
+    def __init__(self, config, names=None, max_workers=None, per_region_limit=None, manager_factory=None,
+                 client_factory=None, on_event=None, clock=time.monotonic):
+        """
+        Args:
+            config (dict): The full application configuration.
+            names (list): Members to act on; defaults to all of pool.members.
+            max_workers (int): Members handled at once; defaults to fleet.max_workers.
+            per_region_limit (int): Members handled at once per region; defaults to fleet.per_region_limit.
+            manager_factory (callable): Builds an OCIManager from a member config (injectable for tests).
+            client_factory (callable): Builds a LocalClientManager from a member config and name.
+            on_event (callable): Called with a message as each member finishes.
+            clock (callable): Monotonic time source, injectable for tests.
+
+        Raises:
+            KeyError: If a requested member does not exist.
+        """
+        fleet_config = config.get('fleet') or {}
+        self.config = config
+        self.names = list(names) if names else member_names(config)
+        self.member_configs = {name: member_config(config, name) for name in self.names}
+        self.max_workers = max_workers or fleet_config.get('max_workers', 8)
+        self.per_region_limit = per_region_limit or fleet_config.get('per_region_limit', 4)
+        self.manager_factory = manager_factory or self._oci_manager
+        self.client_factory = client_factory or _local_client_manager
+        self.on_event = on_event or (lambda message: None)
+        self.clock = clock
+        self._region_slots = {}
+        self._slots_lock = threading.Lock()
+        self._state_store = None
+
+    def region(self, name):
+        return self.member_configs[name]['oci'].get('region', '')
+
+    def _slot(self, region):
+        with self._slots_lock:
+            if region not in self._region_slots:
+                self._region_slots[region] = threading.BoundedSemaphore(self.per_region_limit)
+            return self._region_slots[region]
+
+    def run(self, action):
+        """
+        Runs `action` on every member concurrently.
+
+        Args:
+            action (str): One of ACTIONS.
+
+        Returns:
+            list: One dict per member, in config order, with 'name', 'region', 'ok',
+                  'status', 'message' and 'seconds'.
+        """
+        if action not in ACTIONS:
+            raise ValueError(f"Unknown fleet action '{action}'.")
+        if not self.names:
+            return []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(self.max_workers, len(self.names))) as executor:
+            futures = [executor.submit(self._run_one, action, name) for name in self.names]
+            return [future.result() for future in futures]
+
+    def _run_one(self, action, name):
+        region = self.region(name)
+        with self._slot(region):
+            started = self.clock()
+            try:
+                ok, status, message = getattr(self, f"_{action}")(name)
+            except Exception as e:
+                ok, status, message = False, "ERROR", str(e)
+            row = {'name': name, 'region': region, 'ok': ok, 'status': status, 'message': message,
+                   'seconds': self.clock() - started}
+        self.on_event(f"{name}: {status} ({row['seconds']:.1f}s)")
+        return row
+
+    def _oci_manager(self, member):
+        from src.instance_state import InstanceStateStore
+        from src.oci_manager import OCIManager
+        with self._slots_lock:
+            if self._state_store is None:
+                # Shared, so concurrent members do not overwrite each other's records.
+                self._state_store = InstanceStateStore(ttl_seconds=member['compute'].get('state_ttl_seconds', 60))
+        return OCIManager(member, state_store=self._state_store)
+
+    def _status(self, name):
+        status, message = self.manager_factory(self.member_configs[name]).get_instance_status()
+        return status != "ERROR", status, message
+
+    def _stop(self, name):
+        ok, message = self.manager_factory(self.member_configs[name]).stop_instance()
+        return ok, "STOPPED" if ok else "ERROR", message
+
+    def _start(self, name):
+        from src.start_pipeline import StartPipeline
+        member = self.member_configs[name]
+        pipeline = StartPipeline(self.manager_factory(member), self.client_factory(member, name),
+                                 member['shadowsocks']['server_port'],
+                                 member['compute'].get('readiness_timeout', 300))
+        result = pipeline.run()
+        return True, "RUNNING", f"{result['server_ip']} {result['ss_url']}"
+
+
+def _local_client_manager(member, name):
+    from src.local_client_manager import LocalClientManager
+    manager = LocalClientManager(member.get('shadowsocks', {}))
+    # Members start concurrently, so each gets its own client artifacts.
+    os.makedirs("fleet", exist_ok=True)
+    manager.client_config_path = os.path.join("fleet", f"ss-local-{name}.json")
+    manager.qr_filename = os.path.join("fleet", f"qrcode-{name}.png")
+    return manager
+
+
+def format_table(rows):
+    """
+    Formats fleet results as an aligned table.
+    """
+    header = ('MEMBER', 'REGION', 'STATUS', 'TIME', 'DETAILS')
+    lines = [(row['name'], row['region'], row['status'], f"{row['seconds']:.1f}s", row['message']) for row in rows]
+    widths = [max(len(line[i]) for line in [header] + lines) for i in range(len(header) - 1)]
+    return "\n".join(
+        "  ".join(cell.ljust(width) for cell, width in zip(line[:-1], widths)) + "  " + line[-1]
+        for line in [header] + lines
+    )
@@ -0,0 +1,101 @@
+# idle_watcher.py
+#
+# This module implements `compute.auto_shutdown_minutes`. It watches proxy
+# activity (open connections and byte counters from the traffic meter) and,
+# once nothing has happened for the configured window, stops the OCI
+# instance and closes the usage session.
+#
+# Checks run on a fixed schedule anchored to the start time (tick n fires at
+# start + n * interval), so slow checks never make the timer drift, and the
+# loop waits on an Event so `stop` ends it immediately.
+
+import threading
+import time
+
+
+class IdleWatcher:
+    """
+    Stops the instance after a period without proxy activity.
+    """
+
+    def __init__(self, oci_manager, usage_tracker, activity_source, idle_minutes=30, check_interval=30,
+                 on_event=None, on_stopped=None, clock=time.monotonic, wait=None):
+        """
+        Args:
+            oci_manager (OCIManager): Used to stop the instance.
+            usage_tracker (UsageTracker): Its open session is closed on shutdown.
+            activity_source (callable): Returns a dict with 'active_connections',
+                                        'bytes_in' and 'bytes_out' (e.g. TrafficMeter.snapshot).
+            idle_minutes (float): Idle window before shutdown.
+            check_interval (float): Seconds between activity checks.
+            on_event (callable): Called with a message on activity changes and shutdown.
+            on_stopped (callable): Called after the instance stopped and before the
+                                   session is closed, e.g. to flush metered traffic.
+            clock (callable): Monotonic time source, injectable for tests.
+            wait (callable): Waits up to the given seconds and returns True when
+                             stopped; defaults to the stop event, injectable for tests.
+        """
+        self.oci_manager = oci_manager
+        self.usage_tracker = usage_tracker
+        self.activity_source = activity_source
+        self.idle_seconds = idle_minutes * 60
+        self.check_interval = check_interval
+        self.on_event = on_event or (lambda message: None)
+        self.on_stopped = on_stopped or (lambda: None)
+        self.clock = clock
+        self._stop_event = threading.Event()
+        self._wait = wait or self._stop_event.wait
+        self._last_bytes = None
+        self.last_activity = None
+
+    def stop(self):
+        """
+        Ends `run` at the next wait, without stopping the instance.
+        """
+        self._stop_event.set()
+
+    def check(self):
+        """
+        Samples activity once.
+
+        Returns:
+            float: Seconds the proxy has been idle.
+        """
+        now = self.clock()
+        snapshot = self.activity_source()
+        total_bytes = snapshot['bytes_in'] + snapshot['bytes_out']
+        if snapshot['active_connections'] or total_bytes != self._last_bytes:
+            if self.last_activity is not None and now - self.last_activity >= self.check_interval * 2:
+                self.on_event("Proxy activity resumed.")
+            self.last_activity = now
+        self._last_bytes = total_bytes
+        return now - self.last_activity
+
+    def run(self):
+        """
+        Checks activity until the idle window elapses or `stop` is called.
+
+        Returns:
+            tuple: A tuple (bool, str); True if the instance was stopped for being idle.
+        """
+        started = self.clock()
+        self.last_activity = started
+        self._last_bytes = None
+        tick = 0
+        while True:
+            idle = self.check()
+            if idle >= self.idle_seconds:
+                return self._shutdown(idle)
+            tick += 1
+            delay = max(started + tick * self.check_interval - self.clock(), 0)
+            if self._stop_event.is_set() or self._wait(delay):
+                return False, "Idle watch stopped."
+
+    def _shutdown(self, idle):
+        self.on_event(f"No proxy activity for {idle / 60:.0f} minutes; stopping the instance.")
+        success, message = self.oci_manager.stop_instance()
+        if not success:
+            return False, f"Auto-shutdown failed: {message}"
+        self.on_stopped()
+        self.usage_tracker.log_stop()
+        return True, f"Instance stopped after {idle / 60:.0f} idle minutes. {message}"
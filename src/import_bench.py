@@ -0,0 +1,198 @@
+# import_bench.py
+#
+# This module measures the start-up cost of every CLI subcommand. For each
+# command it starts a fresh interpreter with `-X importtime` and runs
+# main.main() with a representative command line, so whatever the real lazy
+# dispatch imports is what gets measured. It reports the wall time, the time
+# spent importing, and which of the heavy third-party packages were loaded.
+#
+# Commands run in a scratch directory holding a copy of the configuration
+# in which credentials, resolvers and sockets point nowhere, so they fail
+# fast instead of reaching OCI or the internet. Long-running commands
+# (client, daemon, ...) are stopped after a timeout; their imports are done
+# by then, but their wall time only shows the timeout. A command that
+# crashes or exits non-zero is reported as failed rather than timed, since
+# it may have stopped before importing what it normally needs.
+#
+# Usage: python -m src.import_bench [--repeat N] [--json] [command ...]
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import yaml
+
+HEAVY_PACKAGES = ('oci', 'paramiko', 'qrcode', 'requests', 'cryptography')
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# A local port nothing listens on.
+CLOSED_URL = "http://127.0.0.1:9/"
+
+# One representative invocation per subcommand.
+COMMANDS = {
+    'start': ['start'],
+    'stop': ['--no-daemon', 'stop'],
+    'status': ['--no-daemon', 'status'],
+    'export-android': ['export-android', '--server-ip', '203.0.113.1'],
+    'export-profiles': ['export-profiles', '--server-ip', '203.0.113.1', '--format', 'svg'],
+    'test-connection': ['test-connection', CLOSED_URL],
+    'bench': ['bench', '--url', CLOSED_URL, '--proxy', '127.0.0.1:9', '--streams', '1', '--requests', '1'],
+    'client': ['client'],
+    'watch': ['watch'],
+    'report': ['report'],
+    'pac': ['pac'],
+    'pool': ['pool'],
+    'fleet': ['fleet', 'status'],
+    'daemon': ['daemon'],
+}
+
+_RUNNER = """
+import sys
+sys.path.insert(0, {root!r})
+sys.argv = ['main.py'] + {argv!r}
+import main
+main.main()
+"""
+
+
+def prepare_workdir(workdir):
+    """
+    Writes a stubbed copy of config/ into `workdir` for the commands to run against.
+    """
+    os.makedirs(os.path.join(workdir, 'config'), exist_ok=True)
+    source = os.path.join(REPO_ROOT, 'config')
+    for name in os.listdir(source):
+        if name != 'config.yaml' and os.path.isfile(os.path.join(source, name)):
+            shutil.copy(os.path.join(source, name), os.path.join(workdir, 'config', name))
+    with open(os.path.join(source, 'config.yaml'), 'r') as f:
+        config = yaml.safe_load(f)
+    config['oci']['key_file'] = os.path.join(workdir, 'missing_key.pem')
+    config.setdefault('public_ip', {}).update({'resolvers_v4': [CLOSED_URL], 'resolvers_v6': [CLOSED_URL], 'timeout': 1})
+    config.setdefault('daemon', {})['socket_path'] = os.path.join(workdir, 'control.sock')
+    config.setdefault('pool', {})['members'] = [{'name': 'bench'}]
+    config.setdefault('monitoring', {})['meter_port'] = 9
+    with open(os.path.join(workdir, 'config', 'config.yaml'), 'w') as f:
+        yaml.safe_dump(config, f)
+
+
+def run_command(argv, workdir, timeout=15, importtime=False):
+    """
+    Runs main.main() with `argv` in a fresh interpreter inside `workdir`.
+
+    Returns:
+        tuple: (stdout, stderr, returncode). The return code is None for a
+               command stopped at the timeout; its output is what it wrote until then.
+    """
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + [
+        '-c', _RUNNER.format(root=REPO_ROOT, argv=list(argv))]
+    try:
+        result = subprocess.run(command, cwd=workdir, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired as e:
+        return _text(e.stdout), _text(e.stderr), None
+    return result.stdout, result.stderr, result.returncode
+
+
+def _text(output):
+    if isinstance(output, bytes):
+        return output.decode('utf-8', 'replace')
+    return output or ''
+
+
+def parse_importtime(stderr):
+    """
+    Parses `-X importtime` output.
+
+    Returns:
+        tuple: (total cumulative microseconds of top-level imports, set of imported module names).
+    """
+    total_us = 0
+    modules = set()
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, _, fields = line.partition(':')
+        _, cumulative, name = fields.split('|', 2)
+        modules.add(name.strip())
+        if not name[1:].startswith(' '):
+            total_us += int(cumulative)
+    return total_us, modules
+
+
+def measure_command(command, repeat=3, timeout=15):
+    """
+    Measures one subcommand in fresh interpreters.
+
+    Returns:
+        dict: 'status' ('ok', 'running' if it was still running at the timeout,
+              or 'failed'), 'wall_ms' and 'import_ms' (medians; None when failed),
+              the 'heavy' packages loaded and, when failed, the 'error' it reported.
+    """
+    walls, imports = [], []
+    modules = set()
+    status, error = 'ok', None
+    workdir = tempfile.mkdtemp(prefix='import_bench-')
+    try:
+        prepare_workdir(workdir)
+        for _ in range(repeat):
+            started = time.perf_counter()
+            stdout, stderr, returncode = run_command(COMMANDS.get(command, [command]), workdir, timeout,
+                                                     importtime=True)
+            walls.append((time.perf_counter() - started) * 1000)
+            import_us, modules = parse_importtime(stderr)
+            imports.append(import_us / 1000)
+            if returncode is None:
+                status = 'running'
+            elif returncode != 0:
+                status, error = 'failed', _last_error(stdout, stderr)
+                break
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    failed = status == 'failed'
+    return {
+        'command': command,
+        'status': status,
+        'wall_ms': None if failed else round(statistics.median(walls), 1),
+        'import_ms': None if failed else round(statistics.median(imports), 1),
+        'heavy': sorted(p for p in HEAVY_PACKAGES if p in modules),
+        'error': error,
+    }
+
+
+def _last_error(stdout, stderr):
+    """
+    Returns the last line a failed command wrote, ignoring `-X importtime` output.
+    """
+    lines = [line for line in (stderr + stdout).splitlines()
+             if line.strip() and not line.startswith('import time:')]
+    return lines[-1].strip() if lines else "exited with a non-zero status"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the import cost of each CLI subcommand")
+    parser.add_argument('commands', nargs='*', help='Commands to measure (default: all)')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per command; the median is reported')
+    parser.add_argument('--timeout', type=float, default=15, help='Stop long-running commands after this many seconds')
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    args = parser.parse_args(argv)
+
+    results = [measure_command(command, args.repeat, args.timeout) for command in args.commands or COMMANDS]
+    if args.json:
+        print(json.dumps(results, indent=4))
+        return
+    print(f"{'command':<16} {'wall ms':>9} {'import ms':>10}  heavy packages")
+    for result in results:
+        if result['status'] == 'failed':
+            print(f"{result['command']:<16} {'failed':>9} {'-':>10}  {result['error']}")
+            continue
+        wall = 'running' if result['status'] == 'running' else f"{result['wall_ms']:.1f}"
+        print(f"{result['command']:<16} {wall:>9} {result['import_ms']:>10.1f}  "
+              f"{', '.join(result['heavy']) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
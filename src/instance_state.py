@@ -0,0 +1,125 @@
+# instance_state.py
+#
+# This module persists what the manager knows about its instances between
+# CLI invocations: the OCID, public IP and lifecycle state of the instance
+# carrying each project tag, plus when that was last verified against OCI.
+# Records younger than the TTL are trusted as-is; older ones are revalidated
+# with a single `get_instance` call instead of a compartment-wide listing.
+
+import json
+import os
+import threading
+import time
+
+# Freeform tag value identifying the proxy instance; also the key of its record.
+PROJECT_TAG = 'shadowsocks-proxy'
+
+
+def project_tag(config):
+    """
+    Returns the project tag configured in compute.project_tag (pool members get their own).
+    """
+    return (config.get('compute') or {}).get('project_tag', PROJECT_TAG)
+
+
+class InstanceStateStore:
+    """
+    A small JSON-backed store of instance records keyed by project tag.
+    """
+
+    def __init__(self, path="instance_state.json", ttl_seconds=60, clock=time.time):
+        """
+        Initializes the store.
+
+        Args:
+            path (str): The JSON file holding the records.
+            ttl_seconds (float): How long a verified record is trusted without revalidation.
+            clock (callable): Wall-clock time source, injectable for tests.
+        """
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._records = None
+        self._signature = None
+        # One store may be shared by the managers of a whole fleet.
+        self._lock = threading.RLock()
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _load(self):
+        """
+        Returns the records, re-reading the file whenever another process has
+        changed it (e.g. a `start` while the control daemon runs); a missing or
+        corrupt file yields no records.
+        """
+        with self._lock:
+            signature = self._file_signature()
+            if self._records is None or signature != self._signature:
+                try:
+                    with open(self.path, 'r') as f:
+                        self._records = json.load(f)
+                except (FileNotFoundError, ValueError):
+                    self._records = {}
+                self._signature = signature
+            return self._records
+
+    def _save(self):
+        """
+        Writes the records atomically so a crash never leaves a partial file.
+        """
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self._records, f, indent=4)
+        os.replace(tmp_path, self.path)
+        self._signature = self._file_signature()
+
+    def get(self, key):
+        """
+        Returns a copy of the record stored under `key`, or None.
+        """
+        with self._lock:
+            record = self._load().get(key)
+            return dict(record) if record else None
+
+    def is_fresh(self, record):
+        """
+        Returns True if the record was verified within the TTL.
+        """
+        return record is not None and self.clock() - record.get('last_verified', 0) < self.ttl_seconds
+
+    def put(self, key, verified=True, **fields):
+        """
+        Merges `fields` into the record under `key` and marks it verified now.
+
+        Args:
+            verified (bool): False keeps the record's verification time, for fields
+                             learned without re-reading the instance's lifecycle state.
+
+        Returns:
+            dict: A copy of the updated record.
+        """
+        with self._lock:
+            records = self._load()
+            record = records.get(key) or {}
+            if fields.get('instance_id') and fields['instance_id'] != record.get('instance_id'):
+                record = {}
+            record.update(fields)
+            if verified or 'last_verified' not in record:
+                record['last_verified'] = self.clock()
+            records[key] = record
+            self._save()
+            return dict(record)
+
+    def remove(self, key):
+        """
+        Forgets the record under `key`, if any.
+        """
+        with self._lock:
+            records = self._load()
+            if records.pop(key, None) is not None:
+                self._save()
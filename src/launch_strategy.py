@@ -0,0 +1,293 @@
+# launch_strategy.py
+#
+# This module launches the proxy instance when the configured availability
+# domain or shape has no capacity, which is common for Always-Free shapes
+# such as VM.Standard.A1.Flex. The primary compute settings and any
+# `compute.launch_candidates` form an ordered list of candidates (AD,
+# shape, OCPUs/memory, image, subnet). Candidates are tried one after another, or up
+# to `compute.launch_parallel` at a time; the first instance to reach RUNNING
+# wins and the others are cancelled and terminated.
+#
+# "Out of host capacity" answers are remembered per AD and shape in a small
+# JSON file, so the next launch skips candidates that failed recently
+# instead of asking OCI again. Each launch reports its time to RUNNING.
+
+import asyncio
+import json
+import os
+import threading
+import time
+
+import oci
+
+from src.lifecycle_waiter import LifecycleWaitError
+from src.oci_api import is_capacity_error
+
+CANDIDATE_KEYS = ('availability_domain', 'instance_shape', 'ocpus', 'memory_in_gbs', 'image_id', 'subnet_id')
+# States OCI leaves an instance in when it gives up on it, e.g. for lack of capacity.
+TERMINATED_STATES = ('TERMINATING', 'TERMINATED')
+
+
+class LaunchError(Exception):
+    """
+    Raised when no candidate produced a running instance.
+    """
+
+    def __init__(self, message, attempts):
+        super().__init__(message)
+        self.attempts = attempts
+
+
+def candidates_from_config(compute_config):
+    """
+    Returns the launch candidates: the primary compute settings first, then
+    each entry of compute.launch_candidates merged over them, without duplicates.
+    """
+    primary = {key: compute_config[key] for key in CANDIDATE_KEYS if key in compute_config}
+    candidates = []
+    for override in [{}] + list(compute_config.get('launch_candidates') or []):
+        candidate = dict(primary, **{key: value for key, value in override.items() if key in CANDIDATE_KEYS})
+        if candidate not in candidates:
+            candidates.append(candidate)
+    return candidates
+
+
+def candidate_label(candidate):
+    """
+    Returns a short "AD/shape" label, with the size for flexible shapes.
+    """
+    label = f"{candidate.get('availability_domain')}/{candidate.get('instance_shape')}"
+    if str(candidate.get('instance_shape', '')).endswith('.Flex'):
+        label += f" ({candidate.get('ocpus', 1)} OCPU, {candidate.get('memory_in_gbs', 6)} GB)"
+    return label
+
+
+class CapacityCache:
+    """
+    Remembers recent capacity failures per availability domain and shape.
+    """
+
+    def __init__(self, path="capacity_cache.json", ttl_seconds=1800, clock=time.time):
+        """
+        Args:
+            path (str): The JSON file holding the failures.
+            ttl_seconds (float): How long a failure keeps its AD and shape skipped.
+            clock (callable): Wall-clock time source, injectable for tests.
+        """
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(candidate):
+        return f"{candidate.get('availability_domain')}/{candidate.get('instance_shape')}"
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save(self, failures):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(failures, f, indent=4)
+        os.replace(tmp_path, self.path)
+
+    def failed_at(self, candidate):
+        """
+        Returns when the candidate's AD and shape last ran out of capacity, if within the TTL.
+        """
+        with self._lock:
+            failure = self._load().get(self.key(candidate))
+        if failure and self.clock() - failure['failed_at'] < self.ttl_seconds:
+            return failure['failed_at']
+        return None
+
+    def record_failure(self, candidate, message=""):
+        with self._lock:
+            failures = self._load()
+            now = self.clock()
+            failures = {key: value for key, value in failures.items()
+                        if now - value['failed_at'] < self.ttl_seconds}
+            failures[self.key(candidate)] = {'failed_at': now, 'message': message}
+            self._save(failures)
+
+    def clear(self, candidate):
+        with self._lock:
+            failures = self._load()
+            if failures.pop(self.key(candidate), None) is not None:
+                self._save(failures)
+
+
+class LaunchStrategy:
+    """
+    Launches the first candidate that gets capacity, optionally racing several.
+    """
+
+    def __init__(self, oci_manager, candidates, capacity_cache=None, parallel=1, timeout=600,
+                 on_event=None, clock=time.monotonic):
+        """
+        Args:
+            oci_manager (OCIManager): Manager used to launch, wait for and terminate instances.
+            candidates (list): Candidate dicts in order of preference (see candidates_from_config).
+            capacity_cache (CapacityCache): Recent capacity failures; None disables skipping.
+            parallel (int): Candidates in flight at once; 1 tries them in succession.
+            timeout (float): Seconds each launched instance may take to reach RUNNING.
+            on_event (callable): Called with a progress message per attempt.
+            clock (callable): Monotonic time source, injectable for tests.
+        """
+        self.oci_manager = oci_manager
+        self.candidates = list(candidates)
+        self.capacity_cache = capacity_cache
+        self.parallel = max(1, parallel)
+        self.timeout = timeout
+        self.on_event = on_event or (lambda message: None)
+        self.clock = clock
+
+    @classmethod
+    def from_config(cls, oci_manager, compute_config, **kwargs):
+        """
+        Builds the strategy from the compute section (launch_candidates,
+        launch_parallel and capacity_retry_minutes).
+        """
+        kwargs.setdefault('capacity_cache', CapacityCache(
+            ttl_seconds=compute_config.get('capacity_retry_minutes', 30) * 60))
+        kwargs.setdefault('parallel', compute_config.get('launch_parallel', 1))
+        return cls(oci_manager, candidates_from_config(compute_config), **kwargs)
+
+    def ordered_candidates(self):
+        """
+        Returns the candidates to try: those without a recent capacity failure,
+        in order. If every candidate failed recently, all of them are tried,
+        least recently failed first.
+        """
+        if self.capacity_cache is None:
+            return list(self.candidates)
+        failed = {id(c): self.capacity_cache.failed_at(c) for c in self.candidates}
+        available = [c for c in self.candidates if failed[id(c)] is None]
+        if not available:
+            return sorted(self.candidates, key=lambda c: failed[id(c)])
+        for candidate in self.candidates:
+            if failed[id(candidate)] is not None:
+                self.on_event(f"Skipping {candidate_label(candidate)}: out of capacity recently.")
+        return available
+
+    def launch(self, ssh_public_key):
+        """
+        Synchronous wrapper around `launch_async`.
+        """
+        return asyncio.run(self.launch_async(ssh_public_key))
+
+    async def launch_async(self, ssh_public_key):
+        """
+        Launches candidates until one instance is RUNNING.
+
+        Returns:
+            dict: 'instance' (RUNNING), 'candidate', 'time_to_running' in seconds
+                  and 'attempts', a list of (label, outcome, seconds).
+
+        Raises:
+            LaunchError: If every candidate failed.
+        """
+        started = self.clock()
+        pending = self.ordered_candidates()
+        attempts = []
+        running = {}
+        winner = None
+        try:
+            while (pending or running) and winner is None:
+                while pending and len(running) < self.parallel:
+                    candidate = pending.pop(0)
+                    running[asyncio.ensure_future(self._attempt(candidate, ssh_public_key, attempts))] = candidate
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    candidate = running.pop(task)
+                    instance = task.result()
+                    if instance is not None and winner is None:
+                        winner = (instance, candidate)
+                    elif instance is not None:
+                        # Two candidates came up together; keep only the first.
+                        await self._terminate(instance.id)
+        finally:
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+
+        if winner is None:
+            details = "; ".join(f"{label}: {outcome}" for label, outcome, _ in attempts)
+            raise LaunchError(f"No launch candidate produced a running instance ({details}).", attempts)
+        instance, candidate = winner
+        self.oci_manager._remember(instance)
+        time_to_running = self.clock() - started
+        self.on_event(f"{candidate_label(candidate)} is RUNNING after {time_to_running:.0f}s.")
+        return {'instance': instance, 'candidate': candidate, 'time_to_running': time_to_running,
+                'attempts': attempts}
+
+    async def _attempt(self, candidate, ssh_public_key, attempts):
+        """
+        Launches one candidate and waits for it to run.
+
+        Returns:
+            The RUNNING instance, or None if the candidate failed.
+        """
+        label = candidate_label(candidate)
+        started = self.clock()
+        self.on_event(f"Launching {label}...")
+        launch = asyncio.ensure_future(asyncio.to_thread(self.oci_manager.launch_instance, ssh_public_key, candidate))
+        try:
+            instance = await asyncio.shield(launch)
+        except asyncio.CancelledError:
+            # A sent launch request cannot be recalled; remove what it created.
+            try:
+                instance = await launch
+            except Exception:
+                raise asyncio.CancelledError()
+            await self._terminate(instance.id)
+            attempts.append((label, "cancelled", self.clock() - started))
+            raise
+        except Exception as e:
+            outcome = self._failed(candidate, e)
+            attempts.append((label, outcome, self.clock() - started))
+            self.on_event(f"{label}: {outcome}")
+            return None
+
+        try:
+            instance = await self.oci_manager.waiter.wait_async(instance.id, 'RUNNING', timeout=self.timeout)
+        except asyncio.CancelledError:
+            await self._terminate(instance.id)
+            attempts.append((label, "cancelled", self.clock() - started))
+            raise
+        except LifecycleWaitError as e:
+            # Capacity can also run out after the launch was accepted, in which
+            # case OCI terminates the instance itself; any other failure (e.g. a
+            # timeout) leaves an instance to clean up and says nothing about capacity.
+            terminated = e.lifecycle_state in TERMINATED_STATES
+            if not terminated:
+                await self._terminate(instance.id)
+            outcome = self._failed(candidate, e, capacity=terminated)
+            attempts.append((label, outcome, self.clock() - started))
+            self.on_event(f"{label}: {outcome}")
+            return None
+        attempts.append((label, "RUNNING", self.clock() - started))
+        if self.capacity_cache is not None:
+            self.capacity_cache.clear(candidate)
+        return instance
+
+    async def _terminate(self, instance_id):
+        """
+        Terminates a losing or failed launch; a failure is reported, not raised,
+        so it never stops the remaining candidates.
+        """
+        try:
+            await asyncio.to_thread(self.oci_manager.terminate_instance, instance_id)
+        except oci.exceptions.ServiceError as e:
+            self.on_event(f"Could not terminate {instance_id}: {e.message}")
+
+    def _failed(self, candidate, error, capacity=False):
+        message = getattr(error, 'message', None) or str(error)
+        if (capacity or is_capacity_error(error)) and self.capacity_cache is not None:
+            self.capacity_cache.record_failure(candidate, message)
+        return message
@@ -0,0 +1,189 @@
+# lifecycle_waiter.py
+#
+# This module waits for OCI compute instances to reach a lifecycle state.
+# Polling adapts to where the wait is relative to the expected transition
+# window: it sleeps through the period before a state change is plausible,
+# polls quickly while it is likely, and backs off once the wait runs long.
+# Waits support deadlines and cancellation, and many instances can be
+# awaited concurrently from a single event loop.
+
+import asyncio
+import threading
+import time
+
+
+class LifecycleWaitError(Exception):
+    """
+    Raised when an instance reaches a state from which the target is unreachable.
+    """
+
+    def __init__(self, message, lifecycle_state=None):
+        super().__init__(message)
+        # The state the instance ended in, when known.
+        self.lifecycle_state = lifecycle_state
+
+
+class LifecycleWaitTimeout(LifecycleWaitError):
+    """
+    Raised when the deadline passes before the target state is reached.
+    """
+
+
+class LifecycleWaitCancelled(LifecycleWaitError):
+    """
+    Raised when a wait is cancelled through its cancel event.
+    """
+
+
+class LifecycleWaiter:
+    """
+    Polls `get_instance` with adaptive intervals until a target state is reached.
+    """
+
+    # Seconds after the request in which each state is typically reached.
+    TRANSITION_WINDOWS = {
+        'RUNNING': (15, 120),
+        'STOPPED': (10, 120),
+        'TERMINATED': (20, 180),
+    }
+
+    # States the instance can never leave towards the given target.
+    DEAD_ENDS = {
+        'RUNNING': {'TERMINATING', 'TERMINATED'},
+        'STOPPED': {'TERMINATING', 'TERMINATED'},
+        'TERMINATED': set(),
+    }
+
+    def __init__(self, compute_client, fast_interval=2, slow_interval=10, max_interval=30,
+                 clock=time.monotonic):
+        """
+        Initializes the waiter.
+
+        Args:
+            compute_client: The OCI compute client used for `get_instance`.
+            fast_interval (float): Poll interval inside the transition window.
+            slow_interval (float): Poll interval outside the window.
+            max_interval (float): Upper bound for the backoff after the window.
+            clock (callable): Monotonic clock, injectable for tests.
+        """
+        self.compute_client = compute_client
+        self.fast_interval = fast_interval
+        self.slow_interval = slow_interval
+        self.max_interval = max_interval
+        self.clock = clock
+        self.poll_count = 0
+
+    def poll_interval(self, target_state, elapsed):
+        """
+        Returns how long to sleep before the next poll.
+
+        Args:
+            target_state (str): The state being waited for.
+            elapsed (float): Seconds since the wait began.
+        """
+        window_start, window_end = self.TRANSITION_WINDOWS.get(target_state, (0, float('inf')))
+        if elapsed < window_start:
+            # Land the next poll on the start of the window rather than past it.
+            return max(min(self.slow_interval, window_start - elapsed), self.fast_interval)
+        if elapsed <= window_end:
+            return self.fast_interval
+        overdue = (elapsed - window_end) / self.slow_interval
+        return min(self.slow_interval * (1.5 ** overdue), self.max_interval)
+
+    def _check(self, instance_id, target_states):
+        """
+        Polls the instance once and returns it if it is in a target state.
+        """
+        self.poll_count += 1
+        instance = self.compute_client.get_instance(instance_id).data
+        if instance.lifecycle_state in target_states:
+            return instance
+        for target_state in target_states:
+            if instance.lifecycle_state not in self.DEAD_ENDS.get(target_state, set()):
+                return None
+        raise LifecycleWaitError(
+            f"Instance {instance_id} is {instance.lifecycle_state}; "
+            f"it can no longer reach {'/'.join(target_states)}.",
+            instance.lifecycle_state
+        )
+
+    def _next_sleep(self, instance_id, target_states, started, deadline):
+        """
+        Returns the next sleep, clamped to the deadline, or raises on timeout.
+        """
+        now = self.clock()
+        if now >= deadline:
+            raise LifecycleWaitTimeout(
+                f"Timed out waiting for instance {instance_id} to reach {'/'.join(target_states)}."
+            )
+        interval = min(self.poll_interval(s, now - started) for s in target_states)
+        return min(interval, deadline - now)
+
+    def wait(self, instance_id, target_states, timeout=600, cancel_event=None):
+        """
+        Blocks until the instance reaches one of `target_states`.
+
+        Args:
+            instance_id (str): The instance OCID.
+            target_states (str or iterable): Acceptable lifecycle state(s).
+            timeout (float): Seconds before giving up.
+            cancel_event (threading.Event): Set from another thread to abort the wait.
+
+        Returns:
+            The instance model in its target state.
+        """
+        target_states = _as_states(target_states)
+        cancel_event = cancel_event or threading.Event()
+        started = self.clock()
+        deadline = started + timeout
+        while True:
+            if cancel_event.is_set():
+                raise LifecycleWaitCancelled(f"Wait for instance {instance_id} was cancelled.")
+            instance = self._check(instance_id, target_states)
+            if instance is not None:
+                return instance
+            cancel_event.wait(self._next_sleep(instance_id, target_states, started, deadline))
+
+    async def wait_async(self, instance_id, target_states, timeout=600):
+        """
+        Awaits an instance reaching one of `target_states` without blocking the loop.
+
+        Cancelling the surrounding task cancels the wait.
+        """
+        target_states = _as_states(target_states)
+        started = self.clock()
+        deadline = started + timeout
+        while True:
+            instance = await asyncio.to_thread(self._check, instance_id, target_states)
+            if instance is not None:
+                return instance
+            await asyncio.sleep(self._next_sleep(instance_id, target_states, started, deadline))
+
+    async def wait_many_async(self, targets, timeout=600):
+        """
+        Waits on several instances concurrently.
+
+        Args:
+            targets (dict): Maps instance OCIDs to their target state(s).
+
+        Returns:
+            dict: Maps each OCID to its instance model, or to the exception its wait raised.
+        """
+        instance_ids = list(targets)
+        results = await asyncio.gather(
+            *(self.wait_async(instance_id, targets[instance_id], timeout) for instance_id in instance_ids),
+            return_exceptions=True,
+        )
+        return dict(zip(instance_ids, results))
+
+    def wait_many(self, targets, timeout=600):
+        """
+        Synchronous wrapper around `wait_many_async`.
+        """
+        return asyncio.run(self.wait_many_async(targets, timeout))
+
+
+def _as_states(target_states):
+    if isinstance(target_states, str):
+        return (target_states,)
+    return tuple(target_states)
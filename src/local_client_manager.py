@@ -12,17 +12,10 @@ import subprocess
 import os
 import json
 import yaml
-import base64
 import sys
 
-# Optional external dependencies, assumed to be installed (e.g., via pip)
-try:
-    import qrcode
-    import requests
-except ImportError:
-    print("Warning: Missing dependencies. `qrcode` and `requests` are required for full functionality.")
-    # Exit if we can't import the libraries.
-    sys.exit(1)
+# `qrcode` and `requests` are imported by the methods that need them, so
+# starting or stopping ss-local neither pays for them nor requires them.
 
 
 class LocalClientManager:
@@ -30,18 +23,26 @@ class LocalClientManager:
     Manages the local Shadowsocks client, handling its lifecycle and configuration.
     """
 
-    def __init__(self, config):
+    def __init__(self, config, meter_port=None):
         """
         Initializes the manager with client configuration.
 
         Args:
             config (dict): A dictionary containing client configuration, including
                            'server_ip', 'server_port', 'local_port', 'password', and 'method'.
+            meter_port (int): Port of the traffic meter in front of ss-local, if any.
+                              Local applications are then pointed at it instead.
         """
         self.config = config
+        self.meter_port = meter_port
         self.client_process = None
+        # With shadowsocks.client 'embedded', src/ss_local.py serves the SOCKS port in-process.
+        self.embedded = config.get('client', 'ss-local') == 'embedded'
+        self.embedded_client = None
         # Path for a temporary configuration file to be passed to ss-local
         self.client_config_path = "ss-local-temp.json"
+        # Where generate_connection_details saves the QR code.
+        self.qr_filename = "shadowsocks_qrcode.png"
         
         # Determine the name of the shadowsocks client executable based on the OS.
         # This assumes the user has installed the client via a package manager like Homebrew.
@@ -52,35 +53,253 @@ class LocalClientManager:
             self.client_executable = "ss-local" # Default for Linux/Windows
 
 
-    def generate_connection_details(self):
+    def _spawn(self):
         """
-        Generates a Shadowsocks URL and QR code for easy mobile setup.
+        Launches ss-local on the current temporary configuration.
+
+        SO_REUSEPORT lets a replacement process bind the local port while the
+        old one is still serving, which keeps hot restarts gap-free.
+        """
+        return subprocess.Popen(
+            [self.client_executable, '-c', self.client_config_path, '--reuse-port'],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+
+    def start_client(self, server_ip=None):
+        """
+        Starts the local ss-local client with a generated configuration.
+
+        Args:
+            server_ip (str): The server address; defaults to the configured 'server_ip'.
 
         Returns:
-            tuple: A tuple containing the ss:// URL and the path to the saved QR code image.
+            tuple: A tuple (bool, str) indicating success and a status message.
+        """
+        if self.embedded:
+            return self._start_embedded(server_ip)
+        if self.client_process is not None and self.client_process.poll() is None:
+            return False, "Client is already running."
+        try:
+            self.write_client_config(server_ip)
+            self.client_process = self._spawn()
+            return True, f"Client started successfully (PID {self.client_process.pid})."
+        except FileNotFoundError:
+            self.client_process = None
+            return False, f"Client executable '{self.client_executable}' not found. Install shadowsocks-libev."
+        except OSError as e:
+            self.client_process = None
+            return False, f"Failed to start client: {e}"
+
+    def _start_embedded(self, server_ip=None):
+        """
+        Starts the built-in asyncio client instead of an ss-local process.
+        """
+        from src.ss_local import EmbeddedClient, ShadowsocksError
+
+        if self.embedded_client is not None and self.embedded_client.running:
+            return False, "Client is already running."
+        try:
+            self.embedded_client = EmbeddedClient(
+                server_ip or self.config['server_ip'], self.config['server_port'], self.config['method'],
+                self.config['password'], local_port=self.config['local_port'],
+                pool_size=self.config.get('upstream_pool_size', 0),
+                pool_idle_seconds=self.config.get('upstream_pool_idle_seconds', 30)
+            )
+            port = self.embedded_client.start()
+        except (OSError, ShadowsocksError) as e:
+            self.embedded_client = None
+            return False, f"Failed to start embedded client: {e}"
+        return True, f"Embedded client started on 127.0.0.1:{port}."
+
+    def stop_client(self):
+        """
+        Stops the local client and removes its temporary configuration.
+
+        Returns:
+            tuple: A tuple (bool, str) indicating success and a status message.
+        """
+        if self.embedded:
+            if self.embedded_client is None or not self.embedded_client.running:
+                return False, "Client is not running."
+            self.embedded_client.stop()
+            return True, "Client stopped successfully."
+        if self.client_process is None or self.client_process.poll() is not None:
+            return False, "Client is not running."
+        self._terminate(self.client_process)
+        if os.path.exists(self.client_config_path):
+            os.remove(self.client_config_path)
+        return True, "Client stopped successfully."
+
+    def switch_server(self, server_ip, settle_seconds=0.5):
+        """
+        Points the running client at a new server with minimal interruption.
+
+        A replacement process is started on the same local port first; the old
+        one is only terminated once the replacement has survived its bind.
+
+        Returns:
+            tuple: A tuple (bool, str) indicating success and a status message.
+        """
+        if self.embedded:
+            if self.embedded_client is None or not self.embedded_client.running:
+                return self.start_client(server_ip)
+            # New connections go to the new server at once; open ones finish where they are.
+            self.embedded_client.switch_server(server_ip)
+            return True, f"Client switched to {server_ip}."
+        old_process = self.client_process
+        if old_process is None or old_process.poll() is not None:
+            return self.start_client(server_ip)
+        try:
+            self.write_client_config(server_ip)
+            new_process = self._spawn()
+        except OSError as e:
+            return False, f"Failed to start replacement client: {e}"
+        try:
+            new_process.wait(timeout=settle_seconds)
+        except subprocess.TimeoutExpired:
+            # Still alive after the settle time: the bind succeeded.
+            self.client_process = new_process
+            self._terminate(old_process)
+            return True, f"Client switched to {server_ip}."
+        # The replacement exited early (e.g. no SO_REUSEPORT); fall back to stop-then-start.
+        self._terminate(old_process)
+        return self.start_client(server_ip)
+
+    def get_client_status(self):
+        """
+        Reports whether the local client process is running.
+
+        Returns:
+            tuple: A tuple (status, message) where status is 'RUNNING' or 'STOPPED'.
+        """
+        if self.embedded:
+            if self.embedded_client is None or not self.embedded_client.running:
+                return "STOPPED", "Client is not running."
+            return "RUNNING", f"Embedded client is serving 127.0.0.1:{self.embedded_client.local_port}."
+        if self.client_process is None:
+            return "STOPPED", "Client is not running."
+        exit_code = self.client_process.poll()
+        if exit_code is not None:
+            return "STOPPED", f"Client exited with code {exit_code}."
+        return "RUNNING", f"Client is running with PID {self.client_process.pid}."
+
+    def _terminate(self, process, timeout=5):
+        """
+        Terminates a client process, killing it if it does not exit in time.
+        """
+        process.terminate()
+        try:
+            process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+    def write_client_config(self, server_ip=None):
+        """
+        Writes the ss-local JSON configuration for the given server.
+
+        Args:
+            server_ip (str): The server address; defaults to the configured 'server_ip'.
+
+        Returns:
+            str: The path of the written configuration file.
         """
-        # Create a dictionary of connection details for the URL.
-        details = {
-            "server": self.config['server_ip'],
+        client_config = {
+            "server": server_ip or self.config['server_ip'],
             "server_port": self.config['server_port'],
+            "local_address": "127.0.0.1",
+            "local_port": self.config['local_port'],
             "password": self.config['password'],
             "method": self.config['method']
         }
-        
-        # Shadowsocks URL format is ss://base64(method:password@server:port)
-        # Note: The original format is base64(method:password@server:port)
-        # However, the more common format for client apps is base64(json_object)
-        # This implementation uses a JSON payload for broader client compatibility.
-        json_payload = json.dumps(details).encode('utf-8')
-        encoded_payload = base64.b64encode(json_payload).decode('utf-8')
-        ss_url = f"ss://{encoded_payload}"
-        
+        with open(self.client_config_path, 'w') as f:
+            json.dump(client_config, f, indent=4)
+        return self.client_config_path
+
+    def proxy_port(self):
+        """
+        Returns the SOCKS port local applications should use: the traffic meter's
+        when metering is on, so that their traffic is counted, else ss-local's.
+        """
+        return self.meter_port or self.config['local_port']
+
+    def pac_proxy(self):
+        """
+        Returns the PAC proxy string pointing at the local SOCKS port.
+        """
+        port = self.proxy_port()
+        return f"SOCKS5 127.0.0.1:{port}; SOCKS 127.0.0.1:{port}"
+
+    def generate_pac_file(self, rules_file, output_file, mode="selective", rule_cache=None):
+        """
+        Compiles the routing rules and writes a PAC file for the local proxy.
+
+        Args:
+            rules_file (str): The YAML routing rules (see routing_rules.py).
+            output_file (str): Where to write the PAC file.
+            mode (str): "selective" applies the rules, "global" proxies everything.
+            rule_cache (RuleCache): Optional cache of compiled rules. With a cache, an
+                up-to-date PAC file is left untouched and a changed one is replaced atomically.
+
+        Returns:
+            bool: True if the PAC file was written or is already current.
+        """
+        from src.routing_rules import PROXY, RuleError, RuleSet, compile_rules, load_rules, render_pac
+
+        digest = 'global'
+        try:
+            if mode == "global":
+                ruleset = RuleSet(default_action=PROXY).finalize()
+            else:
+                if not os.path.exists(rules_file):
+                    print(f"Routing rules file not found: {rules_file}")
+                    return False
+                if rule_cache is not None:
+                    ruleset, digest, _ = rule_cache.compile(rules_file)
+                else:
+                    rules, _ = load_rules(rules_file)
+                    ruleset = compile_rules(rules)
+            if rule_cache is not None:
+                from src.rule_cache import pac_is_current, pac_key
+                key = pac_key(digest, self.pac_proxy())
+                if pac_is_current(output_file, key):
+                    return True
+            pac = render_pac(ruleset, self.pac_proxy())
+        except (OSError, RuleError, yaml.YAMLError) as e:
+            print(f"Failed to compile routing rules: {e}")
+            return False
+
+        if rule_cache is not None:
+            from src.rule_cache import publish_pac
+            publish_pac(pac, key, output_file)
+            return True
+        with open(output_file, 'w') as f:
+            f.write(pac)
+        return True
+
+    def generate_connection_details(self, server_ip=None):
+        """
+        Generates a SIP002 Shadowsocks URL and QR code for easy mobile setup.
+
+        Args:
+            server_ip (str): The server address; defaults to the configured 'server_ip'.
+
+        Returns:
+            tuple: A tuple containing the ss:// URL and the path to the saved QR code image.
+        """
+        from src.profile_exporter import sip002_url
+
+        ss_url = sip002_url(server_ip or self.config['server_ip'], self.config['server_port'],
+                            self.config['method'], self.config['password'],
+                            plugin=self.config.get('plugin'), plugin_opts=self.config.get('plugin_opts'))
+
         # Generate and save the QR code image.
+        import qrcode
         img = qrcode.make(ss_url)
-        qr_filename = "shadowsocks_qrcode.png"
-        img.save(qr_filename)
-        
-        return ss_url, qr_filename
+        img.save(self.qr_filename)
+
+        return ss_url, self.qr_filename
 
     def test_connection(self, url):
         """
@@ -92,10 +311,12 @@ class LocalClientManager:
         Returns:
             tuple: A tuple (bool, str) indicating success and a status message.
         """
+        import requests
+
         # Configure the request to use the local SOCKS proxy.
         proxies = {
-            'http': f'socks5h://127.0.0.1:{self.config["local_port"]}',
-            'https': f'socks5h://127.0.0.1:{self.config["local_port"]}'
+            'http': f'socks5h://127.0.0.1:{self.proxy_port()}',
+            'https': f'socks5h://127.0.0.1:{self.proxy_port()}'
         }
         
         try:
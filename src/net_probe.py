@@ -0,0 +1,52 @@
+# net_probe.py
+#
+# This module provides small TCP reachability helpers: a single connect
+# probe that reports the handshake time, and a waiter that polls a port
+# until something is accepting connections on it.
+
+import socket
+import time
+
+
+def probe_port(host, port, timeout=3):
+    """
+    Attempts one TCP connection.
+
+    Returns:
+        float: The connect time in seconds, or None if the port did not accept.
+    """
+    started = time.perf_counter()
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return time.perf_counter() - started
+    except OSError:
+        return None
+
+
+def wait_for_port(host, port, timeout=300, interval=2, connect_timeout=3):
+    """
+    Polls `host:port` until it accepts a TCP connection.
+
+    Args:
+        host (str): The address to probe.
+        port (int): The TCP port to probe.
+        timeout (float): Give up after this many seconds.
+        interval (float): Pause between failed attempts.
+        connect_timeout (float): Timeout of each connection attempt.
+
+    Returns:
+        float: Seconds waited until the port accepted.
+
+    Raises:
+        TimeoutError: If the port is not accepting before the timeout.
+    """
+    started = time.monotonic()
+    deadline = started + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        if probe_port(host, port, timeout=max(0.1, min(connect_timeout, remaining))) is not None:
+            return time.monotonic() - started
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"{host}:{port} did not accept connections within {timeout} seconds.")
+        time.sleep(min(interval, remaining))
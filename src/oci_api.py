@@ -0,0 +1,366 @@
+# oci_api.py
+#
+# This module wraps the OCI SDK clients used by the manager so that every
+# call goes through one place that:
+#
+#   - waits for a token from a token bucket per tenancy and region, shared by
+#     all clients in the process, so a fleet or the control daemon stays under the
+#     tenancy's API rate limits instead of tripping them;
+#   - retries throttled (429) and server-side (5xx) failures with jittered
+#     exponential backoff, honouring Retry-After; writes are only retried on
+#     5xx when they carry an opc-retry-token, so a retry can never launch a
+#     second instance;
+#   - coalesces identical reads that are in flight at the same time and keeps
+#     their responses for a short TTL, so back-to-back `get_instance` calls
+#     cost one request; any write through the client clears that cache;
+#   - records per-operation counts, latencies, retries and cache hits.
+#
+# Reads are the `get_*` and `list_*` operations; everything else is a write.
+
+import collections
+import random
+import threading
+import time
+
+import oci
+
+READ_PREFIXES = ('get_', 'list_')
+# Latency samples kept per operation for the percentiles.
+LATENCY_SAMPLES = 256
+
+DEFAULTS = {
+    'requests_per_second': 10,
+    'burst': 10,
+    'max_retries': 5,
+    'backoff_base_seconds': 0.5,
+    'backoff_max_seconds': 30,
+    'cache_ttl_seconds': 1.0,
+}
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket: `rate` tokens per second, at most `burst` saved up.
+    """
+
+    def __init__(self, rate, burst, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = self.burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self):
+        """
+        Takes a token if one is available.
+
+        Returns:
+            float: 0 on success, otherwise the seconds until a token will be available.
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        """
+        Blocks until a token is available and takes it.
+
+        Returns:
+            float: The seconds spent waiting.
+        """
+        waited = 0
+        while True:
+            delay = self.try_acquire()
+            if not delay:
+                return waited
+            self.sleep(delay)
+            waited += delay
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def shared_bucket(key, rate, burst):
+    """
+    Returns the process-wide token bucket for `key`, creating it on first use.
+
+    API limits apply per tenancy and region, so that pair is the usual key.
+    """
+    with _buckets_lock:
+        if key not in _buckets:
+            _buckets[key] = TokenBucket(rate, burst)
+        return _buckets[key]
+
+
+class ApiMetrics:
+    """
+    Thread-safe per-operation call statistics.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._operations = {}
+
+    def _entry(self, operation):
+        if operation not in self._operations:
+            self._operations[operation] = {
+                'calls': 0, 'errors': 0, 'retries': 0, 'throttled': 0,
+                'cache_hits': 0, 'coalesced': 0, 'wait_seconds': 0.0,
+                'latencies': collections.deque(maxlen=LATENCY_SAMPLES),
+            }
+        return self._operations[operation]
+
+    def record(self, operation, **counts):
+        """
+        Adds `counts` (e.g. calls=1, retries=2) to the operation's counters.
+        """
+        with self._lock:
+            entry = self._entry(operation)
+            for name, value in counts.items():
+                entry[name] += value
+
+    def record_latency(self, operation, seconds):
+        with self._lock:
+            self._entry(operation)['latencies'].append(seconds)
+
+    def snapshot(self):
+        """
+        Returns the counters per operation, with p50/p95 latencies in milliseconds.
+        """
+        with self._lock:
+            result = {}
+            for operation, entry in sorted(self._operations.items()):
+                latencies = sorted(entry['latencies'])
+                summary = {name: value for name, value in entry.items() if name != 'latencies'}
+                summary['p50_ms'] = _percentile(latencies, 0.50) * 1000
+                summary['p95_ms'] = _percentile(latencies, 0.95) * 1000
+                result[operation] = summary
+            return result
+
+    def reset(self):
+        with self._lock:
+            self._operations.clear()
+
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+# Shared by every wrapped client in the process.
+METRICS = ApiMetrics()
+
+
+def format_metrics(snapshot):
+    """
+    Formats an ApiMetrics snapshot as an aligned table.
+    """
+    if not snapshot:
+        return "No OCI API calls recorded."
+    header = ('OPERATION', 'CALLS', 'ERRORS', 'RETRIES', '429', 'CACHED', 'COALESCED', 'P50', 'P95')
+    lines = [header] + [
+        (operation, str(entry['calls']), str(entry['errors']), str(entry['retries']), str(entry['throttled']),
+         str(entry['cache_hits']), str(entry['coalesced']), f"{entry['p50_ms']:.0f}ms", f"{entry['p95_ms']:.0f}ms")
+        for operation, entry in snapshot.items()
+    ]
+    widths = [max(len(line[i]) for line in lines) for i in range(len(header))]
+    return "\n".join(
+        "  ".join(cell.ljust(width) if i == 0 else cell.rjust(width) for i, (cell, width) in enumerate(zip(line, widths)))
+        for line in lines
+    )
+
+
+def is_capacity_error(error):
+    """
+    Returns True if a launch failed because the AD has no capacity for the shape.
+
+    OCI reports this as a 500 "Out of host capacity." error.
+    """
+    return isinstance(error, oci.exceptions.ServiceError) and (
+        'out of host capacity' in str(error.message or '').lower() or error.code == 'OutOfHostCapacity'
+    )
+
+
+def is_retryable(error, write=False, idempotent=False):
+    """
+    Returns True if a failed call may be repeated.
+
+    Throttling (429) is always retryable because the request was rejected
+    before it was processed. Server errors and connection failures are
+    retried for reads, and for writes only when they are idempotent.
+    Capacity errors are final: the launch strategy moves on to another
+    candidate instead (see launch_strategy.py).
+    """
+    if isinstance(error, oci.exceptions.ServiceError):
+        if error.status == 429:
+            return True
+        return error.status >= 500 and (not write or idempotent) and not is_capacity_error(error)
+    if isinstance(error, (oci.exceptions.RequestException, ConnectionError)):
+        return not write or idempotent
+    return False
+
+
+class _InFlight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+
+class RateLimitedClient:
+    """
+    A drop-in proxy for an OCI SDK client that rate-limits, retries, coalesces and caches.
+    """
+
+    def __init__(self, client, bucket, max_retries=5, backoff_base=0.5, backoff_max=30, cache_ttl=1.0,
+                 metrics=METRICS, clock=time.monotonic, sleep=time.sleep, jitter=random.random):
+        """
+        Args:
+            client: The OCI SDK client to wrap.
+            bucket (TokenBucket): Rate limiter; usually `shared_bucket(...)`.
+            max_retries (int): Retries after the first attempt.
+            backoff_base (float): First backoff ceiling in seconds; doubles per retry.
+            backoff_max (float): Upper bound of a single backoff.
+            cache_ttl (float): Seconds a read response is reused; 0 disables the cache.
+                               Keep it below the lifecycle waiter's poll interval.
+            metrics (ApiMetrics): Where call statistics go.
+            clock (callable): Monotonic time source, injectable for tests.
+            sleep (callable): Used for backoff, injectable for tests.
+            jitter (callable): Returns a float in [0, 1), injectable for tests.
+        """
+        self._client = client
+        self._bucket = bucket
+        self._max_retries = max_retries
+        self._backoff_base = backoff_base
+        self._backoff_max = backoff_max
+        self._cache_ttl = cache_ttl
+        self._metrics = metrics
+        self._clock = clock
+        self._sleep = sleep
+        self._jitter = jitter
+        self._lock = threading.Lock()
+        self._cache = {}
+        self._in_flight = {}
+        # Bumped by every write, so a read that raced one is not cached.
+        self._generation = 0
+
+    @classmethod
+    def from_config(cls, client, api_config, oci_config):
+        """
+        Wraps `client` using the `api` config section and the shared bucket of
+        the tenancy and region in `oci_config`.
+        """
+        settings = dict(DEFAULTS, **(api_config or {}))
+        bucket = shared_bucket((oci_config.get('tenancy'), oci_config.get('region')),
+                               settings['requests_per_second'], settings['burst'])
+        return cls(client, bucket, max_retries=settings['max_retries'],
+                   backoff_base=settings['backoff_base_seconds'], backoff_max=settings['backoff_max_seconds'],
+                   cache_ttl=settings['cache_ttl_seconds'])
+
+    @property
+    def wrapped(self):
+        return self._client
+
+    def __getattr__(self, name):
+        attribute = getattr(self._client, name)
+        if not callable(attribute) or name.startswith('_'):
+            return attribute
+        if name.startswith(READ_PREFIXES):
+            return lambda *args, **kwargs: self._read(name, args, kwargs)
+        return lambda *args, **kwargs: self._write(name, args, kwargs)
+
+    def invalidate(self):
+        """
+        Drops all cached read responses.
+        """
+        with self._lock:
+            self._cache.clear()
+            self._generation += 1
+
+    def _backoff(self, attempt, error):
+        retry_after = None
+        if isinstance(error, oci.exceptions.ServiceError):
+            retry_after = (error.headers or {}).get('retry-after')
+        try:
+            if retry_after is not None:
+                return min(float(retry_after), self._backoff_max)
+        except ValueError:
+            pass
+        # Full jitter: spreads out clients that were throttled at the same moment.
+        return self._jitter() * min(self._backoff_max, self._backoff_base * 2 ** attempt)
+
+    def _call(self, operation, args, kwargs, write=False):
+        idempotent = bool(kwargs.get('opc_retry_token'))
+        attempt = 0
+        while True:
+            waited = self._bucket.acquire()
+            started = self._clock()
+            try:
+                response = getattr(self._client, operation)(*args, **kwargs)
+            except Exception as e:
+                self._metrics.record_latency(operation, self._clock() - started)
+                throttled = int(isinstance(e, oci.exceptions.ServiceError) and e.status == 429)
+                if attempt >= self._max_retries or not is_retryable(e, write, idempotent):
+                    self._metrics.record(operation, calls=1, errors=1, throttled=throttled, wait_seconds=waited)
+                    raise
+                self._metrics.record(operation, calls=1, retries=1, throttled=throttled, wait_seconds=waited)
+                self._sleep(self._backoff(attempt, e))
+                attempt += 1
+                continue
+            self._metrics.record_latency(operation, self._clock() - started)
+            self._metrics.record(operation, calls=1, wait_seconds=waited)
+            return response
+
+    def _read(self, operation, args, kwargs):
+        key = (operation, args, tuple(sorted(kwargs.items())))
+        try:
+            hash(key)
+        except TypeError:
+            return self._call(operation, args, kwargs)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None and self._clock() < cached[0]:
+                self._metrics.record(operation, cache_hits=1)
+                return cached[1]
+            waiting = self._in_flight.get(key)
+            if waiting is None:
+                self._in_flight[key] = flight = _InFlight()
+                generation = self._generation
+        if waiting is not None:
+            waiting.done.wait()
+            self._metrics.record(operation, coalesced=1)
+            if waiting.error is not None:
+                raise waiting.error
+            return waiting.response
+
+        try:
+            flight.response = self._call(operation, args, kwargs)
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+                if flight.error is None and self._cache_ttl > 0 and generation == self._generation:
+                    self._cache[key] = (self._clock() + self._cache_ttl, flight.response)
+            flight.done.set()
+        return flight.response
+
+    def _write(self, operation, args, kwargs):
+        try:
+            return self._call(operation, args, kwargs, write=True)
+        finally:
+            # Whatever the outcome, the resource may have changed.
+            self.invalidate()
@@ -3,25 +3,107 @@
 # This module provides the core functionality for managing OCI resources,
 # including compute instances and network security lists, for the
 # Shadowsocks proxy.
-# It interacts directly with the OCI Python SDK and uses Paramiko for SSH.
+# It interacts directly with the OCI Python SDK; SSH provisioning is
+# delegated to the provisioner module.
 
 import oci
-import requests
-import paramiko
-import time
-import os
+import asyncio
+import uuid
+
+from src.cloud_init import encode_user_data, render_user_data
+from src.instance_state import PROJECT_TAG, InstanceStateStore
+from src.launch_strategy import LaunchStrategy
+from src.lifecycle_waiter import LifecycleWaiter, LifecycleWaitError
+from src.oci_api import RateLimitedClient
+from src.public_ip import PublicIPDetector
+from src.provisioner import Provisioner, SSHSessionPool, shadowsocks_steps
+from src.security_list_updater import SecurityListUpdater
+from src.server_config import CONFIG_HASH_TAG, config_hash
 
 class OCIManager:
     """
     Manages OCI compute instance and networking resources.
     """
-    def __init__(self, config):
+    # Freeform tag value identifying the proxy instance.
+    PROJECT_TAG = PROJECT_TAG
+    # Lifecycle states in which the tagged instance still counts as ours.
+    ACTIVE_STATES = ('PROVISIONING', 'STARTING', 'RUNNING', 'STOPPING', 'STOPPED')
+
+    def __init__(self, config, compute_client=None, networking_client=None, state_store=None):
         """
         Initializes the OCI Manager with OCI configuration and SDK clients.
+
+        Args:
+            config (dict): The full application configuration.
+            compute_client: Optional pre-built compute client (used by tests).
+            networking_client: Optional pre-built virtual network client.
+            state_store (InstanceStateStore): Optional local instance state cache.
         """
         self.config = config['oci']
-        self.compute_client = oci.core.ComputeClient(self.config)
-        self.networking_client = oci.core.VirtualNetworkClient(self.config)
+        self.compute_config = config.get('compute', {})
+        self.shadowsocks_config = config.get('shadowsocks', {})
+        self.public_ip_config = config.get('public_ip', {})
+        self.api_config = config.get('api', {})
+        # Pool members tag their instances individually (see server_pool.py).
+        self.PROJECT_TAG = self.compute_config.get('project_tag', PROJECT_TAG)
+        self.ip_detector = PublicIPDetector.from_config(self.public_ip_config)
+        # With warm standby, a stopped proxy instance is resumed instead of launching a new one.
+        self.warm_standby = self.compute_config.get('warm_standby', False)
+        if state_store is None:
+            state_store = InstanceStateStore(ttl_seconds=self.compute_config.get('state_ttl_seconds', 60))
+        self.state_store = state_store
+        record = self.state_store.get(self.PROJECT_TAG)
+        self.instance_id = record['instance_id'] if record else None
+        # SDK clients (and the waiter using them) are built on first use, so
+        # commands answered from the state store never sign a client. Built
+        # clients are wrapped for rate limiting and retries (see oci_api.py).
+        self._compute_client = compute_client
+        self._networking_client = networking_client
+        self._waiter = None
+        self.ssh_pool = SSHSessionPool(
+            username=self.compute_config.get('ssh_user', 'opc'),
+            key_filename=self.config['key_file']
+        )
+        self.provisioner = Provisioner(
+            self.ssh_pool,
+            on_output=lambda host, stream, line: print(f"[{host}] {line}")
+        )
+
+    def _wrap(self, client_class):
+        # Retries are handled by the wrapper, so the SDK's own strategy is turned off.
+        client = client_class(self.config, retry_strategy=oci.retry.NoneRetryStrategy())
+        return RateLimitedClient.from_config(client, self.api_config, self.config)
+
+    @property
+    def compute_client(self):
+        if self._compute_client is None:
+            self._compute_client = self._wrap(oci.core.ComputeClient)
+        return self._compute_client
+
+    @compute_client.setter
+    def compute_client(self, client):
+        self._compute_client = client
+        self._waiter = None
+
+    @property
+    def networking_client(self):
+        if self._networking_client is None:
+            self._networking_client = self._wrap(oci.core.VirtualNetworkClient)
+        return self._networking_client
+
+    @networking_client.setter
+    def networking_client(self, client):
+        self._networking_client = client
+
+    @property
+    def waiter(self):
+        if self._waiter is None:
+            self._waiter = LifecycleWaiter(self.compute_client)
+        return self._waiter
+
+    @waiter.setter
+    def waiter(self, waiter):
+        self._waiter = waiter
 
     def create_or_get_instance(self):
         """
@@ -29,39 +111,21 @@ class OCIManager:
         """
         print("Checking for existing Shadowsocks instance...")
         try:
-            # List instances and find one with the correct tag
-            list_instances_response = self.compute_client.list_instances(
-                compartment_id=self.config['compartment_id'],
-                lifecycle_state='RUNNING'
-            )
-            for instance in list_instances_response.data:
-                if instance.freeform_tags.get('project') == 'shadowsocks-proxy':
-                    print(f"Found existing instance with OCID: {instance.id}. Reusing.")
-                    self.instance_id = instance.id
-                    return instance, "Reusing existing instance."
+            instance = self.find_existing_instance(self.reusable_states())
+            if instance is not None and instance.lifecycle_state != 'RUNNING':
+                print(f"Found {instance.lifecycle_state.lower()} instance with OCID: {instance.id}. Resuming.")
+                instance = self.resume_instance(instance)
+                return instance, "Resumed warm-standby instance."
+            if instance is not None:
+                print(f"Found existing instance with OCID: {instance.id}. Reusing.")
+                return instance, "Reusing existing instance."
 
-            # If no instance found, create a new one
+            # If no instance found, create a new one, falling back to other
+            # ADs or shapes when there is no capacity
             print("No existing instance found. Creating a new one...")
-            instance_details = oci.core.models.LaunchInstanceDetails(
-                compartment_id=self.config['compartment_id'],
-                availability_domain=self.config['compute']['availability_domain'],
-                shape=self.config['compute']['instance_shape'],
-                image_id=self.config['compute']['image_id'],
-                subnet_id=self.config['compute']['subnet_id'],
-                ssh_authorized_keys=self._get_ssh_key(),
-                display_name='shadowsocks-proxy',
-                freeform_tags={'project': 'shadowsocks-proxy'}
-            )
-            launch_instance_response = self.compute_client.launch_instance(
-                launch_instance_details=instance_details
-            )
-            self.instance_id = launch_instance_response.data.id
-            print(f"New instance launched with OCID: {self.instance_id}")
-
-            # Wait for the instance to be provisioned
-            self.compute_client.get_instance(self.instance_id).data.wait_for_lifecycle_state('RUNNING')
-            print("Instance is now running.")
-            return self.compute_client.get_instance(self.instance_id).data, "New instance created and started."
+            result = self.launch_strategy(on_event=print).launch(self._get_ssh_key())
+            print(f"Instance {self.instance_id} is now running ({result['time_to_running']:.0f}s to RUNNING).")
+            return result['instance'], "New instance created and started."
 
         except oci.exceptions.ServiceError as e:
             print(f"OCI Service Error: {e.message}")
@@ -70,6 +134,296 @@ class OCIManager:
             print(f"An unexpected error occurred: {e}")
             return None, f"Error: {e}"
 
+    def find_existing_instance(self, lifecycle_states=('RUNNING',)):
+        """
+        Returns the instance tagged for this project if it is in one of
+        `lifecycle_states`, or None.
+
+        The locally cached instance is tried first: a fresh record is trusted,
+        a stale one costs a single `get_instance`. The compartment is only
+        listed when no usable record exists, and the listing stops at the
+        first tagged match.
+        """
+        record = self.state_store.get(self.PROJECT_TAG)
+        if record is not None:
+            found, instance = self._revalidate(record, lifecycle_states)
+            if found:
+                return instance
+
+        for instance in self._iter_instances(lifecycle_states):
+            if instance.freeform_tags.get('project') == self.PROJECT_TAG:
+                self._remember(instance)
+                return instance
+        self.state_store.remove(self.PROJECT_TAG)
+        return None
+
+    def reusable_states(self):
+        """
+        Returns the lifecycle states in which an existing instance is reused.
+        """
+        if self.warm_standby:
+            return ('RUNNING', 'STARTING', 'STOPPING', 'STOPPED')
+        return ('RUNNING',)
+
+    def resume_instance(self, instance):
+        """
+        Brings a warm-standby instance back to RUNNING.
+
+        Returns:
+            The instance model once it is running.
+        """
+        if instance.lifecycle_state == 'STOPPING':
+            instance = self.wait_for_instance_state(instance.id, 'STOPPED')
+        if instance.lifecycle_state == 'STOPPED':
+            self.compute_client.instance_action(instance.id, 'START')
+        return self.wait_for_instance_state(instance.id, 'RUNNING')
+
+    async def resume_instance_async(self, instance):
+        """
+        Awaitable counterpart of `resume_instance`.
+        """
+        if instance.lifecycle_state == 'STOPPING':
+            instance = await self.wait_for_instance_state_async(instance.id, 'STOPPED')
+        if instance.lifecycle_state == 'STOPPED':
+            await asyncio.to_thread(self.compute_client.instance_action, instance.id, 'START')
+        return await self.wait_for_instance_state_async(instance.id, 'RUNNING')
+
+    def needs_configuration(self, instance):
+        """
+        Returns True unless the instance is tagged with the hash of the local
+        Shadowsocks configuration.
+        """
+        return (instance.freeform_tags or {}).get(CONFIG_HASH_TAG) != config_hash(self.shadowsocks_config)
+
+    def ensure_configured(self, instance, public_ip):
+        """
+        Configures the instance unless it already runs the local configuration.
+
+        Returns:
+            bool: True if the instance was configured, False if it was skipped.
+
+        Raises:
+            Exception: If configuration was needed and failed.
+        """
+        if not self.needs_configuration(instance):
+            return False
+        success, message = self.configure_instance(instance, public_ip)
+        if not success:
+            raise Exception(message)
+        self.mark_configured(instance)
+        return True
+
+    def mark_configured(self, instance):
+        """
+        Tags the instance with the hash of the configuration it now runs.
+        """
+        current = self.compute_client.get_instance(instance.id).data
+        freeform_tags = dict(current.freeform_tags or {})
+        freeform_tags[CONFIG_HASH_TAG] = config_hash(self.shadowsocks_config)
+        updated = self.compute_client.update_instance(
+            instance.id,
+            oci.core.models.UpdateInstanceDetails(freeform_tags=freeform_tags)
+        ).data
+        self._remember(updated)
+        return updated
+
+    def _revalidate(self, record, lifecycle_states):
+        """
+        Checks a cached record against OCI when it is older than the TTL.
+
+        Returns:
+            tuple: (found, instance). `found` is False when the cached instance
+                   no longer exists and the compartment has to be searched.
+        """
+        if self.state_store.is_fresh(record):
+            self.instance_id = record['instance_id']
+            if record['lifecycle_state'] in lifecycle_states:
+                freeform_tags = {'project': self.PROJECT_TAG}
+                if record.get('config_hash'):
+                    freeform_tags[CONFIG_HASH_TAG] = record['config_hash']
+                return True, oci.core.models.Instance(
+                    id=record['instance_id'],
+                    lifecycle_state=record['lifecycle_state'],
+                    freeform_tags=freeform_tags
+                )
+            return True, None
+
+        try:
+            instance = self.compute_client.get_instance(record['instance_id']).data
+        except oci.exceptions.ServiceError as e:
+            if e.status == 404:
+                return False, None
+            raise
+        if instance.lifecycle_state in ('TERMINATING', 'TERMINATED') \
+                or instance.freeform_tags.get('project') != self.PROJECT_TAG:
+            return False, None
+        self._remember(instance)
+        return True, instance if instance.lifecycle_state in lifecycle_states else None
+
+    def _iter_instances(self, lifecycle_states):
+        """
+        Lazily yields compartment instances page by page.
+        """
+        kwargs = {'compartment_id': self.config['compartment_id']}
+        if len(lifecycle_states) == 1:
+            kwargs['lifecycle_state'] = lifecycle_states[0]
+        while True:
+            response = self.compute_client.list_instances(**kwargs)
+            for instance in response.data:
+                if instance.lifecycle_state in lifecycle_states:
+                    yield instance
+            if not response.next_page:
+                return
+            kwargs['page'] = response.next_page
+
+    def _remember(self, instance, **fields):
+        """
+        Records the instance's current state in the local state store.
+        """
+        self.instance_id = instance.id
+        if instance.lifecycle_state != 'RUNNING':
+            # Ephemeral public IPs do not survive a stop.
+            fields.setdefault('public_ip', None)
+        self.state_store.put(
+            self.PROJECT_TAG,
+            instance_id=instance.id,
+            lifecycle_state=instance.lifecycle_state,
+            config_hash=(instance.freeform_tags or {}).get(CONFIG_HASH_TAG),
+            **fields
+        )
+
+    def launch_strategy(self, **kwargs):
+        """
+        Returns the LaunchStrategy for the configured launch candidates.
+        """
+        kwargs.setdefault('timeout', self.compute_config.get('launch_timeout', 600))
+        return LaunchStrategy.from_config(self, self.compute_config, **kwargs)
+
+    def launch_instance(self, ssh_public_key, candidate=None):
+        """
+        Launches a new tagged Shadowsocks instance without waiting for it to boot.
+
+        Args:
+            ssh_public_key (str): The public key to authorize on the instance.
+            candidate (dict): Optional launch candidate overriding the compute config
+                              (see launch_strategy.CANDIDATE_KEYS).
+
+        Returns:
+            The launched instance model (typically still PROVISIONING).
+        """
+        compute = dict(self.compute_config, **(candidate or {}))
+        metadata = {'ssh_authorized_keys': ssh_public_key}
+        freeform_tags = {'project': self.PROJECT_TAG}
+        if self.compute_config.get('bootstrap') == 'cloud-init':
+            # The instance configures itself on first boot, so no SSH pass is needed.
+            metadata['user_data'] = encode_user_data(render_user_data(self.shadowsocks_config))
+            freeform_tags[CONFIG_HASH_TAG] = config_hash(self.shadowsocks_config)
+        shape_config = None
+        if compute['instance_shape'].endswith('.Flex'):
+            # Flexible shapes (e.g. VM.Standard.A1.Flex) need an explicit size.
+            shape_config = oci.core.models.LaunchInstanceShapeConfigDetails(
+                ocpus=compute.get('ocpus', 1),
+                memory_in_gbs=compute.get('memory_in_gbs', 6)
+            )
+        instance_details = oci.core.models.LaunchInstanceDetails(
+            compartment_id=self.config['compartment_id'],
+            availability_domain=compute['availability_domain'],
+            shape=compute['instance_shape'],
+            shape_config=shape_config,
+            image_id=compute['image_id'],
+            subnet_id=compute['subnet_id'],
+            metadata=metadata,
+            display_name=self.PROJECT_TAG,
+            freeform_tags=freeform_tags
+        )
+        launch_instance_response = self.compute_client.launch_instance(
+            launch_instance_details=instance_details,
+            # Makes the launch safe to retry: OCI runs it at most once per token.
+            opc_retry_token=uuid.uuid4().hex
+        )
+        self._remember(launch_instance_response.data)
+        return launch_instance_response.data
+
+    def terminate_instance(self, instance_id):
+        """
+        Terminates an instance and its boot volume, e.g. a launch that lost a race.
+        """
+        self.compute_client.terminate_instance(instance_id, preserve_boot_volume=False)
+        record = self.state_store.get(self.PROJECT_TAG)
+        if record and record['instance_id'] == instance_id:
+            self.state_store.remove(self.PROJECT_TAG)
+            self.instance_id = None
+
+    def wait_for_instance_state(self, instance_id, state, timeout=600):
+        """
+        Waits until an instance reaches the given lifecycle state.
+
+        Returns:
+            The instance model once it is in the requested state.
+
+        Raises:
+            LifecycleWaitError: If the state is not reached before the timeout
+                or can no longer be reached.
+        """
+        instance = self.waiter.wait(instance_id, state, timeout=timeout)
+        self._remember(instance)
+        return instance
+
+    async def wait_for_instance_state_async(self, instance_id, state, timeout=600):
+        """
+        Awaitable counterpart of `wait_for_instance_state`.
+        """
+        instance = await self.waiter.wait_async(instance_id, state, timeout=timeout)
+        self._remember(instance)
+        return instance
+
+    def get_public_ip(self, instance_id):
+        """
+        Resolves the public IP address of an instance via its primary VNIC.
+
+        A fresh cached address for the same instance is returned without API calls.
+        """
+        record = self.state_store.get(self.PROJECT_TAG)
+        if record and record['instance_id'] == instance_id and record.get('public_ip') \
+                and self.state_store.is_fresh(record):
+            return record['public_ip']
+        attachments = self.compute_client.list_vnic_attachments(
+            compartment_id=self.config['compartment_id'],
+            instance_id=instance_id
+        ).data
+        for attachment in attachments:
+            if attachment.lifecycle_state != 'ATTACHED':
+                continue
+            vnic = self.networking_client.get_vnic(attachment.vnic_id).data
+            if vnic.public_ip:
+                if record and record['instance_id'] == instance_id:
+                    self.state_store.put(self.PROJECT_TAG, verified=False, public_ip=vnic.public_ip)
+                return vnic.public_ip
+        return None
+
+    def detect_public_ip(self):
+        """
+        Returns this machine's public IP address as seen from the internet.
+        """
+        return self.ip_detector.detect(self.public_ip_config.get('version', 4))
+
+    def fetch_security_lists(self):
+        """
+        Fetches the security list managed for the proxy.
+
+        This is `compute.security_list_id` when configured, otherwise the
+        first security list attached to the instance's subnet.
+
+        Returns:
+            list: (SecurityList, etag) pairs.
+        """
+        security_list_id = self.compute_config.get('security_list_id')
+        if not security_list_id:
+            subnet = self.networking_client.get_subnet(self.compute_config['subnet_id']).data
+            security_list_id = subnet.security_list_ids[0]
+        response = self.networking_client.get_security_list(security_list_id)
+        return [(response.data, response.headers.get('etag'))]
+
     def start_instance(self):
         """
         Starts a stopped OCI instance.
@@ -77,77 +431,96 @@ class OCIManager:
         print(f"Starting instance with OCID: {self.instance_id}...")
         try:
             self.compute_client.instance_action(self.instance_id, 'START')
-            self.compute_client.get_instance(self.instance_id).data.wait_for_lifecycle_state('RUNNING')
+            self.wait_for_instance_state(self.instance_id, 'RUNNING')
             print("Instance started successfully.")
             return True, "Instance started."
         except oci.exceptions.ServiceError as e:
             return False, f"OCI Service Error: {e.message}"
+        except LifecycleWaitError as e:
+            return False, str(e)
 
     def stop_instance(self):
         """
-        Stops a running OCI instance.
+        Stops the running proxy instance.
+
+        The instance is looked up first: a long-lived manager (e.g. in the
+        control daemon) may predate the instance another process launched.
         """
-        print(f"Stopping instance with OCID: {self.instance_id}...")
         try:
+            instance = self.find_existing_instance(('RUNNING', 'STARTING'))
+            if instance is None:
+                return True, "No running instance to stop."
+            self.instance_id = instance.id
+            print(f"Stopping instance with OCID: {self.instance_id}...")
             self.compute_client.instance_action(self.instance_id, 'SOFTSTOP')
-            self.compute_client.get_instance(self.instance_id).data.wait_for_lifecycle_state('STOPPED')
+            self.wait_for_instance_state(self.instance_id, 'STOPPED')
             print("Instance stopped successfully.")
             return True, "Instance stopped."
         except oci.exceptions.ServiceError as e:
             return False, f"OCI Service Error: {e.message}"
+        except LifecycleWaitError as e:
+            return False, str(e)
 
-    def configure_instance(self, instance):
+    def configure_instance(self, instance, public_ip):
         """
         Connects to the instance via SSH and installs/configures Shadowsocks.
-        This is a placeholder and requires a separate script for full implementation.
+        Steps whose remote state is already correct are skipped.
         """
-        public_ip = instance.public_ip
         try:
-            ssh = paramiko.SSHClient()
-            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            ssh.connect(public_ip, username='opc', key_filename=self.config['key_file'])
-
-            # Example commands to install Shadowsocks (requires a separate script or logic)
-            # stdin, stdout, stderr = ssh.exec_command('sudo yum install -y shadowsocks-libev')
-            # time.sleep(10)
-            # stdin, stdout, stderr = ssh.exec_command('sudo systemctl start shadowsocks-libev')
-
-            print("Instance configured successfully via SSH.")
-            ssh.close()
+            result = self.provisioner.provision(public_ip, shadowsocks_steps(self.shadowsocks_config))
+            print(f"Instance configured successfully via SSH "
+                  f"(applied: {', '.join(result['applied']) or 'none'}; "
+                  f"skipped: {', '.join(result['skipped']) or 'none'}).")
             return True, "Instance configured."
         except Exception as e:
             print(f"Error configuring instance via SSH: {e}")
-            return False, f"Error configuring instance."
+            return False, f"Error configuring instance: {e}"
+        finally:
+            # The connection is only needed while provisioning.
+            self.ssh_pool.close(public_ip)
 
-    def update_network_security_list(self):
+    def update_network_security_list(self, public_ip=None, server_port=None, security_lists=None):
         """
         Updates the Network Security List to allow traffic from the user's current public IP.
+
+        Managed rules for previous client IPs are removed in the same write, and
+        no write is made when the rules are already correct.
+
+        Args:
+            public_ip (str): The client IP to allow; detected when omitted.
+            server_port (int): The Shadowsocks server port to open.
+            security_lists (list): (SecurityList, etag) pairs already fetched by the caller.
         """
         try:
-            public_ip = requests.get('https://api.ipify.org').text
+            if public_ip is None:
+                public_ip = self.detect_public_ip()
+            if server_port is None:
+                server_port = self.shadowsocks_config['server_port']
             print(f"Detected public IP: {public_ip}")
 
-            # This is a simplified placeholder. A full implementation would need
-            # to find the specific NSL and then update the ingress rules.
-            print("Updating Network Security List ingress rules...")
-            # For a real implementation, you would:
-            # 1. Get the NSL for the instance's subnet.
-            # 2. Add or update the ingress rule with the current IP.
-            # 3. Remove any old IP rules.
-            print("NSL updated successfully.")
+            if security_lists is None:
+                security_lists = self.fetch_security_lists()
+            security_list, etag = security_lists[0]
+            result = SecurityListUpdater(self.networking_client).update(
+                security_list.id, public_ip, server_port, prefetched=(security_list, etag)
+            )
+            if not result['changed']:
+                print("NSL already allows this IP; no update needed.")
+                return True, "Network Security List already up to date."
+            print(f"NSL updated successfully (+{result['added']}/-{result['removed']} rules).")
             return True, "Network Security List updated."
         except Exception as e:
             print(f"Error updating NSL: {e}")
-            return False, f"Error updating NSL."
+            return False, f"Error updating NSL: {e}"
 
     def get_instance_status(self):
         """
         Retrieves the current status of the OCI instance.
         """
         try:
-            if not self.instance_id:
+            instance = self.find_existing_instance(self.ACTIVE_STATES)
+            if instance is None:
                 return "UNKNOWN", "No instance ID found."
-            instance = self.compute_client.get_instance(self.instance_id).data
             return instance.lifecycle_state, f"Instance is currently {instance.lifecycle_state}."
         except Exception as e:
             return "ERROR", f"Could not retrieve instance status: {e}"
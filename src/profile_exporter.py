@@ -0,0 +1,186 @@
+# profile_exporter.py
+#
+# This module exports Shadowsocks connection profiles for many devices in one
+# pass. Every profile is a SIP002 `ss://` URL (https://shadowsocks.org/doc/sip002.html)
+# built from the 'shadowsocks' section with per-device overrides for the port,
+# password, method and plugin, plus a QR code rendered as SVG, PNG or terminal
+# text.
+#
+# QR rendering is pure Python and CPU bound, so changed profiles are rendered
+# in a process pool. A manifest next to the outputs records the content hash
+# each file was rendered from; profiles whose URL and format did not change are
+# not rendered again, which makes regenerating after an IP change cheap for
+# devices that did not change.
+
+import base64
+import concurrent.futures
+import hashlib
+import io
+import json
+import os
+import re
+from urllib.parse import quote
+
+FORMATS = {'svg': '.svg', 'png': '.png', 'terminal': '.txt'}
+MANIFEST_FILE = ".manifest.json"
+# Bump when the rendered output changes for the same URL.
+RENDER_VERSION = 1
+DEVICE_FIELDS = ('server_port', 'password', 'method', 'plugin', 'plugin_opts')
+
+
+def sip002_url(server, server_port, method, password, plugin=None, plugin_opts=None, tag=None):
+    """
+    Builds a SIP002 `ss://` URL.
+
+    Args:
+        server (str): Server hostname or IP address; IPv6 literals are bracketed.
+        server_port (int): Server port.
+        method (str): Cipher, e.g. "aes-256-gcm".
+        password (str): The password.
+        plugin (str): Optional SIP003 plugin name, e.g. "v2ray-plugin".
+        plugin_opts (str): Optional plugin options, e.g. "mode=websocket;tls".
+        tag (str): Optional profile name shown by clients.
+
+    Returns:
+        str: The URL.
+    """
+    if method.startswith('2022-'):
+        # SIP022 methods must not base64-encode the user info.
+        userinfo = f"{quote(method, safe='')}:{quote(password, safe='')}"
+    else:
+        userinfo = base64.urlsafe_b64encode(f"{method}:{password}".encode('utf-8')).decode('ascii').rstrip('=')
+    host = f"[{server}]" if ':' in server else server
+    url = f"ss://{userinfo}@{host}:{server_port}"
+    if plugin:
+        url += "/?plugin=" + quote(f"{plugin};{plugin_opts}" if plugin_opts else plugin, safe='')
+    if tag:
+        url += "#" + quote(tag, safe='')
+    return url
+
+
+def render_qr(url, fmt):
+    """
+    Renders `url` as a QR code.
+
+    Args:
+        url (str): The text to encode.
+        fmt (str): One of 'svg', 'png' or 'terminal'.
+
+    Returns:
+        bytes: The encoded image (or UTF-8 text for 'terminal').
+    """
+    import qrcode
+
+    qr = qrcode.QRCode(border=2 if fmt == 'terminal' else 4)
+    qr.add_data(url)
+    qr.make(fit=True)
+    if fmt == 'terminal':
+        out = io.StringIO()
+        qr.print_ascii(out=out, invert=True)
+        return out.getvalue().encode('utf-8')
+    buffer = io.BytesIO()
+    if fmt == 'svg':
+        from qrcode.image.svg import SvgPathImage
+        qr.make_image(image_factory=SvgPathImage).save(buffer)
+    else:
+        qr.make_image().save(buffer)
+    return buffer.getvalue()
+
+
+def _render_to_file(url, fmt, path):
+    # Module-level so that the process pool can pickle it.
+    data = render_qr(url, fmt)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return path
+
+
+class ProfileExporter:
+    """
+    Exports SIP002 URLs and QR codes for a list of devices.
+    """
+
+    def __init__(self, shadowsocks_config, output_dir="profiles", fmt="svg", workers=None):
+        """
+        Args:
+            shadowsocks_config (dict): The 'shadowsocks' config section (server_port, password, method).
+            output_dir (str): Directory for the QR codes, profiles.json and the manifest.
+            fmt (str): QR output format: 'svg', 'png' or 'terminal'.
+            workers (int): Render processes; defaults to the CPU count.
+        """
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown QR format '{fmt}'; expected one of {', '.join(FORMATS)}.")
+        self.config = shadowsocks_config
+        self.output_dir = output_dir
+        self.fmt = fmt
+        self.workers = workers or os.cpu_count() or 1
+
+    def build_profiles(self, server_ip, devices):
+        """
+        Resolves each device's settings and URL.
+
+        Args:
+            server_ip (str): The server address.
+            devices (list): Dicts with a 'name' and optional DEVICE_FIELDS overrides.
+
+        Returns:
+            list: One dict per device with 'name', 'url', 'file' and the resolved settings.
+        """
+        profiles = []
+        seen = set()
+        for device in devices or [{'name': 'default'}]:
+            name = str(device['name'])
+            slug = re.sub(r'[^A-Za-z0-9_.-]+', '-', name).strip('-') or 'device'
+            if slug in seen:
+                raise ValueError(f"Duplicate device name '{name}'.")
+            seen.add(slug)
+            settings = {field: device.get(field, self.config.get(field)) for field in DEVICE_FIELDS}
+            url = sip002_url(server_ip, settings['server_port'], settings['method'], settings['password'],
+                             plugin=settings['plugin'], plugin_opts=settings['plugin_opts'], tag=name)
+            profiles.append(dict(settings, name=name, url=url,
+                                 file=os.path.join(self.output_dir, slug + FORMATS[self.fmt])))
+        return profiles
+
+    def _key(self, profile):
+        return hashlib.sha256(f"{RENDER_VERSION}\0{self.fmt}\0{profile['url']}".encode('utf-8')).hexdigest()
+
+    def _load_manifest(self):
+        try:
+            with open(os.path.join(self.output_dir, MANIFEST_FILE), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def export(self, server_ip, devices):
+        """
+        Writes profiles.json and a QR code per device, skipping outputs that are already current.
+
+        Args:
+            server_ip (str): The server address.
+            devices (list): See build_profiles.
+
+        Returns:
+            tuple: (list of profiles, number of QR codes rendered).
+        """
+        profiles = self.build_profiles(server_ip, devices)
+        os.makedirs(self.output_dir, exist_ok=True)
+        manifest = self._load_manifest()
+        pending = [profile for profile in profiles
+                   if manifest.get(profile['file']) != self._key(profile) or not os.path.exists(profile['file'])]
+
+        if len(pending) > 1 and self.workers > 1:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=min(self.workers, len(pending))) as pool:
+                list(pool.map(_render_to_file, [p['url'] for p in pending], [self.fmt] * len(pending),
+                              [p['file'] for p in pending], chunksize=4))
+        else:
+            for profile in pending:
+                _render_to_file(profile['url'], self.fmt, profile['file'])
+
+        manifest = {profile['file']: self._key(profile) for profile in profiles}
+        with open(os.path.join(self.output_dir, MANIFEST_FILE), 'w') as f:
+            json.dump(manifest, f, indent=4)
+        with open(os.path.join(self.output_dir, "profiles.json"), 'w') as f:
+            json.dump([{'name': p['name'], 'url': p['url'], 'qr_file': p['file']} for p in profiles], f, indent=4)
+        return profiles, len(pending)
@@ -0,0 +1,309 @@
+# provisioner.py
+#
+# This module installs and configures Shadowsocks on an instance over SSH.
+# Connections are pooled per host and retried while sshd is still coming
+# up. Each provisioning step carries a cheap check command; all checks are
+# issued at once as parallel channels over the host's single transport, and
+# only the steps whose check fails are applied. Command output is streamed
+# line by line, and several hosts can be provisioned in parallel.
+
+import base64
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.server_config import config_hash, render_server_config
+
+SERVER_CONFIG_DIR = "/etc/shadowsocks-libev"
+SERVICE_NAME = "shadowsocks-libev"
+
+
+class ProvisioningError(Exception):
+    """
+    Raised when a provisioning step exits with a non-zero status or times out.
+    """
+
+
+class ProvisioningStep:
+    """
+    A single idempotent provisioning action.
+    """
+
+    def __init__(self, name, command, check=None, rerun_on_change=False):
+        """
+        Args:
+            name (str): A short, unique step name for reporting.
+            command (str): Shell command that performs the step.
+            check (str): Shell command that exits 0 when the step is already done.
+            rerun_on_change (bool): Run the step whenever an earlier step was applied,
+                                    even if its check passes (e.g. service restarts).
+        """
+        self.name = name
+        self.command = command
+        self.check = check
+        self.rerun_on_change = rerun_on_change
+
+
+def shadowsocks_steps(ss_config):
+    """
+    Returns the steps that bring an instance to serve the given configuration.
+
+    Args:
+        ss_config (dict): The `shadowsocks` configuration section.
+    """
+    port = int(ss_config['server_port'])
+    expected_hash = config_hash(ss_config)
+    config_b64 = base64.b64encode(render_server_config(ss_config).encode('utf-8')).decode('ascii')
+    return [
+        ProvisioningStep(
+            'install',
+            "if command -v apt-get >/dev/null; then "
+            "sudo DEBIAN_FRONTEND=noninteractive apt-get update -q && "
+            "sudo DEBIAN_FRONTEND=noninteractive apt-get install -y -q shadowsocks-libev; "
+            "else sudo dnf install -y -q dnf-plugins-core && "
+            "sudo dnf copr enable -y librehat/shadowsocks && "
+            "sudo dnf install -y -q shadowsocks-libev; fi",
+            check="command -v ss-server >/dev/null",
+        ),
+        ProvisioningStep(
+            'write-config',
+            f"sudo mkdir -p {SERVER_CONFIG_DIR} && "
+            f"echo {config_b64} | base64 -d | sudo tee {SERVER_CONFIG_DIR}/config.json >/dev/null && "
+            f"echo {expected_hash} | sudo tee {SERVER_CONFIG_DIR}/config.hash >/dev/null",
+            check=f"test \"$(cat {SERVER_CONFIG_DIR}/config.hash 2>/dev/null)\" = {expected_hash}",
+        ),
+        ProvisioningStep(
+            'open-firewall',
+            f"sudo firewall-cmd --permanent --add-port={port}/tcp --add-port={port}/udp && "
+            "sudo firewall-cmd --reload",
+            check=f"! command -v firewall-cmd >/dev/null || sudo firewall-cmd --query-port={port}/tcp",
+        ),
+        ProvisioningStep(
+            'enable-service',
+            f"sudo systemctl enable {SERVICE_NAME} && sudo systemctl restart {SERVICE_NAME}",
+            check=f"systemctl is-active --quiet {SERVICE_NAME}",
+            rerun_on_change=True,
+        ),
+    ]
+
+
+class SSHSessionPool:
+    """
+    Keeps one authenticated SSH connection per host and reuses it across calls.
+    """
+
+    def __init__(self, username, key_filename, port=22, connect_timeout=10,
+                 retry_deadline=180, retry_interval=2, max_retry_interval=15):
+        """
+        Args:
+            username (str): Remote login user.
+            key_filename (str): Private key used for authentication.
+            port (int): SSH port.
+            connect_timeout (float): Timeout of a single connection attempt.
+            retry_deadline (float): Keep retrying refused/timed-out connects this long.
+            retry_interval (float): Initial delay between attempts, doubled up to `max_retry_interval`.
+        """
+        self.username = username
+        self.key_filename = key_filename
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self.retry_deadline = retry_deadline
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self._clients = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, host):
+        """
+        Returns a connected SSHClient for `host`, connecting if needed.
+        """
+        with self._lock:
+            host_lock = self._locks.setdefault(host, threading.Lock())
+        with host_lock:
+            client = self._clients.get(host)
+            transport = client.get_transport() if client else None
+            if transport is None or not transport.is_active():
+                client = self._connect(host)
+                self._clients[host] = client
+            return client
+
+    def _connect(self, host):
+        """
+        Connects with exponential backoff until sshd accepts or the deadline passes.
+        """
+        # Imported here: commands that never open SSH (cloud-init bootstrap,
+        # status, stop) should not pay for loading paramiko.
+        import paramiko
+
+        deadline = time.monotonic() + self.retry_deadline
+        interval = self.retry_interval
+        while True:
+            client = paramiko.SSHClient()
+            client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            try:
+                client.connect(
+                    host,
+                    port=self.port,
+                    username=self.username,
+                    key_filename=self.key_filename,
+                    timeout=self.connect_timeout,
+                    banner_timeout=self.connect_timeout,
+                    auth_timeout=self.connect_timeout,
+                    allow_agent=False,
+                    look_for_keys=False,
+                )
+                return client
+            except (socket.error, paramiko.SSHException, EOFError) as e:
+                client.close()
+                if isinstance(e, paramiko.AuthenticationException) or time.monotonic() + interval > deadline:
+                    raise
+                time.sleep(interval)
+                interval = min(interval * 2, self.max_retry_interval)
+
+    def close(self, host):
+        """
+        Closes and forgets the connection to `host`.
+        """
+        client = self._clients.pop(host, None)
+        if client:
+            client.close()
+
+    def close_all(self):
+        """
+        Closes every pooled connection.
+        """
+        for host in list(self._clients):
+            self.close(host)
+
+
+class Provisioner:
+    """
+    Runs provisioning steps on one or more hosts through an SSHSessionPool.
+    """
+
+    def __init__(self, pool, on_output=None, command_timeout=900):
+        """
+        Args:
+            pool (SSHSessionPool): Source of SSH connections.
+            on_output (callable): Called as on_output(host, stream, line) for every
+                                  output line; stream is 'stdout' or 'stderr'.
+            command_timeout (float): Upper bound for a single remote command.
+        """
+        self.pool = pool
+        self.on_output = on_output or (lambda host, stream, line: None)
+        self.command_timeout = command_timeout
+
+    def provision(self, host, steps):
+        """
+        Applies the steps on `host`, skipping those whose check already passes.
+
+        Returns:
+            dict: 'host', 'applied' and 'skipped' step names and 'duration' in seconds.
+
+        Raises:
+            ProvisioningError: If a step's command fails.
+        """
+        started = time.monotonic()
+        transport = self.pool.get(host).get_transport()
+        done = self._run_checks(host, transport, steps)
+
+        applied, skipped = [], []
+        for step in steps:
+            if done[step.name] and not (step.rerun_on_change and applied):
+                skipped.append(step.name)
+                continue
+            exit_status = self._wait(host, self._open(transport, step.command))
+            if exit_status != 0:
+                raise ProvisioningError(f"Step '{step.name}' failed on {host} with exit status {exit_status}.")
+            applied.append(step.name)
+        return {'host': host, 'applied': applied, 'skipped': skipped, 'duration': time.monotonic() - started}
+
+    def provision_many(self, hosts, steps, max_workers=8):
+        """
+        Provisions several hosts in parallel.
+
+        Returns:
+            dict: Maps each host to its result dict, or to the exception it raised.
+        """
+        results = {}
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(hosts)))) as executor:
+            futures = {host: executor.submit(self.provision, host, steps) for host in hosts}
+            for host, future in futures.items():
+                try:
+                    results[host] = future.result()
+                except Exception as e:
+                    results[host] = e
+        return results
+
+    def _run_checks(self, host, transport, steps):
+        """
+        Issues every check at once on separate channels and collects the outcomes.
+        """
+        channels = {step.name: self._open(transport, step.check) for step in steps if step.check}
+        try:
+            return {
+                step.name: step.name in channels and self._wait(host, channels[step.name], quiet=True) == 0
+                for step in steps
+            }
+        except ProvisioningError:
+            for channel in channels.values():
+                channel.close()
+            raise
+
+    def _open(self, transport, command):
+        """
+        Starts `command` on a new channel of the shared transport.
+        """
+        channel = transport.open_session()
+        channel.settimeout(self.command_timeout)
+        channel.exec_command(command)
+        return channel
+
+    def _wait(self, host, channel, quiet=False):
+        """
+        Streams a channel's output until the command exits and returns its status.
+
+        Raises:
+            ProvisioningError: If the command is still running after `command_timeout`
+                               (e.g. blocked on the package manager lock).
+        """
+        # The channel timeout only bounds blocking reads; this loop polls.
+        deadline = time.monotonic() + self.command_timeout
+        buffers = {'stdout': b'', 'stderr': b''}
+        readers = {'stdout': channel.recv, 'stderr': channel.recv_stderr}
+        ready = {'stdout': channel.recv_ready, 'stderr': channel.recv_stderr_ready}
+        while True:
+            received = False
+            for stream in ('stdout', 'stderr'):
+                if ready[stream]():
+                    chunk = readers[stream](32768)
+                    received = received or bool(chunk)
+                    buffers[stream] = self._emit(host, stream, buffers[stream] + chunk, quiet)
+            if not received and channel.exit_status_ready() \
+                    and not channel.recv_ready() and not channel.recv_stderr_ready():
+                break
+            if not received:
+                if time.monotonic() >= deadline:
+                    channel.close()
+                    raise ProvisioningError(
+                        f"Command on {host} did not finish within {self.command_timeout}s."
+                    )
+                time.sleep(0.01)
+        for stream, rest in buffers.items():
+            if rest and not quiet:
+                self.on_output(host, stream, rest.decode('utf-8', 'replace'))
+        exit_status = channel.recv_exit_status()
+        channel.close()
+        return exit_status
+
+    def _emit(self, host, stream, data, quiet):
+        """
+        Reports complete lines and returns the unfinished remainder.
+        """
+        *lines, rest = data.split(b'\n')
+        if not quiet:
+            for line in lines:
+                self.on_output(host, stream, line.decode('utf-8', 'replace'))
+        return rest
@@ -0,0 +1,355 @@
+# proxy_bench.py
+#
+# This module benchmarks the local SOCKS5 proxy. It speaks SOCKS5 and a
+# minimal HTTP/1.1 directly over sockets, so every phase can be timed on
+# its own: proxy connect (TCP + SOCKS handshake + CONNECT), time to first
+# byte, and sustained download/upload throughput. Several streams run
+# concurrently and the results are summarised as percentiles in a JSON
+# document that can be compared against a previous run.
+
+import datetime
+import json
+import math
+import socket
+import ssl
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+RECV_SIZE = 65536
+
+
+class BenchError(Exception):
+    """
+    Raised when the proxy or target misbehaves during a measurement.
+    """
+
+
+def socks5_connect(proxy_host, proxy_port, dest_host, dest_port, timeout=10):
+    """
+    Opens a TCP connection to `dest_host:dest_port` through a SOCKS5 proxy.
+
+    The destination name is resolved by the proxy (socks5h semantics).
+
+    Returns:
+        socket.socket: The connected socket.
+    """
+    sock = socket.create_connection((proxy_host, proxy_port), timeout=timeout)
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.sendall(b'\x05\x01\x00')
+        if _recv_exact(sock, 2) != b'\x05\x00':
+            raise BenchError("SOCKS5 proxy refused the no-authentication method.")
+        host = dest_host.encode('idna')
+        sock.sendall(b'\x05\x01\x00\x03' + bytes([len(host)]) + host + struct.pack('!H', dest_port))
+        version, reply, _, address_type = _recv_exact(sock, 4)
+        if reply != 0:
+            raise BenchError(f"SOCKS5 CONNECT failed with reply code {reply}.")
+        if address_type == 1:
+            _recv_exact(sock, 4 + 2)
+        elif address_type == 4:
+            _recv_exact(sock, 16 + 2)
+        else:
+            _recv_exact(sock, _recv_exact(sock, 1)[0] + 2)
+        return sock
+    except BaseException:
+        sock.close()
+        raise
+
+
+def _recv_exact(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise BenchError("Connection closed unexpectedly.")
+        data += chunk
+    return data
+
+
+def _open(url, proxy_host, proxy_port, timeout):
+    """
+    Connects to the URL's origin through the proxy, adding TLS for https.
+    """
+    parts = urlsplit(url)
+    port = parts.port or (443 if parts.scheme == 'https' else 80)
+    sock = socks5_connect(proxy_host, proxy_port, parts.hostname, port, timeout)
+    if parts.scheme == 'https':
+        sock = ssl.create_default_context().wrap_socket(sock, server_hostname=parts.hostname)
+    return sock, parts
+
+
+class _ResponseReader:
+    """
+    Buffers a response socket for line reads and counts the body bytes it skips.
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.buffer = bytearray()
+        self.first_byte_at = None
+
+    def _recv(self, size=RECV_SIZE):
+        chunk = self.sock.recv(size)
+        if chunk and self.first_byte_at is None:
+            self.first_byte_at = time.perf_counter()
+        return chunk
+
+    def read_line(self, what):
+        """
+        Returns the bytes up to the next CRLF, which is consumed.
+        """
+        while b'\r\n' not in self.buffer:
+            chunk = self._recv()
+            if not chunk:
+                raise BenchError(f"Connection closed before the {what} was complete.")
+            self.buffer += chunk
+        end = self.buffer.index(b'\r\n')
+        line = bytes(self.buffer[:end])
+        del self.buffer[:end + 2]
+        return line
+
+    def skip(self, size):
+        """
+        Discards exactly `size` body bytes.
+        """
+        taken = min(size, len(self.buffer))
+        del self.buffer[:taken]
+        remaining = size - taken
+        while remaining > 0:
+            chunk = self._recv(min(RECV_SIZE, remaining))
+            if not chunk:
+                raise BenchError("Connection closed before the response body was complete.")
+            remaining -= len(chunk)
+        return size
+
+    def skip_to_eof(self):
+        """
+        Discards everything until the server closes the connection.
+        """
+        received = len(self.buffer)
+        self.buffer.clear()
+        while True:
+            chunk = self._recv()
+            if not chunk:
+                return received
+            received += len(chunk)
+
+
+def _read_response(sock):
+    """
+    Reads an HTTP response, returning (status, body_bytes, first_byte_time).
+
+    The body may be delimited by Content-Length, chunked, or (as requests
+    are sent with "Connection: close") run until the connection closes.
+    """
+    reader = _ResponseReader(sock)
+    status = int(reader.read_line("response headers").decode('iso-8859-1').split()[1])
+    headers = {}
+    while True:
+        line = reader.read_line("response headers").decode('iso-8859-1')
+        if not line:
+            break
+        key, _, value = line.partition(':')
+        headers[key.strip().lower()] = value.strip()
+
+    if status in (204, 304):
+        received = 0
+    elif headers.get('transfer-encoding', '').lower().endswith('chunked'):
+        received = 0
+        while True:
+            size = int(reader.read_line("chunked body").split(b';')[0], 16)
+            if size == 0:
+                while reader.read_line("chunked trailer"):
+                    pass
+                break
+            received += reader.skip(size)
+            reader.read_line("chunked body")
+    elif 'content-length' in headers:
+        received = reader.skip(int(headers['content-length']))
+    else:
+        received = reader.skip_to_eof()
+    return status, received, reader.first_byte_at
+
+
+def _request_target(parts):
+    """
+    Returns the path and query of a split URL for the request line.
+    """
+    path = parts.path or '/'
+    if parts.query:
+        path += '?' + parts.query
+    return path
+
+
+def measure_download(url, proxy_host, proxy_port, timeout=30):
+    """
+    Performs one GET through the proxy.
+
+    Returns:
+        dict: 'connect', 'ttfb' and 'transfer' seconds and 'bytes' received.
+    """
+    started = time.perf_counter()
+    sock, parts = _open(url, proxy_host, proxy_port, timeout)
+    try:
+        connected = time.perf_counter()
+        sock.sendall(f"GET {_request_target(parts)} HTTP/1.1\r\nHost: {parts.netloc}\r\nConnection: close\r\n\r\n".encode('ascii'))
+        sent = time.perf_counter()
+        status, received, first_byte_at = _read_response(sock)
+        finished = time.perf_counter()
+    finally:
+        sock.close()
+    if status >= 400:
+        raise BenchError(f"GET {url} returned HTTP {status}.")
+    return {
+        'connect': connected - started,
+        'ttfb': first_byte_at - sent,
+        'transfer': finished - first_byte_at,
+        'bytes': received,
+    }
+
+
+def measure_upload(url, proxy_host, proxy_port, size, timeout=30):
+    """
+    POSTs `size` bytes through the proxy.
+
+    Returns:
+        dict: 'connect' and 'transfer' seconds and 'bytes' sent.
+    """
+    payload = memoryview(bytes(min(size, RECV_SIZE)))
+    started = time.perf_counter()
+    sock, parts = _open(url, proxy_host, proxy_port, timeout)
+    try:
+        connected = time.perf_counter()
+        sock.sendall((f"POST {_request_target(parts)} HTTP/1.1\r\nHost: {parts.netloc}\r\n"
+                      f"Content-Type: application/octet-stream\r\nContent-Length: {size}\r\n"
+                      f"Connection: close\r\n\r\n").encode('ascii'))
+        remaining = size
+        while remaining > 0:
+            chunk = payload[:min(remaining, len(payload))]
+            sock.sendall(chunk)
+            remaining -= len(chunk)
+        status, _, _ = _read_response(sock)
+        finished = time.perf_counter()
+    finally:
+        sock.close()
+    if status >= 400:
+        raise BenchError(f"POST {url} returned HTTP {status}.")
+    return {'connect': connected - started, 'transfer': finished - connected, 'bytes': size}
+
+
+def percentiles(values):
+    """
+    Summarises samples with nearest-rank p50/p95/p99, mean, min and max.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+
+    def rank(p):
+        return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+    return {
+        'p50': rank(50),
+        'p95': rank(95),
+        'p99': rank(99),
+        'mean': sum(ordered) / len(ordered),
+        'min': ordered[0],
+        'max': ordered[-1],
+    }
+
+
+def run_benchmark(download_url, proxy_host='127.0.0.1', proxy_port=1080, streams=4, requests_per_stream=5,
+                  upload_url=None, upload_bytes=1 << 20, timeout=30):
+    """
+    Runs concurrent download (and optionally upload) streams through the proxy.
+
+    Returns:
+        dict: JSON-serialisable results with latency percentiles in milliseconds
+              and throughput in megabits per second.
+    """
+    def stream():
+        samples = {'download': [], 'upload': [], 'errors': []}
+        for _ in range(requests_per_stream):
+            try:
+                samples['download'].append(measure_download(download_url, proxy_host, proxy_port, timeout))
+                if upload_url:
+                    samples['upload'].append(measure_upload(upload_url, proxy_host, proxy_port, upload_bytes, timeout))
+            except (OSError, BenchError) as e:
+                samples['errors'].append(str(e))
+        return samples
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=streams) as executor:
+        results = list(executor.map(lambda _: stream(), range(streams)))
+    wall = time.perf_counter() - started
+
+    downloads = [s for r in results for s in r['download']]
+    uploads = [s for r in results for s in r['upload']]
+    errors = [e for r in results for e in r['errors']]
+
+    def ms(samples, key):
+        summary = percentiles([s[key] * 1000 for s in samples])
+        return {k: round(v, 3) for k, v in summary.items()} if summary else None
+
+    def mbps(samples):
+        transferred = sum(s['bytes'] for s in samples)
+        busy = sum(s['transfer'] for s in samples)
+        return round(transferred * 8 / busy / 1e6, 3) if busy > 0 else None
+
+    return {
+        'timestamp': datetime.datetime.now().isoformat(),
+        'proxy': f"{proxy_host}:{proxy_port}",
+        'download_url': download_url,
+        'upload_url': upload_url,
+        'streams': streams,
+        'requests_per_stream': requests_per_stream,
+        'requests': len(downloads) + len(uploads),
+        'errors': len(errors),
+        'error_samples': errors[:5],
+        'wall_seconds': round(wall, 3),
+        'connect_ms': ms(downloads + uploads, 'connect'),
+        'ttfb_ms': ms(downloads, 'ttfb'),
+        'download_mbps': mbps(downloads),
+        'upload_mbps': mbps(uploads),
+        'aggregate_mbps': round(sum(s['bytes'] for s in downloads + uploads) * 8 / wall / 1e6, 3) if wall else None,
+    }
+
+
+def compare_results(baseline, current, tolerance=0.2):
+    """
+    Compares two benchmark results.
+
+    Args:
+        baseline (dict): An earlier `run_benchmark` result.
+        current (dict): The result to check.
+        tolerance (float): Allowed relative regression (0.2 = 20%).
+
+    Returns:
+        list: Human-readable descriptions of every metric that regressed.
+    """
+    regressions = []
+    for metric in ('connect_ms', 'ttfb_ms'):
+        for stat in ('p50', 'p95', 'p99'):
+            before = (baseline.get(metric) or {}).get(stat)
+            after = (current.get(metric) or {}).get(stat)
+            if before and after and after > before * (1 + tolerance):
+                regressions.append(f"{metric}.{stat} rose from {before:.3f} to {after:.3f}")
+    for metric in ('download_mbps', 'upload_mbps'):
+        before, after = baseline.get(metric), current.get(metric)
+        if before and after is not None and after < before * (1 - tolerance):
+            regressions.append(f"{metric} fell from {before:.3f} to {after:.3f}")
+    if current.get('errors', 0) > baseline.get('errors', 0):
+        regressions.append(f"errors rose from {baseline.get('errors', 0)} to {current['errors']}")
+    return regressions
+
+
+def save_results(results, path):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=4)
+
+
+def load_results(path):
+    with open(path, 'r') as f:
+        return json.load(f)
@@ -0,0 +1,165 @@
+# public_ip.py
+#
+# This module detects the machine's public IP address. Several HTTP
+# resolvers are queried concurrently and the first answer confirmed by
+# enough of them wins, so one slow or broken service cannot stall `start`.
+# Without that agreement detection fails rather than trusting one answer,
+# since the address is what the security list is opened to.
+# Results are cached on disk for a short TTL because every CLI invocation
+# is a fresh process.
+
+import ipaddress
+import json
+import os
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
+
+import requests
+
+DEFAULT_RESOLVERS = {
+    4: [
+        'https://api.ipify.org',
+        'https://ipv4.icanhazip.com',
+        'https://checkip.amazonaws.com',
+    ],
+    6: [
+        'https://api6.ipify.org',
+        'https://ipv6.icanhazip.com',
+    ],
+}
+
+
+class PublicIPDetector:
+    """
+    Races configurable resolvers for the public IP and caches the answer.
+    """
+
+    def __init__(self, resolvers=None, timeout=3, quorum=1, cache_path="public_ip_cache.json",
+                 ttl_seconds=120, clock=time.time):
+        """
+        Args:
+            resolvers (dict): Maps IP version (4 or 6) to resolver URLs returning the
+                              caller's address as plain text.
+            timeout (float): Overall time budget for one detection.
+            quorum (int): Number of resolvers that must agree on the address.
+            cache_path (str): File caching detected addresses; None disables it.
+            ttl_seconds (float): How long a cached address is reused.
+            clock (callable): Wall-clock time source, injectable for tests.
+        """
+        self.resolvers = resolvers or DEFAULT_RESOLVERS
+        self.timeout = timeout
+        self.quorum = quorum
+        self.cache_path = cache_path
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._cache = None
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Builds a detector from the optional `public_ip` configuration section.
+        """
+        resolvers = dict(DEFAULT_RESOLVERS)
+        if config.get('resolvers_v4'):
+            resolvers[4] = config['resolvers_v4']
+        if config.get('resolvers_v6'):
+            resolvers[6] = config['resolvers_v6']
+        return cls(
+            resolvers=resolvers,
+            timeout=config.get('timeout', 3),
+            quorum=config.get('quorum', 1),
+            ttl_seconds=config.get('cache_ttl_seconds', 120),
+        )
+
+    def detect(self, version=4, use_cache=True):
+        """
+        Returns the public IP address for the given IP version.
+
+        Raises:
+            Exception: If no resolver produced a valid address in time.
+        """
+        if use_cache:
+            cached = self._cached(version)
+            if cached:
+                return cached
+        ip = self._race(version)
+        self._store(version, ip)
+        return ip
+
+    def _race(self, version):
+        """
+        Queries all resolvers at once and returns the first address reaching quorum.
+
+        Raises:
+            Exception: If no address reached quorum in time.
+        """
+        urls = self.resolvers.get(version) or []
+        if not urls:
+            raise Exception(f"No public IP resolvers configured for IPv{version}.")
+        votes = Counter()
+        errors = []
+        executor = ThreadPoolExecutor(max_workers=len(urls))
+        try:
+            futures = [executor.submit(self._query, url, version) for url in urls]
+            for future in as_completed(futures, timeout=self.timeout):
+                try:
+                    ip = future.result()
+                except Exception as e:
+                    errors.append(str(e))
+                    continue
+                votes[ip] += 1
+                if votes[ip] >= min(self.quorum, len(urls)):
+                    return ip
+        except FuturesTimeout:
+            errors.append(f"timed out after {self.timeout}s")
+        finally:
+            # Do not wait for slower resolvers once an answer is known.
+            executor.shutdown(wait=False, cancel_futures=True)
+        if votes:
+            answers = ", ".join(f"{ip} ({count})" for ip, count in votes.most_common())
+            errors.insert(0, f"no address confirmed by {self.quorum} resolvers, got {answers}")
+        raise Exception(f"Could not detect public IPv{version} address: {'; '.join(errors)}")
+
+    def _query(self, url, version):
+        """
+        Fetches one resolver and validates its answer.
+        """
+        response = requests.get(url, timeout=self.timeout)
+        response.raise_for_status()
+        address = ipaddress.ip_address(response.text.strip())
+        if address.version != version:
+            raise ValueError(f"{url} returned an IPv{address.version} address")
+        return str(address)
+
+    def _load_cache(self):
+        if self._cache is None:
+            self._cache = {}
+            if self.cache_path:
+                try:
+                    with open(self.cache_path, 'r') as f:
+                        self._cache = json.load(f)
+                except (FileNotFoundError, ValueError):
+                    pass
+        return self._cache
+
+    def _cached(self, version):
+        """
+        Returns the cached address for `version` if it is within the TTL.
+        """
+        entry = self._load_cache().get(str(version))
+        if entry and self.clock() - entry['detected_at'] < self.ttl_seconds:
+            return entry['ip']
+        return None
+
+    def _store(self, version, ip):
+        """
+        Records a freshly detected address in memory and on disk.
+        """
+        cache = self._load_cache()
+        cache[str(version)] = {'ip': ip, 'detected_at': self.clock()}
+        if self.cache_path:
+            tmp_path = f"{self.cache_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(cache, f)
+            os.replace(tmp_path, self.cache_path)
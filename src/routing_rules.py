@@ -0,0 +1,477 @@
+# routing_rules.py
+#
+# This module compiles the selective-routing rules (routing.rules_file) into
+# lookup structures and renders them as a PAC file.
+#
+# Rules file format (YAML):
+#
+#   proxy_domains: ["*.openai.com", "chat.example.org", "api-*.example.net"]
+#   direct_domains: ["*.cn"]
+#   proxy_cidrs: ["203.0.113.0/24"]
+#   direct_cidrs: ["10.0.0.0/8", "192.168.0.0/16"]
+#   proxy_lists: ["lists/blocked.txt"]   # plain text, one domain or CIDR per line
+#   direct_lists: ["lists/china_ip.txt"] # (GeoIP-style exports work as-is)
+#   default_action: "DIRECT"             # or "PROXY"
+#
+# "*.example.com" and ".example.com" match example.com and every subdomain,
+# a bare name matches only itself, and any other pattern containing "*" or
+# "?" is a shell-style glob. Exact names beat suffixes, longer suffixes beat
+# shorter ones, and globs are only tried when neither matched. When the same
+# entry appears in both a proxy and a direct list, PROXY wins.
+#
+# Domains live in a trie keyed by reversed labels, so a lookup costs one
+# dict step per label regardless of the rule count. CIDRs are flattened into
+# sorted, disjoint intervals (more specific prefixes win) and found with a
+# binary search. The PAC file carries the same structures: a hash of exact
+# and "*.suffix" keys probed once per label, and sorted interval arrays for
+# IPv4 (as numbers) and IPv6 (as fixed-width hex strings, which compare in
+# address order).
+#
+# CIDR rules apply to IP literals only. Host names are never resolved, by
+# RuleSet.match nor by the PAC file (no dnsResolve, which would block the
+# browser on every request), so both route a name by the domain rules alone.
+
+import bisect
+import fnmatch
+import ipaddress
+import json
+import os
+import re
+import time
+
+import yaml
+
+PROXY = 'PROXY'
+DIRECT = 'DIRECT'
+ACTIONS = (PROXY, DIRECT)
+
+_EXACT = '$exact'
+_SUFFIX = '$suffix'
+
+
+class RuleError(Exception):
+    """
+    Raised when a rules file or entry cannot be compiled.
+    """
+
+
+class DomainTrie:
+    """
+    Exact and suffix domain rules keyed by reversed labels.
+    """
+
+    def __init__(self):
+        self.root = {}
+        self.count = 0
+
+    def add(self, domain, action, suffix):
+        node = self.root
+        for label in reversed(domain.split('.')):
+            node = node.setdefault(label, {})
+        node[_SUFFIX if suffix else _EXACT] = action
+        self.count += 1
+
+    def lookup(self, host):
+        """
+        Returns the action of the exact or longest suffix rule matching `host`, or None.
+        """
+        node = self.root
+        action = None
+        for label in reversed(host.split('.')):
+            node = node.get(label)
+            if node is None:
+                return action
+            action = node.get(_SUFFIX, action)
+        return node.get(_EXACT, action)
+
+    def items(self):
+        """
+        Yields (domain, action, suffix) for every rule.
+        """
+        stack = [(self.root, [])]
+        while stack:
+            node, labels = stack.pop()
+            domain = '.'.join(reversed(labels))
+            if _EXACT in node:
+                yield domain, node[_EXACT], False
+            if _SUFFIX in node:
+                yield domain, node[_SUFFIX], True
+            for label, child in node.items():
+                if not label.startswith('$'):
+                    stack.append((child, labels + [label]))
+
+
+class IntervalMap:
+    """
+    Disjoint, sorted address intervals mapped to actions.
+    """
+
+    def __init__(self, version):
+        self.version = version
+        self.starts = []
+        self.ends = []
+        self.actions = []
+
+    @classmethod
+    def build(cls, networks, version):
+        """
+        Flattens (network, action) pairs; a longer prefix overrides the ranges it overlaps.
+        """
+        result = cls(version)
+        for network, action in sorted(networks, key=lambda item: item[0].prefixlen):
+            result._paint(int(network.network_address), int(network.broadcast_address), action)
+        result._merge()
+        return result
+
+    def _paint(self, start, end, action):
+        starts, ends, actions = self.starts, self.ends, self.actions
+        i = bisect.bisect_right(ends, start - 1)
+        j = i
+        pieces = []
+        while j < len(starts) and starts[j] <= end:
+            if starts[j] < start:
+                pieces.append((starts[j], start - 1, actions[j]))
+            if ends[j] > end:
+                pieces.append((end + 1, ends[j], actions[j]))
+            j += 1
+        pieces.append((start, end, action))
+        pieces.sort()
+        starts[i:j] = [p[0] for p in pieces]
+        ends[i:j] = [p[1] for p in pieces]
+        actions[i:j] = [p[2] for p in pieces]
+
+    def _merge(self):
+        starts, ends, actions = [], [], []
+        for start, end, action in zip(self.starts, self.ends, self.actions):
+            if starts and actions[-1] == action and ends[-1] + 1 == start:
+                ends[-1] = end
+            else:
+                starts.append(start)
+                ends.append(end)
+                actions.append(action)
+        self.starts, self.ends, self.actions = starts, ends, actions
+
+    def lookup(self, address):
+        i = bisect.bisect_right(self.starts, address) - 1
+        if i >= 0 and address <= self.ends[i]:
+            return self.actions[i]
+        return None
+
+    def __len__(self):
+        return len(self.starts)
+
+
+class RuleSet:
+    """
+    A compiled set of routing rules.
+    """
+
+    def __init__(self, default_action=DIRECT):
+        self.default_action = default_action
+        self.domains = DomainTrie()
+        self.globs = []
+        self.ipv4 = IntervalMap(4)
+        self.ipv6 = IntervalMap(6)
+        self._networks = []
+        self._glob_regex = None
+
+    def match(self, host):
+        """
+        Returns PROXY or DIRECT for a host name or IP literal.
+        """
+        host = host.strip().lower().rstrip('.')
+        address = None
+        # Only hosts that can be IP literals pay for parsing one.
+        if host[-1:].isdigit() or ':' in host:
+            try:
+                address = ipaddress.ip_address(host.strip('[]'))
+            except ValueError:
+                pass
+        if address is not None:
+            table = self.ipv4 if address.version == 4 else self.ipv6
+            return table.lookup(int(address)) or self.default_action
+        action = self.domains.lookup(host)
+        if action is None and self._glob_regex is not None:
+            found = self._glob_regex.match(host)
+            if found:
+                # Group names are "g<action index>_<rule index>".
+                action = ACTIONS[int(found.lastgroup[1:].split('_')[0])]
+        return action or self.default_action
+
+    def add(self, entry, action):
+        """
+        Adds one domain, wildcard or CIDR entry.
+        """
+        entry = entry.strip().lower()
+        if not entry:
+            return
+        if '/' in entry or _looks_like_ip(entry):
+            try:
+                network = ipaddress.ip_network(entry, strict=False)
+            except ValueError:
+                raise RuleError(f"Invalid CIDR '{entry}'.")
+            self._networks.append((network, action))
+        elif entry.startswith('*.') or entry.startswith('.'):
+            self.domains.add(entry.lstrip('*').lstrip('.'), action, suffix=True)
+        elif '*' in entry or '?' in entry:
+            self.globs.append((entry, action))
+        else:
+            self.domains.add(entry.rstrip('.'), action, suffix=False)
+
+    def finalize(self):
+        """
+        Builds the interval tables and the combined glob expression.
+        """
+        self.ipv4 = IntervalMap.build([n for n in self._networks if n[0].version == 4], 4)
+        self.ipv6 = IntervalMap.build([n for n in self._networks if n[0].version == 6], 6)
+        self._glob_regex = None
+        # The first matching glob decides, here and in the PAC file, so proxy
+        # globs go first (stable, keeping file order within each action).
+        self.globs.sort(key=lambda glob: glob[1] != PROXY)
+        if self.globs:
+            self._glob_regex = re.compile('|'.join(
+                f"(?P<g{ACTIONS.index(action)}_{i}>{fnmatch.translate(pattern)})"
+                for i, (pattern, action) in enumerate(self.globs)
+            ))
+        return self
+
+    def stats(self):
+        return {
+            'domains': self.domains.count,
+            'globs': len(self.globs),
+            'ipv4_intervals': len(self.ipv4),
+            'ipv6_intervals': len(self.ipv6),
+        }
+
+
+def _looks_like_ip(entry):
+    try:
+        ipaddress.ip_address(entry)
+        return True
+    except ValueError:
+        return False
+
+
+def _read_list(path):
+    """
+    Yields the entries of a plain-text list, skipping blanks and '#' comments.
+    """
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if line:
+                yield line
+
+
+def load_rules(rules_file):
+    """
+    Reads a rules file and returns (rules dict, list of all input files).
+
+    List paths are resolved relative to the rules file.
+    """
+    with open(rules_file, 'r') as f:
+        rules = yaml.safe_load(f) or {}
+    base_dir = os.path.dirname(rules_file)
+    for key in ('proxy_lists', 'direct_lists'):
+        rules[key] = [os.path.join(base_dir, path) for path in rules.get(key) or []]
+    return rules, [rules_file] + rules['proxy_lists'] + rules['direct_lists']
+
+
+def compile_rules(rules):
+    """
+    Compiles a rules dict (see the module header) into a RuleSet.
+
+    Raises:
+        RuleError: On an unknown default action or an invalid entry.
+    """
+    default_action = str(rules.get('default_action', DIRECT)).upper()
+    if default_action not in ACTIONS:
+        raise RuleError(f"default_action must be PROXY or DIRECT, not '{default_action}'.")
+    ruleset = RuleSet(default_action)
+    for action, prefix in ((DIRECT, 'direct'), (PROXY, 'proxy')):
+        for entry in (rules.get(f'{prefix}_domains') or []) + (rules.get(f'{prefix}_cidrs') or []):
+            ruleset.add(str(entry), action)
+        for path in rules.get(f'{prefix}_lists') or []:
+            for entry in _read_list(path):
+                ruleset.add(entry, action)
+    return ruleset.finalize()
+
+
+_PAC_TEMPLATE = """// Generated by oci-shadowsocks; do not edit.
+var ACTIONS = %(actions)s;
+var DEFAULT = %(default)d;
+var DOMAINS = %(domains)s;
+var GLOBS = %(globs)s;
+var V4_START = %(v4_start)s;
+var V4_END = %(v4_end)s;
+var V4_ACTION = %(v4_action)s;
+var V6_START = %(v6_start)s;
+var V6_END = %(v6_end)s;
+var V6_ACTION = %(v6_action)s;
+var hasOwn = Object.prototype.hasOwnProperty;
+
+function ipv4ToInt(ip) {
+    var p = ip.split(".");
+    return ((+p[0]) * 16777216) + ((+p[1]) << 16) + ((+p[2]) << 8) + (+p[3]);
+}
+
+function ipv6ToHex(ip) {
+    ip = ip.replace(/^\\[|\\]$/g, "");
+    var v4 = /^(.*:)(\\d+\\.\\d+\\.\\d+\\.\\d+)$/.exec(ip);
+    if (v4) {
+        var n = ipv4ToInt(v4[2]);
+        ip = v4[1] + Math.floor(n / 65536).toString(16) + ":" + (n & 65535).toString(16);
+    }
+    var halves = ip.split("::");
+    if (halves.length > 2) { return null; }
+    var head = halves[0] ? halves[0].split(":") : [];
+    var tail = halves.length == 2 && halves[1] ? halves[1].split(":") : [];
+    var fill = 8 - head.length - tail.length;
+    if (halves.length == 1 ? fill != 0 : fill < 1) { return null; }
+    var groups = head.concat(new Array(fill + 1).join("0,").split(",").slice(0, fill), tail);
+    var hex = "";
+    for (var i = 0; i < groups.length; i++) {
+        if (!/^[0-9a-f]{1,4}$/.test(groups[i])) { return null; }
+        hex += ("000" + groups[i]).slice(-4);
+    }
+    return hex;
+}
+
+function lookupInterval(n, starts, ends, actions) {
+    var lo = 0, hi = starts.length - 1;
+    while (lo <= hi) {
+        var mid = (lo + hi) >> 1;
+        if (starts[mid] > n) { hi = mid - 1; }
+        else if (ends[mid] < n) { lo = mid + 1; }
+        else { return actions[mid]; }
+    }
+    return DEFAULT;
+}
+
+function FindProxyForURL(url, host) {
+    host = host.toLowerCase();
+    if (/^\\d+\\.\\d+\\.\\d+\\.\\d+$/.test(host)) {
+        return ACTIONS[lookupInterval(ipv4ToInt(host), V4_START, V4_END, V4_ACTION)];
+    }
+    if (host.indexOf(":") >= 0) {
+        var hex = ipv6ToHex(host);
+        if (hex !== null) {
+            return ACTIONS[lookupInterval(hex, V6_START, V6_END, V6_ACTION)];
+        }
+    }
+    if (hasOwn.call(DOMAINS, host)) {
+        return ACTIONS[DOMAINS[host]];
+    }
+    var suffix = host;
+    while (true) {
+        if (hasOwn.call(DOMAINS, "*." + suffix)) {
+            return ACTIONS[DOMAINS["*." + suffix]];
+        }
+        var dot = suffix.indexOf(".");
+        if (dot < 0) { break; }
+        suffix = suffix.substring(dot + 1);
+    }
+    for (var i = 0; i < GLOBS.length; i++) {
+        if (shExpMatch(host, GLOBS[i][0])) {
+            return ACTIONS[GLOBS[i][1]];
+        }
+    }
+    return ACTIONS[DEFAULT];
+}
+"""
+
+
+def render_pac(ruleset, proxy):
+    """
+    Renders a PAC file for the rule set.
+
+    Args:
+        ruleset (RuleSet): The compiled rules.
+        proxy (str): The PAC proxy string, e.g. "SOCKS5 127.0.0.1:1080; SOCKS 127.0.0.1:1080".
+
+    Returns:
+        str: The PAC file contents.
+    """
+    index = {PROXY: 0, DIRECT: 1}
+    domains = {}
+    for domain, action, suffix in ruleset.domains.items():
+        domains[f"*.{domain}" if suffix else domain] = index[action]
+    compact = {'separators': (',', ':')}
+    return _PAC_TEMPLATE % {
+        'actions': json.dumps([proxy, DIRECT]),
+        'default': index[ruleset.default_action],
+        'domains': json.dumps(domains, sort_keys=True, **compact),
+        'globs': json.dumps([[pattern, index[action]] for pattern, action in ruleset.globs], **compact),
+        'v4_start': json.dumps(ruleset.ipv4.starts, **compact),
+        'v4_end': json.dumps(ruleset.ipv4.ends, **compact),
+        'v4_action': json.dumps([index[a] for a in ruleset.ipv4.actions], **compact),
+        'v6_start': json.dumps([format(n, '032x') for n in ruleset.ipv6.starts], **compact),
+        'v6_end': json.dumps([format(n, '032x') for n in ruleset.ipv6.ends], **compact),
+        'v6_action': json.dumps([index[a] for a in ruleset.ipv6.actions], **compact),
+    }
+
+
+def benchmark(domain_count=50000, cidr_count=10000, lookups=200000, seed=7):
+    """
+    Measures compile time and lookups per second on synthetic rules.
+
+    Returns:
+        dict: Rule counts, compile seconds, lookups/second and PAC size in bytes.
+    """
+    import random
+    rng = random.Random(seed)
+    words = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(3, 10)))
+             for _ in range(2000)]
+    tlds = ['com', 'net', 'org', 'io', 'cn', 'jp']
+    domains = {f"{rng.choice(words)}{i}.{rng.choice(tlds)}" for i in range(domain_count)}
+    rules = {
+        'proxy_domains': [f"*.{d}" for d in domains],
+        'proxy_cidrs': [f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.0/24"
+                        for _ in range(cidr_count)],
+        'default_action': DIRECT,
+    }
+    started = time.perf_counter()
+    ruleset = compile_rules(rules)
+    compile_seconds = time.perf_counter() - started
+
+    sample = list(domains)
+    hosts = [f"www.{rng.choice(sample)}" if i % 2 else f"{rng.choice(words)}.example.{rng.choice(tlds)}"
+             for i in range(lookups // 2)]
+    hosts += [f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}"
+              for _ in range(lookups - len(hosts))]
+    started = time.perf_counter()
+    for host in hosts:
+        ruleset.match(host)
+    lookup_seconds = time.perf_counter() - started
+
+    pac = render_pac(ruleset, "SOCKS5 127.0.0.1:1080")
+    return dict(ruleset.stats(), compile_seconds=round(compile_seconds, 3),
+                lookups_per_second=round(lookups / lookup_seconds),
+                pac_bytes=len(pac), pac_lookups_per_second=_benchmark_pac(pac, hosts))
+
+
+def _benchmark_pac(pac, hosts):
+    """
+    Times FindProxyForURL in node, when it is installed; returns lookups/second or None.
+    """
+    import shutil
+    import subprocess
+    import tempfile
+    if shutil.which('node') is None:
+        return None
+    script = pac + """
+function shExpMatch(s, p) { return false; }
+var hosts = %s;
+var t = process.hrtime.bigint();
+for (var i = 0; i < hosts.length; i++) { FindProxyForURL("", hosts[i]); }
+console.log(Math.round(hosts.length / (Number(process.hrtime.bigint() - t) / 1e9)));
+""" % json.dumps(hosts)
+    with tempfile.NamedTemporaryFile('w', suffix='.js') as f:
+        f.write(script)
+        f.flush()
+        result = subprocess.run(['node', f.name], capture_output=True, text=True)
+    return int(result.stdout) if result.returncode == 0 else None
+
+
+if __name__ == "__main__":
+    print(json.dumps(benchmark(), indent=4))
@@ -0,0 +1,206 @@
+# rule_cache.py
+#
+# This module keeps routing-rule compilation off the start-up path. The
+# compiled RuleSet is pickled under a hash of the rules file and every list
+# it imports, so an unchanged rule set costs one hashing pass and an
+# unpickle instead of a full compile. The PAC file records the key it was
+# generated from in its first line and is only rewritten when that key
+# changes, always through a temporary file and an atomic rename so browsers
+# never read a half-written PAC.
+#
+# RulesWatcher polls the input files' size and mtime and recompiles,
+# republishes and hands the new RuleSet to a callback when they change.
+
+import hashlib
+import os
+import pickle
+import threading
+
+from src.routing_rules import compile_rules, load_rules
+
+# Bump when RuleSet's pickled layout, the way rules compile or the PAC template changes.
+CACHE_VERSION = 3
+PAC_KEY_PREFIX = "// rules-key: "
+
+
+def inputs_digest(rules_file):
+    """
+    Hashes the rules file and all lists it imports.
+
+    Returns:
+        tuple: (hex digest, rules dict, list of input paths).
+    """
+    rules, inputs = load_rules(rules_file)
+    digest = hashlib.sha256(f"v{CACHE_VERSION}".encode('ascii'))
+    for path in inputs:
+        digest.update(path.encode('utf-8') + b'\0')
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        digest.update(b'\0')
+    return digest.hexdigest()[:24], rules, inputs
+
+
+class RuleCache:
+    """
+    An on-disk cache of compiled rule sets keyed by the content hash of their inputs.
+    """
+
+    def __init__(self, cache_dir=".rule_cache", keep=3):
+        """
+        Args:
+            cache_dir (str): Directory holding the pickled rule sets.
+            keep (int): How many most recent entries to keep on disk.
+        """
+        self.cache_dir = cache_dir
+        self.keep = keep
+        self.hits = 0
+        self.misses = 0
+        self.inputs = []
+        self._memory = {}
+
+    def compile(self, rules_file):
+        """
+        Returns the compiled rules, reusing a cached compilation when the inputs are unchanged.
+
+        Returns:
+            tuple: (RuleSet, digest, list of input paths).
+
+        Raises:
+            RuleError: If the rules cannot be compiled.
+        """
+        digest, rules, inputs = inputs_digest(rules_file)
+        ruleset = self._memory.get(digest) or self._load(digest)
+        if ruleset is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            ruleset = compile_rules(rules)
+            self._store(digest, ruleset)
+        self._memory = {digest: ruleset}
+        self.inputs = inputs
+        return ruleset, digest, inputs
+
+    def _path(self, digest):
+        return os.path.join(self.cache_dir, f"{digest}.pickle")
+
+    def _load(self, digest):
+        try:
+            with open(self._path(digest), 'rb') as f:
+                ruleset = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError, ValueError):
+            return None
+        os.utime(self._path(digest))
+        return ruleset
+
+    def _store(self, digest, ruleset):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{self._path(digest)}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(ruleset, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self._path(digest))
+        entries = sorted(
+            (os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir) if name.endswith('.pickle')),
+            key=os.path.getmtime, reverse=True
+        )
+        for stale in entries[self.keep:]:
+            os.remove(stale)
+
+
+def pac_key(digest, proxy):
+    """
+    Returns the key identifying a PAC file generated from `digest` for `proxy`.
+    """
+    return f"{digest}-{hashlib.sha256(proxy.encode('utf-8')).hexdigest()[:8]}"
+
+
+def pac_is_current(output_file, key):
+    """
+    Returns True if `output_file` was generated with `key`.
+    """
+    try:
+        with open(output_file, 'r') as f:
+            return f.readline().rstrip('\n') == PAC_KEY_PREFIX + key
+    except OSError:
+        return False
+
+
+def publish_pac(pac, key, output_file):
+    """
+    Atomically replaces `output_file` with `pac`, stamped with `key`.
+    """
+    tmp_path = f"{output_file}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(PAC_KEY_PREFIX + key + "\n")
+        f.write(pac)
+    os.replace(tmp_path, output_file)
+
+
+class RulesWatcher:
+    """
+    Recompiles and republishes the rules whenever one of their input files changes.
+    """
+
+    def __init__(self, publish, inputs, interval=2.0, on_event=None):
+        """
+        Args:
+            publish (callable): Compiles and publishes the rules; returns the new list of input
+                paths, or None if the rules could not be compiled.
+            inputs (list): The input paths of the current rule set.
+            interval (float): Seconds between polls.
+            on_event (callable): Called with a message after every rebuild or failure.
+        """
+        self.publish = publish
+        self.inputs = list(inputs)
+        self.interval = interval
+        self.on_event = on_event or (lambda message: None)
+        self.rebuilds = 0
+        self._signature = self._stat()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _stat(self):
+        signature = []
+        for path in self.inputs:
+            try:
+                st = os.stat(path)
+                signature.append((path, st.st_mtime_ns, st.st_size))
+            except OSError:
+                signature.append((path, None, None))
+        return signature
+
+    def poll(self):
+        """
+        Checks the inputs once and rebuilds if they changed.
+
+        Returns:
+            bool: True if a rebuild happened.
+        """
+        signature = self._stat()
+        if signature == self._signature:
+            return False
+        self._signature = signature
+        inputs = self.publish()
+        if inputs is None:
+            # Keep serving the previous PAC while the file is being edited.
+            self.on_event("Routing rules not reloaded; the previous PAC file stays in place.")
+            return False
+        self.inputs = inputs
+        self._signature = self._stat()
+        self.rebuilds += 1
+        self.on_event("Routing rules changed; PAC file updated.")
+        return True
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="rules-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self.poll()
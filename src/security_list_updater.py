@@ -0,0 +1,135 @@
+# security_list_updater.py
+#
+# This module keeps the subnet's security list in sync with the client's
+# current public IP. It computes a minimal diff of the ingress rules it
+# manages (identified by their description), leaves every other rule
+# untouched, and writes the whole change in a single update guarded by the
+# list's ETag. Nothing is written when the rules are already correct.
+
+import ipaddress
+
+import oci
+
+MANAGED_RULE_DESCRIPTION = 'shadowsocks-proxy client'
+
+# IANA protocol numbers used by OCI security rules.
+PROTOCOL_TCP = '6'
+PROTOCOL_UDP = '17'
+
+
+def client_cidr(ip):
+    """
+    Returns the single-host CIDR block for an IPv4 or IPv6 address.
+    """
+    address = ipaddress.ip_address(ip)
+    return f"{address}/{address.max_prefixlen}"
+
+
+def desired_rules(cidr, port):
+    """
+    Builds the managed ingress rules allowing `cidr` to reach `port` over TCP and UDP.
+    """
+    port_range = oci.core.models.PortRange(min=port, max=port)
+    common = {'source': cidr, 'source_type': 'CIDR_BLOCK', 'description': MANAGED_RULE_DESCRIPTION}
+    return [
+        oci.core.models.IngressSecurityRule(
+            protocol=PROTOCOL_TCP,
+            tcp_options=oci.core.models.TcpOptions(destination_port_range=port_range),
+            **common
+        ),
+        oci.core.models.IngressSecurityRule(
+            protocol=PROTOCOL_UDP,
+            udp_options=oci.core.models.UdpOptions(destination_port_range=port_range),
+            **common
+        ),
+    ]
+
+
+def _rule_key(rule):
+    """
+    Returns the fields that make two managed rules equivalent.
+    """
+    options = rule.tcp_options if rule.protocol == PROTOCOL_TCP else rule.udp_options
+    port_range = options.destination_port_range if options else None
+    ports = (port_range.min, port_range.max) if port_range else None
+    return rule.protocol, rule.source, ports
+
+
+def diff_ingress_rules(current_rules, wanted_rules):
+    """
+    Computes the ingress rule list after replacing the managed rules.
+
+    Args:
+        current_rules (list): The security list's existing ingress rules.
+        wanted_rules (list): The managed rules that should exist.
+
+    Returns:
+        tuple: (rules, added, removed) where `rules` is the complete new list and
+               `added`/`removed` are the managed rules that changed.
+    """
+    wanted = {_rule_key(rule): rule for rule in wanted_rules}
+    rules, removed, present = [], [], set()
+    for rule in current_rules:
+        if rule.description != MANAGED_RULE_DESCRIPTION:
+            rules.append(rule)
+            continue
+        key = _rule_key(rule)
+        if key in wanted and key not in present:
+            present.add(key)
+            rules.append(rule)
+        else:
+            removed.append(rule)
+    added = [rule for key, rule in wanted.items() if key not in present]
+    return rules + added, added, removed
+
+
+class SecurityListUpdater:
+    """
+    Applies managed ingress rule changes to one security list.
+    """
+
+    def __init__(self, networking_client, max_attempts=3):
+        """
+        Args:
+            networking_client: The OCI virtual network client.
+            max_attempts (int): How often to retry when another writer changed the list.
+        """
+        self.networking_client = networking_client
+        self.max_attempts = max_attempts
+
+    def update(self, security_list_id, client_ip, port, prefetched=None):
+        """
+        Allows `client_ip` on `port` and removes stale managed rules.
+
+        Args:
+            security_list_id (str): The security list to update.
+            client_ip (str): The client's public IP address.
+            port (int): The Shadowsocks server port.
+            prefetched (tuple): An already fetched (SecurityList, etag) pair to use
+                                for the first attempt.
+
+        Returns:
+            dict: 'changed', 'added' and 'removed' counts.
+        """
+        wanted = desired_rules(client_cidr(client_ip), int(port))
+        for attempt in range(self.max_attempts):
+            if attempt == 0 and prefetched is not None:
+                security_list, etag = prefetched
+            else:
+                response = self.networking_client.get_security_list(security_list_id)
+                security_list, etag = response.data, response.headers.get('etag')
+
+            rules, added, removed = diff_ingress_rules(security_list.ingress_security_rules or [], wanted)
+            if not added and not removed:
+                return {'changed': False, 'added': 0, 'removed': 0}
+            try:
+                self.networking_client.update_security_list(
+                    security_list_id,
+                    oci.core.models.UpdateSecurityListDetails(ingress_security_rules=rules),
+                    if_match=etag
+                )
+                return {'changed': True, 'added': len(added), 'removed': len(removed)}
+            except oci.exceptions.ServiceError as e:
+                # 412: somebody else updated the list since we read it; re-read and retry.
+                if e.status != 412 or attempt == self.max_attempts - 1:
+                    raise
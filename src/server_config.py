@@ -0,0 +1,47 @@
+# server_config.py
+#
+# This module derives the Shadowsocks server-side configuration from the
+# `shadowsocks` section of config.yaml and fingerprints it, so an instance
+# that already runs the same configuration can be reused without being
+# provisioned again.
+
+import hashlib
+import json
+
+# Freeform tag on the instance recording the hash of its installed configuration.
+CONFIG_HASH_TAG = 'ss-config-hash'
+
+
+def server_config(ss_config):
+    """
+    Builds the ss-server JSON configuration for the instance.
+
+    Args:
+        ss_config (dict): The `shadowsocks` configuration section.
+
+    Returns:
+        dict: The server configuration.
+    """
+    return {
+        "server": "0.0.0.0",
+        "server_port": int(ss_config['server_port']),
+        "password": ss_config['password'],
+        "method": ss_config['method'],
+        "timeout": 300,
+        "mode": "tcp_and_udp",
+        "fast_open": True
+    }
+
+
+def render_server_config(ss_config):
+    """
+    Renders the server configuration as canonical JSON text.
+    """
+    return json.dumps(server_config(ss_config), indent=4, sort_keys=True) + "\n"
+
+
+def config_hash(ss_config):
+    """
+    Returns a short, stable fingerprint of the server configuration.
+    """
+    return hashlib.sha256(render_server_config(ss_config).encode('utf-8')).hexdigest()[:16]
@@ -0,0 +1,294 @@
+# server_pool.py
+#
+# This module manages a pool of proxy instances kept in several regions or
+# availability domains. Each member is described by a block under
+# `pool.members` that overrides the top-level oci, compute and shadowsocks
+# sections, and gets its own project tag so every member's instance is found
+# independently.
+#
+# ServerPool resolves the members' public IPs, probes all of them concurrently
+# (median TCP connect time, plus an optional throughput probe) and picks the
+# fastest healthy one. A running pool re-evaluates on a fixed schedule and
+# hot-swaps the local client to a new member only when it is clearly faster,
+# so jitter between two similar regions does not cause flapping.
+
+import asyncio
+import concurrent.futures
+import copy
+import statistics
+import threading
+import time
+import urllib.request
+
+from src.instance_state import PROJECT_TAG
+
+MERGED_SECTIONS = ('oci', 'compute', 'shadowsocks')
+
+
+def member_names(config):
+    """
+    Returns the names of the pool members in config order.
+    """
+    return [member['name'] for member in (config.get('pool') or {}).get('members') or []]
+
+
+def member_config(config, name):
+    """
+    Returns the full configuration of pool member `name`.
+
+    The member's oci, compute and shadowsocks blocks are merged over the
+    top-level ones, and compute.project_tag defaults to a per-member tag.
+
+    Raises:
+        KeyError: If there is no such member.
+    """
+    for member in (config.get('pool') or {}).get('members') or []:
+        if member['name'] == name:
+            break
+    else:
+        raise KeyError(f"No pool member named '{name}'.")
+    merged = copy.deepcopy(config)
+    for section in MERGED_SECTIONS:
+        merged[section] = dict(config.get(section) or {}, **(member.get(section) or {}))
+    merged['compute'].setdefault('project_tag', f"{PROJECT_TAG}-{name}")
+    return merged
+
+
+async def tcp_rtt(host, port, timeout=3):
+    """
+    Measures one TCP handshake to `host:port`.
+
+    Returns:
+        float: The connect time in seconds, or None if the port did not accept.
+    """
+    started = time.perf_counter()
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return None
+    elapsed = time.perf_counter() - started
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return elapsed
+
+
+def http_throughput_probe(url_template, timeout=10):
+    """
+    Returns a throughput probe that downloads `url_template` formatted with the member's host.
+
+    The URL should point at a bulk-download endpoint served next to each
+    proxy, e.g. "http://{host}:8080/bytes/1000000".
+
+    Returns:
+        callable: An async (host, port) -> bytes per second or None.
+    """
+    def download(host):
+        started = time.perf_counter()
+        size = 0
+        try:
+            with urllib.request.urlopen(url_template.format(host=host), timeout=timeout) as response:
+                for chunk in iter(lambda: response.read(65536), b''):
+                    size += len(chunk)
+        except OSError:
+            return None
+        return size / max(time.perf_counter() - started, 1e-6)
+
+    async def probe(host, port):
+        return await asyncio.to_thread(download, host)
+    return probe
+
+
+class ServerPool:
+    """
+    Picks the fastest healthy proxy among several instances.
+    """
+
+    def __init__(self, members, samples=3, timeout=3, hysteresis=0.2, rtt_probe=tcp_rtt,
+                 throughput_probe=None, min_throughput=0, on_event=None, clock=time.monotonic, wait=None):
+        """
+        Args:
+            members (dict): Member name -> (OCIManager, server port).
+            samples (int): TCP handshakes per member and evaluation; the median is used.
+            timeout (float): Timeout of each handshake.
+            hysteresis (float): A new member must be this fraction faster than the current one.
+            rtt_probe (callable): Async (host, port, timeout) -> seconds or None.
+            throughput_probe (callable): Optional async (host, port) -> bytes per second or None.
+            min_throughput (float): Members measuring below this many bytes/s count as unhealthy.
+            on_event (callable): Called with a message on every switch.
+            clock (callable): Monotonic time source, injectable for tests.
+            wait (callable): Waits up to the given seconds and returns True when
+                             stopped; defaults to the stop event, injectable for tests.
+        """
+        self.members = members
+        self.samples = samples
+        self.timeout = timeout
+        self.hysteresis = hysteresis
+        self.rtt_probe = rtt_probe
+        self.throughput_probe = throughput_probe
+        self.min_throughput = min_throughput
+        self.on_event = on_event or (lambda message: None)
+        self.clock = clock
+        self.addresses = {}
+        self.results = {}
+        self.current = None
+        self._stop_event = threading.Event()
+        self._wait = wait or self._stop_event.wait
+
+    @classmethod
+    def from_config(cls, config, **kwargs):
+        """
+        Builds a pool with one OCIManager per `pool.members` entry.
+        """
+        from src.instance_state import InstanceStateStore
+        from src.oci_manager import OCIManager
+        pool_config = config.get('pool') or {}
+        # Shared, so members resolved concurrently do not overwrite each other's records.
+        state_store = InstanceStateStore(ttl_seconds=(config.get('compute') or {}).get('state_ttl_seconds', 60))
+        members = {}
+        for name in member_names(config):
+            merged = member_config(config, name)
+            members[name] = (OCIManager(merged, state_store=state_store), merged['shadowsocks']['server_port'])
+        if pool_config.get('throughput_url') and 'throughput_probe' not in kwargs:
+            kwargs['throughput_probe'] = http_throughput_probe(pool_config['throughput_url'])
+        kwargs.setdefault('samples', pool_config.get('probe_samples', 3))
+        kwargs.setdefault('hysteresis', pool_config.get('hysteresis', 0.2))
+        kwargs.setdefault('min_throughput', pool_config.get('min_throughput_mbps', 0) * 125000)
+        return cls(members, **kwargs)
+
+    def resolve(self, names=None):
+        """
+        Looks up the running instance and public IP of each member concurrently.
+
+        Args:
+            names (list): Members to look up; defaults to all.
+
+        Returns:
+            dict: Member name -> public IP, or None if it has no running instance.
+        """
+        def lookup(name):
+            manager = self.members[name][0]
+            try:
+                instance = manager.find_existing_instance()
+                return manager.get_public_ip(instance.id) if instance is not None else None
+            except Exception as e:
+                self.on_event(f"Pool member {name}: lookup failed: {e}")
+                return None
+
+        names = list(self.members) if names is None else names
+        if names:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=len(names)) as executor:
+                self.addresses.update(zip(names, executor.map(lookup, names)))
+        return dict(self.addresses)
+
+    async def _probe_member(self, name):
+        address = self.addresses.get(name)
+        port = self.members[name][1]
+        result = {'address': address, 'rtt': None, 'throughput': None, 'healthy': False}
+        if address is None:
+            return result
+        rtts = []
+        for _ in range(self.samples):
+            rtt = await self.rtt_probe(address, port, self.timeout)
+            if rtt is None:
+                break
+            rtts.append(rtt)
+        if len(rtts) < self.samples:
+            return result
+        result['rtt'] = statistics.median(rtts)
+        result['healthy'] = True
+        if self.throughput_probe is not None:
+            result['throughput'] = await self.throughput_probe(address, port)
+            result['healthy'] = result['throughput'] is not None and result['throughput'] >= self.min_throughput
+        return result
+
+    def probe(self):
+        """
+        Probes every member with a known address concurrently.
+
+        Returns:
+            dict: Member name -> dict with 'address', 'rtt', 'throughput' and 'healthy'.
+        """
+        async def probe_all():
+            names = list(self.members)
+            results = await asyncio.gather(*(self._probe_member(name) for name in names))
+            return dict(zip(names, results))
+
+        self.results = asyncio.run(probe_all())
+        return self.results
+
+    def choose(self, results=None):
+        """
+        Returns the member to use: the fastest healthy one, unless the current
+        member is healthy and within the hysteresis margin of it.
+        """
+        results = self.results if results is None else results
+        healthy = {name: result for name, result in results.items() if result['healthy']}
+        if not healthy:
+            return None
+        best = min(healthy, key=lambda name: healthy[name]['rtt'])
+        current = healthy.get(self.current)
+        if current is not None and healthy[best]['rtt'] >= current['rtt'] * (1 - self.hysteresis):
+            return self.current
+        return best
+
+    def evaluate(self):
+        """
+        Re-resolves members without a healthy address, probes all of them and chooses one.
+
+        Returns:
+            str: The chosen member name, or None if no member is healthy.
+        """
+        stale = [name for name in self.members
+                 if self.addresses.get(name) is None or not self.results.get(name, {}).get('healthy', True)]
+        self.resolve(stale)
+        self.probe()
+        return self.choose()
+
+    def ranking(self):
+        """
+        Returns the last probe results as (name, result) pairs, fastest healthy member first.
+        """
+        return sorted(self.results.items(),
+                      key=lambda item: (not item[1]['healthy'], item[1]['rtt'] or 0, item[0]))
+
+    def stop(self):
+        """
+        Ends `run` at the next wait.
+        """
+        self._stop_event.set()
+
+    def run(self, switch, interval=300):
+        """
+        Re-evaluates the pool every `interval` seconds and switches the client when needed.
+
+        Args:
+            switch (callable): Called with the new member name and server IP;
+                               returns (bool, str) like ClientSupervisor.switch_server.
+            interval (float): Seconds between evaluations.
+
+        Returns:
+            tuple: A tuple (bool, str) once `stop` is called.
+        """
+        started = self.clock()
+        tick = 0
+        while True:
+            tick += 1
+            delay = max(started + tick * interval - self.clock(), 0)
+            if self._stop_event.is_set() or self._wait(delay):
+                return True, f"Pool selection stopped on {self.current}."
+            chosen = self.evaluate()
+            if chosen is None:
+                self.on_event("No healthy pool member; keeping the current server.")
+                continue
+            if chosen == self.current:
+                continue
+            result = self.results[chosen]
+            success, message = switch(chosen, result['address'])
+            if success:
+                self.on_event(f"Switched to {chosen} ({result['address']}, {result['rtt'] * 1000:.1f} ms).")
+                self.current = chosen
+            else:
+                self.on_event(f"Switch to {chosen} failed: {message}")
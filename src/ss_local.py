@@ -0,0 +1,914 @@
+# ss_local.py
+#
+# This module is an embedded replacement for the external `ss-local` binary:
+# a SOCKS5 front-end on the local port that tunnels every CONNECT to the
+# Shadowsocks server using the AEAD protocol (SIP004) with aes-128-gcm,
+# aes-256-gcm or chacha20-ietf-poly1305. It is selected with
+# `shadowsocks.client: embedded` and runs on a background event loop.
+#
+# The data path is built on asyncio protocols rather than streams. Server
+# data is received straight into a reusable per-connection bytearray
+# (BufferedProtocol) and frames are decrypted from memoryview slices of it.
+# Everything decoded from one read is forwarded with a single write, and
+# client data is split into frames with memoryview slices and sent as one
+# batched write. Back-pressure pauses the opposite side's reads.
+#
+# With `shadowsocks.upstream_pool_size` set, UpstreamPool keeps that many
+# connections to the server already established, so a new SOCKS request
+# skips the TCP handshake to the (possibly distant) server. Pooled
+# connections carry nothing until they are used, are dropped when the server
+# closes them, and are retired after `upstream_pool_idle_seconds`, well
+# before typical server idle timeouts.
+#
+# AEADServer is a minimal Shadowsocks server used as a local stand-in by the
+# tests and by the benchmarks (`python -m src.ss_local`).
+
+import asyncio
+import collections
+import hashlib
+import json
+import os
+import socket
+import struct
+import threading
+import time
+
+CIPHERS = {
+    # method: (key size, AEAD class name)
+    'aes-128-gcm': (16, 'AESGCM'),
+    'aes-256-gcm': (32, 'AESGCM'),
+    'chacha20-ietf-poly1305': (32, 'ChaCha20Poly1305'),
+}
+TAG_SIZE = 16
+MAX_PAYLOAD = 0x3FFF
+LENGTH_FRAME = 2 + TAG_SIZE
+# Room for one maximal frame plus a full read.
+RECV_BUFFER = 256 * 1024
+MIN_READ = 64 * 1024
+
+
+class ShadowsocksError(Exception):
+    """
+    Raised for malformed, unauthenticated or unsupported Shadowsocks traffic.
+    """
+
+
+def evp_bytes_to_key(password, key_size):
+    """
+    Derives the master key from the password the way OpenSSL's EVP_BytesToKey (MD5) does.
+    """
+    password = password.encode('utf-8')
+    key = b''
+    block = b''
+    while len(key) < key_size:
+        block = hashlib.md5(block + password).digest()
+        key += block
+    return key[:key_size]
+
+
+class _AEAD:
+    """
+    One direction of a connection: a subkey derived from the salt and an incrementing nonce.
+    """
+
+    def __init__(self, method, master_key, salt):
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.ciphers import aead
+        from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+        key_size, class_name = CIPHERS[method]
+        subkey = HKDF(algorithm=hashes.SHA1(), length=key_size, salt=salt, info=b"ss-subkey").derive(master_key)
+        self._aead = getattr(aead, class_name)(subkey)
+        self._nonce = 0
+
+    def _next_nonce(self):
+        nonce = self._nonce.to_bytes(12, 'little')
+        self._nonce += 1
+        return nonce
+
+    def seal(self, data):
+        return self._aead.encrypt(self._next_nonce(), data, None)
+
+    def open(self, data):
+        from cryptography.exceptions import InvalidTag
+        try:
+            return self._aead.decrypt(self._next_nonce(), data, None)
+        except InvalidTag:
+            raise ShadowsocksError("Authentication failed; check shadowsocks.password and method.") from None
+
+
+class Encryptor:
+    """
+    Encrypts one outgoing stream into length-prefixed AEAD frames.
+    """
+
+    def __init__(self, method, master_key):
+        self.salt = os.urandom(CIPHERS[method][0])
+        self._aead = _AEAD(method, master_key, self.salt)
+        self._salt_sent = False
+
+    def encrypt(self, data):
+        """
+        Returns the frames for `data` as a list of bytes, ready for one `writelines`/join.
+        """
+        out = []
+        if not self._salt_sent:
+            out.append(self.salt)
+            self._salt_sent = True
+        view = memoryview(data)
+        for offset in range(0, len(view), MAX_PAYLOAD):
+            chunk = view[offset:offset + MAX_PAYLOAD]
+            out.append(self._aead.seal(len(chunk).to_bytes(2, 'big')))
+            out.append(self._aead.seal(chunk))
+        return out
+
+
+class Decryptor:
+    """
+    Decrypts one incoming stream received into a reusable buffer.
+
+    Use `get_buffer`/`buffer_updated` from a BufferedProtocol, or `feed` for
+    data that is already in memory.
+    """
+
+    def __init__(self, method, master_key, buffer_size=RECV_BUFFER):
+        self.method = method
+        self.master_key = master_key
+        self._salt_size = CIPHERS[method][0]
+        self._aead = None
+        self._buffer = bytearray(buffer_size)
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._end = 0
+        self._payload_size = None
+
+    def get_buffer(self):
+        """
+        Returns a writable memoryview of the free tail of the buffer.
+        """
+        if len(self._buffer) - self._end < MIN_READ:
+            # Move the unparsed partial frame to the front; at most one frame is copied.
+            pending = self._end - self._start
+            self._buffer[:pending] = self._view[self._start:self._end]
+            self._start, self._end = 0, pending
+        return self._view[self._end:]
+
+    def buffer_updated(self, size):
+        """
+        Accounts for `size` bytes written into the last buffer and decrypts all complete frames.
+
+        Returns:
+            list: The decrypted payloads, in order.
+
+        Raises:
+            ShadowsocksError: If a frame fails authentication or is oversized.
+        """
+        self._end += size
+        view = self._view
+        out = []
+        while True:
+            available = self._end - self._start
+            if self._aead is None:
+                if available < self._salt_size:
+                    break
+                salt = bytes(view[self._start:self._start + self._salt_size])
+                self._aead = _AEAD(self.method, self.master_key, salt)
+                self._start += self._salt_size
+            elif self._payload_size is None:
+                if available < LENGTH_FRAME:
+                    break
+                size = int.from_bytes(self._aead.open(view[self._start:self._start + LENGTH_FRAME]), 'big')
+                if size > MAX_PAYLOAD:
+                    raise ShadowsocksError(f"Frame of {size} bytes exceeds the protocol limit.")
+                self._payload_size = size
+                self._start += LENGTH_FRAME
+            else:
+                frame_size = self._payload_size + TAG_SIZE
+                if available < frame_size:
+                    break
+                out.append(self._aead.open(view[self._start:self._start + frame_size]))
+                self._start += frame_size
+                self._payload_size = None
+        if self._start == self._end:
+            self._start = self._end = 0
+        return out
+
+    def feed(self, data):
+        """
+        Copies `data` into the buffer and decrypts all complete frames.
+        """
+        out = []
+        view = memoryview(data)
+        while view:
+            target = self.get_buffer()
+            size = min(len(target), len(view))
+            target[:size] = view[:size]
+            view = view[size:]
+            out.extend(self.buffer_updated(size))
+        return out
+
+
+def parse_address(data):
+    """
+    Parses a SOCKS5/Shadowsocks address header (ATYP, address, port).
+
+    Returns:
+        tuple: (host, port, header length), or None if `data` is too short.
+
+    Raises:
+        ShadowsocksError: If the address type is unknown.
+    """
+    if not data:
+        return None
+    atyp = data[0]
+    if atyp == 1:
+        end = 1 + 4
+        if len(data) < end + 2:
+            return None
+        host = socket.inet_ntop(socket.AF_INET, bytes(data[1:end]))
+    elif atyp == 4:
+        end = 1 + 16
+        if len(data) < end + 2:
+            return None
+        host = socket.inet_ntop(socket.AF_INET6, bytes(data[1:end]))
+    elif atyp == 3:
+        if len(data) < 2:
+            return None
+        end = 2 + data[1]
+        if len(data) < end + 2:
+            return None
+        host = bytes(data[2:end]).decode('idna')
+    else:
+        raise ShadowsocksError(f"Unsupported address type {atyp}.")
+    return host, struct.unpack('!H', data[end:end + 2])[0], end + 2
+
+
+class _Relay:
+    """
+    Shared back-pressure handling: when our transport's write buffer fills, the peer stops reading.
+    """
+
+    peer = None
+    transport = None
+
+    def pause_writing(self):
+        if self.peer is not None and self.peer.transport is not None:
+            self.peer.transport.pause_reading()
+
+    def resume_writing(self):
+        if self.peer is not None and self.peer.transport is not None:
+            self.peer.transport.resume_reading()
+
+    def _close_peer(self):
+        if self.peer is not None and self.peer.transport is not None and not self.peer.transport.is_closing():
+            self.peer.transport.close()
+
+
+class _UpstreamProtocol(_Relay, asyncio.BufferedProtocol):
+    """
+    The encrypted connection to the Shadowsocks server.
+    """
+
+    def __init__(self, local, decryptor, pool=None):
+        self.peer = local
+        self.decryptor = decryptor
+        self.pool = pool
+
+    def connection_made(self, transport):
+        self.transport = transport
+        transport.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def get_buffer(self, sizehint):
+        return self.decryptor.get_buffer()
+
+    def buffer_updated(self, nbytes):
+        if self.peer is None:
+            # The server has nothing to say before our first frame.
+            self.transport.abort()
+            return
+        try:
+            payloads = self.decryptor.buffer_updated(nbytes)
+        except ShadowsocksError:
+            self.transport.abort()
+            return
+        if payloads:
+            data = payloads[0] if len(payloads) == 1 else b''.join(payloads)
+            self.peer.client.bytes_in += len(data)
+            self.peer.transport.write(data)
+
+    def eof_received(self):
+        if self.peer is not None and self.peer.transport is not None and self.peer.transport.can_write_eof():
+            self.peer.transport.write_eof()
+            return True
+        return False
+
+    def connection_lost(self, exc):
+        self.transport = None
+        if self.peer is None and self.pool is not None:
+            self.pool.discard(self)
+        self._close_peer()
+
+
+class UpstreamPool:
+    """
+    Pre-established, unused connections to the Shadowsocks server.
+    """
+
+    def __init__(self, client, size, max_idle=30, clock=time.monotonic):
+        """
+        Args:
+            client (EmbeddedClient): Supplies the server address and keys.
+            size (int): Number of idle connections to keep ready.
+            max_idle (float): Seconds after which an unused connection is replaced.
+            clock (callable): Monotonic time source, injectable for tests.
+        """
+        self.client = client
+        self.size = size
+        self.max_idle = max_idle
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._idle = collections.deque()
+        self._pending = 0
+        self._evictor = None
+        self._closed = False
+
+    def __len__(self):
+        return len(self._idle)
+
+    def start(self):
+        """
+        Warms the pool and starts the idle evictor; call on the client's loop.
+        """
+        self.fill()
+        self._evictor = asyncio.ensure_future(self._evict_forever())
+
+    def close(self):
+        self._closed = True
+        if self._evictor is not None:
+            self._evictor.cancel()
+        self.flush()
+
+    def fill(self):
+        """
+        Opens connections in the background until `size` are idle or pending.
+        """
+        if self._closed:
+            return
+        for _ in range(self.size - len(self._idle) - self._pending):
+            self._pending += 1
+            asyncio.ensure_future(self._open())
+
+    async def _open(self):
+        client = self.client
+        server = (client.server_host, client.server_port)
+        loop = asyncio.get_running_loop()
+        try:
+            _, protocol = await loop.create_connection(
+                lambda: _UpstreamProtocol(None, Decryptor(client.method, client.master_key), pool=self), *server)
+        except OSError:
+            # The evictor retries on its next round.
+            return
+        finally:
+            self._pending -= 1
+        if self._closed or server != (client.server_host, client.server_port):
+            protocol.transport.close()
+            return
+        self._idle.append((protocol, self.clock()))
+
+    def acquire(self):
+        """
+        Takes a live idle connection, newest first, and starts a replacement.
+
+        Returns:
+            _UpstreamProtocol: A connected upstream, or None if none is ready.
+        """
+        now = self.clock()
+        upstream = None
+        while self._idle:
+            protocol, opened = self._idle.pop()
+            if protocol.transport is not None and not protocol.transport.is_closing() \
+                    and now - opened < self.max_idle:
+                upstream = protocol
+                break
+            if protocol.transport is not None:
+                protocol.transport.close()
+        if upstream is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        self.fill()
+        return upstream
+
+    def discard(self, protocol):
+        """
+        Forgets an idle connection that the server closed.
+        """
+        for entry in self._idle:
+            if entry[0] is protocol:
+                self._idle.remove(entry)
+                break
+
+    def flush(self):
+        """
+        Closes all idle connections, e.g. after switching servers.
+        """
+        while self._idle:
+            protocol, _ = self._idle.pop()
+            if protocol.transport is not None:
+                protocol.transport.close()
+
+    def evict(self):
+        """
+        Closes connections idle for longer than `max_idle` and refills the pool.
+        """
+        now = self.clock()
+        while self._idle and now - self._idle[0][1] >= self.max_idle:
+            protocol, _ = self._idle.popleft()
+            if protocol.transport is not None:
+                protocol.transport.close()
+        self.fill()
+
+    async def _evict_forever(self):
+        while True:
+            await asyncio.sleep(self.max_idle / 2)
+            self.evict()
+
+
+class _Socks5Protocol(_Relay, asyncio.Protocol):
+    """
+    One local SOCKS5 connection.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.transport = None
+        self.peer = None
+        self._handshake = bytearray()
+        self._greeted = False
+        self._encryptor = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        transport.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.client.active_connections += 1
+        self.client.total_connections += 1
+        self.client._connections.add(self)
+
+    def data_received(self, data):
+        if self._encryptor is not None:
+            self.client.bytes_out += len(data)
+            self.peer.transport.write(b''.join(self._encryptor.encrypt(data)))
+            return
+        self._handshake += data
+        try:
+            self._negotiate()
+        except ShadowsocksError:
+            self.transport.close()
+
+    def _negotiate(self):
+        buffer = self._handshake
+        if not self._greeted:
+            if len(buffer) < 2 or len(buffer) < 2 + buffer[1]:
+                return
+            if buffer[0] != 5:
+                raise ShadowsocksError("Not a SOCKS5 client.")
+            if 0 not in buffer[2:2 + buffer[1]]:
+                self.transport.write(b'\x05\xff')
+                raise ShadowsocksError("The client offers no method without authentication.")
+            del buffer[:2 + buffer[1]]
+            self._greeted = True
+            self.transport.write(b'\x05\x00')
+        if len(buffer) < 4:
+            return
+        if buffer[1] != 1:
+            # Only CONNECT is supported.
+            self.transport.write(b'\x05\x07\x00\x01\x00\x00\x00\x00\x00\x00')
+            raise ShadowsocksError(f"Unsupported SOCKS command {buffer[1]}.")
+        address = parse_address(memoryview(buffer)[3:])
+        if address is None:
+            return
+        header = bytes(buffer[3:3 + address[2]])
+        early_data = bytes(buffer[3 + address[2]:])
+        self._handshake = None
+        upstream = self.client.pool.acquire() if self.client.pool is not None else None
+        if upstream is not None:
+            self._attach(upstream, header, early_data)
+            return
+        self.transport.pause_reading()
+        asyncio.ensure_future(self._connect(header, early_data))
+
+    async def _connect(self, header, early_data):
+        loop = asyncio.get_running_loop()
+        client = self.client
+        try:
+            _, upstream = await loop.create_connection(
+                lambda: _UpstreamProtocol(self, Decryptor(client.method, client.master_key)),
+                client.server_host, client.server_port)
+        except OSError:
+            if not self._closing():
+                # General failure.
+                self.transport.write(b'\x05\x01\x00\x01\x00\x00\x00\x00\x00\x00')
+                self.transport.close()
+            return
+        if self._closing():
+            upstream.transport.close()
+            return
+        self._attach(upstream, header, early_data)
+        self.transport.resume_reading()
+
+    def _closing(self):
+        # connection_lost clears the transport once the application is gone.
+        return self.transport is None or self.transport.is_closing()
+
+    def _attach(self, upstream, header, early_data):
+        client = self.client
+        upstream.peer = self
+        self.peer = upstream
+        self._encryptor = Encryptor(client.method, client.master_key)
+        # The address header and anything the application already sent go out in one write.
+        client.bytes_out += len(early_data)
+        upstream.transport.write(b''.join(self._encryptor.encrypt(header + early_data)))
+        self.transport.write(b'\x05\x00\x00\x01\x00\x00\x00\x00\x00\x00')
+
+    def eof_received(self):
+        if self.peer is not None and self.peer.transport is not None and self.peer.transport.can_write_eof():
+            self.peer.transport.write_eof()
+            return True
+        return False
+
+    def connection_lost(self, exc):
+        self.client.active_connections -= 1
+        self.client._connections.discard(self)
+        self.transport = None
+        self._close_peer()
+
+
+class EmbeddedClient:
+    """
+    A SOCKS5 to Shadowsocks AEAD local client running on its own event loop thread.
+    """
+
+    def __init__(self, server_host, server_port, method, password, local_host='127.0.0.1', local_port=1080,
+                 pool_size=0, pool_idle_seconds=30):
+        """
+        Args:
+            server_host (str): The Shadowsocks server address.
+            server_port (int): The Shadowsocks server port.
+            method (str): One of CIPHERS.
+            password (str): The shared password.
+            local_host (str): Address of the SOCKS5 listener.
+            local_port (int): Port of the SOCKS5 listener (0 picks a free one).
+            pool_size (int): Upstream connections to keep pre-established (0 disables the pool).
+            pool_idle_seconds (float): Lifetime of an unused pooled connection.
+
+        Raises:
+            ShadowsocksError: If the method is not supported.
+        """
+        if method not in CIPHERS:
+            raise ShadowsocksError(f"Unsupported method '{method}'; use one of {', '.join(CIPHERS)}.")
+        self.server_host = server_host
+        self.server_port = server_port
+        self.method = method
+        self.master_key = evp_bytes_to_key(password, CIPHERS[method][0])
+        self.local_host = local_host
+        self.local_port = local_port
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.active_connections = 0
+        self.total_connections = 0
+        self.pool_size = pool_size
+        self.pool_idle_seconds = pool_idle_seconds
+        self.pool = None
+        self._connections = set()
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._ready = threading.Event()
+
+    async def listen(self):
+        """
+        Starts the SOCKS5 listener on the running loop.
+
+        Returns:
+            asyncio.Server: The listening server.
+        """
+        loop = asyncio.get_running_loop()
+        self._server = await loop.create_server(lambda: _Socks5Protocol(self), self.local_host, self.local_port,
+                                                reuse_address=True)
+        self.local_port = self._server.sockets[0].getsockname()[1]
+        if self.pool_size:
+            self.pool = UpstreamPool(self, self.pool_size, self.pool_idle_seconds)
+            self.pool.start()
+        return self._server
+
+    def switch_server(self, server_host):
+        """
+        Sends new connections to `server_host`; open ones finish on the old server.
+        """
+        self.server_host = server_host
+        if self.pool is not None and self._loop is not None and self._loop.is_running():
+            self._loop.call_soon_threadsafe(self._rewarm_pool)
+
+    def _rewarm_pool(self):
+        self.pool.flush()
+        self.pool.fill()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive() and self._server is not None
+
+    def start(self):
+        """
+        Starts the client on a background event loop and waits until it listens.
+
+        Returns:
+            int: The SOCKS5 port.
+
+        Raises:
+            OSError: If the port cannot be bound.
+        """
+        self._ready.clear()
+        self._thread = threading.Thread(target=self._run, name="ss-local-embedded", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._server is None:
+            self._thread = None
+            raise OSError(f"Embedded client could not listen on {self.local_host}:{self.local_port}.")
+        return self.local_port
+
+    def stop(self):
+        """
+        Closes the listener and all open connections.
+        """
+        if self._loop is not None and self._thread is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._loop.run_until_complete(self.listen())
+        except OSError:
+            self._server = None
+            self._ready.set()
+            self._loop.close()
+            return
+        self._ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._server.close()
+            self._server = None
+            if self.pool is not None:
+                self.pool.close()
+                self.pool = None
+            for connection in list(self._connections):
+                for protocol in (connection, connection.peer):
+                    if protocol is not None and protocol.transport is not None:
+                        protocol.transport.abort()
+            tasks = asyncio.all_tasks(self._loop)
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            # Let the aborted transports run their connection_lost callbacks.
+            self._loop.run_until_complete(asyncio.sleep(0))
+            self._loop.close()
+
+
+class AEADServer:
+    """
+    A minimal Shadowsocks AEAD server for local tests and benchmarks.
+    """
+
+    def __init__(self, method, password, host='127.0.0.1', port=0):
+        self.method = method
+        self.master_key = evp_bytes_to_key(password, CIPHERS[method][0])
+        self.host = host
+        self.port = port
+        self.connections = 0
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.port
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        decryptor = Decryptor(self.method, self.master_key)
+        target_writer = None
+        try:
+            header = b''
+            address = None
+            while address is None:
+                data = await reader.read(MIN_READ)
+                if not data:
+                    return
+                header += b''.join(decryptor.feed(data))
+                address = parse_address(header)
+            host, port, size = address
+            target_reader, target_writer = await asyncio.open_connection(host, port)
+            if len(header) > size:
+                target_writer.write(header[size:])
+
+            async def upload():
+                while True:
+                    data = await reader.read(MIN_READ)
+                    if not data:
+                        break
+                    payloads = decryptor.feed(data)
+                    if payloads:
+                        target_writer.write(b''.join(payloads))
+                        await target_writer.drain()
+                if target_writer.can_write_eof():
+                    target_writer.write_eof()
+
+            async def download():
+                encryptor = Encryptor(self.method, self.master_key)
+                while True:
+                    data = await target_reader.read(MIN_READ)
+                    if not data:
+                        break
+                    writer.write(b''.join(encryptor.encrypt(data)))
+                    await writer.drain()
+                writer.write_eof()
+
+            await asyncio.gather(upload(), download())
+        except (OSError, ShadowsocksError):
+            pass
+        finally:
+            writer.close()
+            if target_writer is not None:
+                target_writer.close()
+
+
+async def _socks5_connect(local_port, host, port):
+    reader, writer = await asyncio.open_connection('127.0.0.1', local_port)
+    writer.write(b'\x05\x01\x00\x05\x01\x00\x01' + socket.inet_aton(host) + struct.pack('!H', port))
+    await reader.readexactly(2)
+    reply = await reader.readexactly(10)
+    if reply[1] != 0:
+        raise ShadowsocksError(f"SOCKS5 CONNECT failed with code {reply[1]}.")
+    return reader, writer
+
+
+async def _run_benchmark(method, size):
+    async def source(reader, writer):
+        # Sends the requested number of bytes, or counts an upload and echoes its size.
+        command = await reader.readline()
+        if command.startswith(b'GET '):
+            remaining = int(command[4:])
+            block = bytes(MIN_READ)
+            while remaining > 0:
+                writer.write(block[:remaining])
+                remaining -= len(block)
+                await writer.drain()
+        else:
+            received = 0
+            while True:
+                data = await reader.read(MIN_READ)
+                if not data:
+                    break
+                received += len(data)
+            writer.write(str(received).encode('ascii'))
+        writer.close()
+
+    target = await asyncio.start_server(source, '127.0.0.1', 0)
+    target_port = target.sockets[0].getsockname()[1]
+    server = AEADServer(method, 'benchmark-password')
+    await server.start()
+    client = EmbeddedClient('127.0.0.1', server.port, method, 'benchmark-password', local_port=0)
+    await client.listen()
+    try:
+        reader, writer = await _socks5_connect(client.local_port, '127.0.0.1', target_port)
+        started = time.perf_counter()
+        writer.write(f"GET {size}\n".encode('ascii'))
+        received = 0
+        while True:
+            data = await reader.read(MIN_READ)
+            if not data:
+                break
+            received += len(data)
+        download_seconds = time.perf_counter() - started
+        writer.close()
+
+        reader, writer = await _socks5_connect(client.local_port, '127.0.0.1', target_port)
+        block = bytes(MIN_READ)
+        started = time.perf_counter()
+        writer.write(b"PUT\n")
+        sent = 0
+        while sent < size:
+            writer.write(block)
+            sent += len(block)
+            await writer.drain()
+        writer.write_eof()
+        uploaded = int(await reader.read())
+        upload_seconds = time.perf_counter() - started
+        writer.close()
+    finally:
+        client._server.close()
+        server.close()
+        target.close()
+    return {
+        'method': method,
+        'download_mbps': round(received * 8 / download_seconds / 1e6, 1),
+        'upload_mbps': round(uploaded * 8 / upload_seconds / 1e6, 1),
+    }
+
+
+async def _run_ttfb_benchmark(rtt, requests, pool_size):
+    async def delayed_relay(reader, writer):
+        # Emulates the handshake round trip to a distant server.
+        await asyncio.sleep(rtt)
+        try:
+            upstream_reader, upstream_writer = await asyncio.open_connection('127.0.0.1', server.port)
+        except OSError:
+            writer.close()
+            return
+
+        async def pump(source, sink):
+            while True:
+                data = await source.read(MIN_READ)
+                if not data:
+                    break
+                sink.write(data)
+                await sink.drain()
+            sink.close()
+
+        await asyncio.gather(pump(reader, upstream_writer), pump(upstream_reader, writer), return_exceptions=True)
+
+    async def echo(reader, writer):
+        while True:
+            data = await reader.read(MIN_READ)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+        writer.close()
+
+    target = await asyncio.start_server(echo, '127.0.0.1', 0)
+    server = AEADServer('aes-256-gcm', 'benchmark-password')
+    await server.start()
+    relay = await asyncio.start_server(delayed_relay, '127.0.0.1', 0)
+    client = EmbeddedClient('127.0.0.1', relay.sockets[0].getsockname()[1], 'aes-256-gcm', 'benchmark-password',
+                            local_port=0, pool_size=pool_size)
+    await client.listen()
+    timings = []
+    try:
+        for _ in range(requests):
+            # Requests arrive with gaps, as chatty API traffic does.
+            await asyncio.sleep(rtt * 2)
+            started = time.perf_counter()
+            reader, writer = await _socks5_connect(client.local_port, '127.0.0.1',
+                                                   target.sockets[0].getsockname()[1])
+            writer.write(b'x')
+            await reader.readexactly(1)
+            timings.append(time.perf_counter() - started)
+            writer.close()
+    finally:
+        if client.pool is not None:
+            client.pool.close()
+        client._server.close()
+        relay.close()
+        server.close()
+        target.close()
+        # Let the stand-ins' handlers see their connections close before the loop goes away.
+        await asyncio.sleep(rtt * 2)
+    timings.sort()
+    return {
+        'pool_size': pool_size,
+        'median_ttfb_ms': round(timings[len(timings) // 2] * 1000, 1),
+        'pool_hits': client.pool.hits if client.pool is not None else 0,
+    }
+
+
+def ttfb_benchmark(rtt=0.05, requests=20, pool_size=4):
+    """
+    Measures time to first byte of short requests with and without the upstream pool,
+    against a stand-in server whose connection set-up takes `rtt` seconds.
+
+    Returns:
+        list: One dict per configuration with 'median_ttfb_ms' and 'pool_hits'.
+    """
+    return [asyncio.run(_run_ttfb_benchmark(rtt, requests, size)) for size in (0, pool_size)]
+
+
+def benchmark(size=64 * 1024 * 1024, methods=tuple(CIPHERS)):
+    """
+    Measures download and upload throughput through the embedded client and a local AEADServer.
+
+    Returns:
+        list: One dict per method with 'download_mbps' and 'upload_mbps'.
+    """
+    return [asyncio.run(_run_benchmark(method, size)) for method in methods]
+
+
+if __name__ == "__main__":
+    print(json.dumps({'throughput': benchmark(), 'ttfb': ttfb_benchmark()}, indent=4))
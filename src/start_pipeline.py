@@ -0,0 +1,146 @@
+# start_pipeline.py
+#
+# This module implements the `start` command as an asyncio pipeline.
+# Independent stages (public IP detection, SSH key loading, security list
+# preparation) run while the instance is being found or launched, and the
+# stages that need the server IP (NSL update, instance configuration,
+# connection details, local client config) run concurrently once it is
+# known. Optionally the pipeline then waits until the Shadowsocks port is
+# actually accepting connections. Every stage is timed so start-up latency
+# can be measured.
+
+import asyncio
+import time
+
+from src.net_probe import wait_for_port
+
+
+class StartPipeline:
+    """
+    Orchestrates the stages of `start` concurrently and records their timings.
+    """
+
+    def __init__(self, oci_manager, local_client_manager, server_port, readiness_timeout=None):
+        """
+        Initializes the pipeline.
+
+        Args:
+            oci_manager (OCIManager): Manager used for compute and network calls.
+            local_client_manager (LocalClientManager): Manager for local client artifacts.
+            server_port (int): The Shadowsocks server port to open in the security list.
+            readiness_timeout (float): If set, wait up to this long for the server
+                                       port to accept connections before finishing.
+        """
+        self.oci_manager = oci_manager
+        self.local_client_manager = local_client_manager
+        self.server_port = server_port
+        self.readiness_timeout = readiness_timeout
+        self.timings = {}
+        self.launch = None
+
+    def run(self):
+        """
+        Runs the pipeline to completion from synchronous code.
+
+        Returns:
+            dict: The pipeline result (see `run_async`).
+        """
+        return asyncio.run(self.run_async())
+
+    async def run_async(self):
+        """
+        Runs all stages, overlapping those that do not depend on each other.
+
+        Returns:
+            dict: 'instance', 'server_ip', 'client_ip', 'configured', 'ss_url',
+                  'qr_file', 'client_config', per-stage 'timings' in seconds and
+                  'launch', the launch strategy's report (None if no instance was launched).
+        """
+        self.timings = {}
+        self.launch = None
+        started = time.perf_counter()
+
+        # Stages that only need local state or the configured subnet.
+        client_ip_task = self._stage('detect_public_ip', self.oci_manager.detect_public_ip)
+        ssh_key_task = self._stage('load_ssh_key', self.oci_manager._get_ssh_key)
+        security_lists_task = self._stage('prepare_security_list', self.oci_manager.fetch_security_lists)
+        background = [client_ip_task, ssh_key_task, security_lists_task]
+
+        try:
+            instance = await self._timed('provision_instance', self._provision(ssh_key_task))
+            server_ip = await self._stage('resolve_server_ip', self.oci_manager.get_public_ip, instance.id)
+            if not server_ip:
+                raise Exception(f"Instance {instance.id} has no public IP address.")
+
+            client_ip, security_lists = await asyncio.gather(client_ip_task, security_lists_task)
+            (nsl_ok, nsl_message), configured, (ss_url, qr_file), client_config = await asyncio.gather(
+                self._stage('update_security_list', self.oci_manager.update_network_security_list,
+                            client_ip, self.server_port, security_lists),
+                self._stage('configure_instance', self.oci_manager.ensure_configured, instance, server_ip),
+                self._stage('generate_connection_details',
+                            self.local_client_manager.generate_connection_details, server_ip),
+                self._stage('write_client_config', self.local_client_manager.write_client_config, server_ip),
+            )
+            if not nsl_ok:
+                raise Exception(nsl_message)
+            if self.readiness_timeout:
+                await self._stage('wait_for_server_port', wait_for_port,
+                                  server_ip, self.server_port, self.readiness_timeout)
+        except BaseException:
+            for task in background:
+                task.cancel()
+            await asyncio.gather(*background, return_exceptions=True)
+            raise
+
+        self.timings['total'] = time.perf_counter() - started
+        return {
+            'instance': instance,
+            'server_ip': server_ip,
+            'client_ip': client_ip,
+            'configured': configured,
+            'ss_url': ss_url,
+            'qr_file': qr_file,
+            'client_config': client_config,
+            'timings': dict(self.timings),
+            'launch': self.launch,
+        }
+
+    async def _provision(self, ssh_key_task):
+        """
+        Reuses (or resumes) the tagged instance if present, otherwise launches
+        one (trying the fallback candidates) and waits for it.
+        """
+        instance = await asyncio.to_thread(self.oci_manager.find_existing_instance,
+                                           self.oci_manager.reusable_states())
+        if instance is not None and instance.lifecycle_state != 'RUNNING':
+            return await self.oci_manager.resume_instance_async(instance)
+        if instance is not None:
+            return instance
+        ssh_key = await ssh_key_task
+        self.launch = await self.oci_manager.launch_strategy(on_event=print).launch_async(ssh_key)
+        self.timings['time_to_running'] = self.launch['time_to_running']
+        return self.launch['instance']
+
+    def _stage(self, name, func, *args):
+        """
+        Schedules a blocking call on a worker thread as a timed task.
+        """
+        return asyncio.ensure_future(self._timed(name, asyncio.to_thread(func, *args)))
+
+    async def _timed(self, name, awaitable):
+        """
+        Awaits a coroutine and records how long it took under `name`.
+        """
+        stage_started = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.timings[name] = time.perf_counter() - stage_started
+
+
+def format_timings(timings):
+    """
+    Formats per-stage timings as aligned report lines.
+    """
+    width = max((len(name) for name in timings), default=0)
+    return "\n".join(f"  {name.ljust(width)}  {seconds:7.3f}s" for name, seconds in timings.items())
@@ -0,0 +1,287 @@
+# traffic_meter.py
+#
+# This module accounts for the traffic that goes through the proxy. ss-local
+# exposes no byte counters, so a transparent TCP relay (the "metering shim")
+# listens on its own port and forwards every connection unchanged to the
+# ss-local SOCKS port, adding up the bytes it copies. Counting costs one
+# integer addition per 64 KiB chunk, so it is negligible next to the copy.
+#
+# Only traffic that goes through the meter's port is counted. With
+# `monitoring.meter_port` set, the PAC file, test-connection and bench point
+# at it (see LocalClientManager.proxy_port), but an application configured
+# with ss-local's port by hand bypasses the meter, and its traffic is
+# missing from the snapshots, the usage log and the idle watcher.
+#
+# A sampler turns the counters into a fixed-size ring buffer of per-interval
+# deltas, and UsageRecorder periodically persists those deltas into the
+# usage log and raises alerts as the monthly traffic quota fills up.
+
+import asyncio
+import collections
+import threading
+import time
+
+CHUNK_SIZE = 65536
+
+
+class TrafficSeries:
+    """
+    A ring buffer of (timestamp, bytes_in, bytes_out) samples.
+    """
+
+    def __init__(self, capacity=720):
+        self.samples = collections.deque(maxlen=capacity)
+
+    def add(self, timestamp, bytes_in, bytes_out):
+        self.samples.append((timestamp, bytes_in, bytes_out))
+
+    def rate(self, window):
+        """
+        Returns the average (in, out) bytes per second over the last `window` seconds.
+        """
+        if not self.samples:
+            return 0.0, 0.0
+        cutoff = self.samples[-1][0] - window
+        total_in = total_out = 0
+        for timestamp, bytes_in, bytes_out in reversed(self.samples):
+            if timestamp <= cutoff:
+                break
+            total_in += bytes_in
+            total_out += bytes_out
+        return total_in / window, total_out / window
+
+    def __len__(self):
+        return len(self.samples)
+
+
+class TrafficMeter:
+    """
+    A byte-counting TCP relay in front of the local SOCKS port.
+
+    'in' is traffic towards the local applications (downloads), 'out' is
+    traffic towards the proxy server (uploads).
+    """
+
+    def __init__(self, listen_port, upstream_port, listen_host='127.0.0.1', upstream_host='127.0.0.1',
+                 sample_interval=5, history=720, on_sample=None, clock=time.monotonic):
+        """
+        Args:
+            listen_port (int): Port the applications connect to (0 picks a free one).
+            upstream_port (int): The ss-local SOCKS port.
+            listen_host (str): Address to listen on.
+            upstream_host (str): Address of ss-local.
+            sample_interval (float): Seconds between samples.
+            history (int): Number of samples kept in the ring buffer.
+            on_sample (callable): Called with (bytes_in, bytes_out) deltas after every sample.
+            clock (callable): Monotonic time source, injectable for tests.
+        """
+        self.listen_host = listen_host
+        self.listen_port = listen_port
+        self.upstream_host = upstream_host
+        self.upstream_port = upstream_port
+        self.sample_interval = sample_interval
+        self.on_sample = on_sample or (lambda bytes_in, bytes_out: None)
+        self.clock = clock
+        self.series = TrafficSeries(history)
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.active_connections = 0
+        self.total_connections = 0
+        self.last_activity = clock()
+        self._sampled_in = 0
+        self._sampled_out = 0
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._ready = threading.Event()
+
+    def start(self):
+        """
+        Starts the relay on a background event loop and waits until it listens.
+
+        Returns:
+            int: The port being listened on.
+        """
+        self._thread = threading.Thread(target=self._run, name="traffic-meter", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._server is None:
+            raise OSError(f"Traffic meter could not listen on {self.listen_host}:{self.listen_port}.")
+        return self.listen_port
+
+    def stop(self):
+        """
+        Stops the relay and takes a final sample.
+        """
+        if self._loop is not None and self._thread is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._thread = None
+        self.sample()
+
+    def sample(self):
+        """
+        Records the counter deltas since the previous sample.
+
+        Returns:
+            tuple: The (bytes_in, bytes_out) delta.
+        """
+        bytes_in, bytes_out = self.bytes_in, self.bytes_out
+        delta = (bytes_in - self._sampled_in, bytes_out - self._sampled_out)
+        self._sampled_in, self._sampled_out = bytes_in, bytes_out
+        self.series.add(self.clock(), *delta)
+        self.on_sample(*delta)
+        return delta
+
+    def snapshot(self):
+        """
+        Returns the current counters as a dict.
+        """
+        return {
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'active_connections': self.active_connections,
+            'total_connections': self.total_connections,
+            'idle_seconds': 0 if self.active_connections else self.clock() - self.last_activity,
+        }
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._server = self._loop.run_until_complete(
+                asyncio.start_server(self._handle, self.listen_host, self.listen_port))
+            self.listen_port = self._server.sockets[0].getsockname()[1]
+        except OSError:
+            self._server = None
+            self._ready.set()
+            self._loop.close()
+            return
+        sampler = self._loop.create_task(self._sampler())
+        self._ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            sampler.cancel()
+            self._server.close()
+            tasks = asyncio.all_tasks(self._loop)
+            for task in tasks:
+                task.cancel()
+            self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self._loop.close()
+
+    async def _sampler(self):
+        while True:
+            await asyncio.sleep(self.sample_interval)
+            self.sample()
+
+    async def _handle(self, client_reader, client_writer):
+        self.active_connections += 1
+        self.total_connections += 1
+        self.last_activity = self.clock()
+        try:
+            upstream_reader, upstream_writer = await asyncio.open_connection(self.upstream_host, self.upstream_port)
+        except OSError:
+            self.active_connections -= 1
+            client_writer.close()
+            return
+        try:
+            await asyncio.gather(
+                self._pump(client_reader, upstream_writer, 'bytes_out'),
+                self._pump(upstream_reader, client_writer, 'bytes_in'),
+            )
+        finally:
+            self.active_connections -= 1
+            self.last_activity = self.clock()
+            upstream_writer.close()
+            client_writer.close()
+
+    async def _pump(self, reader, writer, counter):
+        try:
+            while True:
+                data = await reader.read(CHUNK_SIZE)
+                if not data:
+                    break
+                setattr(self, counter, getattr(self, counter) + len(data))
+                writer.write(data)
+                await writer.drain()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            if writer.can_write_eof():
+                try:
+                    writer.write_eof()
+                except OSError:
+                    pass
+
+
+class UsageRecorder:
+    """
+    Persists traffic deltas into the usage log and checks the monthly quota.
+
+    Use an instance as the meter's `on_sample` callback.
+    """
+
+    def __init__(self, usage_tracker, monthly_quota_bytes=None, alert_threshold=80, flush_interval=60,
+                 on_alert=print, clock=time.monotonic):
+        """
+        Args:
+            usage_tracker (UsageTracker): Where traffic summaries are written.
+            monthly_quota_bytes (int): The monthly traffic allowance, or None for no alerts.
+            alert_threshold (float): Percentage of the quota that triggers the first alert.
+            flush_interval (float): Seconds between writes to the usage log.
+            on_alert (callable): Called with a message when a quota level is crossed.
+            clock (callable): Monotonic time source, injectable for tests.
+        """
+        self.usage_tracker = usage_tracker
+        self.monthly_quota_bytes = monthly_quota_bytes
+        self.alert_threshold = alert_threshold
+        self.flush_interval = flush_interval
+        self.on_alert = on_alert
+        self.clock = clock
+        self.pending_in = 0
+        self.pending_out = 0
+        self._last_flush = clock()
+        self._alerted = set()
+        self._lock = threading.Lock()
+
+    def __call__(self, bytes_in, bytes_out):
+        with self._lock:
+            self.pending_in += bytes_in
+            self.pending_out += bytes_out
+            if self.clock() - self._last_flush >= self.flush_interval:
+                self._flush()
+
+    def flush(self):
+        """
+        Writes any pending traffic to the usage log now.
+        """
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        self._last_flush = self.clock()
+        if not (self.pending_in or self.pending_out):
+            return
+        self.usage_tracker.log_traffic(self.pending_in, self.pending_out)
+        self.pending_in = self.pending_out = 0
+        self.check_quota()
+
+    def check_quota(self):
+        """
+        Alerts once per month for each quota level (the threshold and 100%) crossed.
+
+        Returns:
+            float: The percentage of the monthly quota used, or None without a quota.
+        """
+        if not self.monthly_quota_bytes:
+            return None
+        now = self.usage_tracker.clock()
+        used = self.usage_tracker.bytes_this_month(now)
+        percent = used * 100 / self.monthly_quota_bytes
+        for level in sorted({self.alert_threshold, 100}):
+            key = (now.strftime('%Y-%m'), level)
+            if percent >= level and key not in self._alerted:
+                self._alerted.add(key)
+                self.on_alert(f"ALERT: {percent:.1f}% of the monthly traffic quota used "
+                              f"({used / 1e9:.2f} of {self.monthly_quota_bytes / 1e9:.2f} GB).")
+        return percent
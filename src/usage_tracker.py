@@ -1,85 +1,477 @@
 # usage_tracker.py
 #
 # This module tracks session start and stop times and persists
-# the data to a local JSON file for usage reporting.
+# them to an append-only JSON-lines log for usage reporting.
+#
+# Every `log_start`/`log_stop` appends one fsync'd line instead of
+# rewriting the whole history. A small index file next to the log
+# remembers the log size and the open session, so finding the session
+# to stop is O(1); it is rebuilt from the log whenever the sizes
+# disagree (e.g. after a crash between the append and the index write).
+# A stop record repeats its session's start, so compaction simply drops
+# the start records that already have a matching stop.
+#
+# Closed sessions are also folded into rollups (seconds per day, per
+# month and per instance OCID) kept in a second small file and updated on
+# every `log_stop`, so quota questions such as "hours used this month"
+# never touch the log. Reports stream sessions and can be filtered by
+# date range and exported as text, CSV or JSON.
+#
+# Traffic summaries from the metering proxy are appended as 'traffic'
+# records against the open session; the stop record carries the session's
+# byte totals, so those records become redundant like the start record.
+# Writes are serialised by a lock, since the traffic meter logs from its
+# own thread while the main thread starts and stops sessions.
 
+import csv
+import io
 import json
 import os
+import threading
 import datetime
 
+LEGACY_LOG_FILE = "usage_log.json"
+INDEX_VERSION = 2
+
+
 class UsageTracker:
     """
     Tracks and reports on the usage of the Shadowsocks instance.
     """
-    def __init__(self, config):
-        self.config = config
-        self.log_file = "usage_log.json"
-        self.session_data = self._load_log()
-    
-    def _load_log(self):
+    def __init__(self, config=None, log_file="usage_log.jsonl", legacy_file=LEGACY_LOG_FILE,
+                 clock=datetime.datetime.now):
+        """
+        Initializes the tracker, migrating a legacy JSON log on first use.
+
+        Args:
+            config (dict): The 'monitoring' configuration section.
+            log_file (str): The JSON-lines session log.
+            legacy_file (str): The old whole-file JSON log to migrate from, if present.
+            clock (callable): Returns the current datetime, injectable for tests.
+        """
+        self.config = config or {}
+        self.log_file = log_file
+        self.index_file = f"{log_file}.idx"
+        self.rollup_file = f"{log_file}.rollup"
+        self.legacy_file = legacy_file
+        self.clock = clock
+        self.compact_after = self.config.get('usage_log_compact_after', 1000)
+        self._index = None
+        self._rollups = None
+        self._lock = threading.RLock()
+        self._migrate_legacy()
+
+    # --- Storage ---
+
+    def _migrate_legacy(self):
+        """
+        Converts the legacy JSON array log once and renames it out of the way.
         """
-        Loads the usage log from a JSON file. Creates a new file if it doesn't exist.
+        if not self.legacy_file or not os.path.exists(self.legacy_file) or os.path.exists(self.log_file):
+            return
+        try:
+            with open(self.legacy_file, 'r') as f:
+                sessions = json.load(f)
+        except ValueError as e:
+            print(f"Could not migrate {self.legacy_file}: {e}")
+            return
+        self._write_sessions(sessions)
+        os.replace(self.legacy_file, f"{self.legacy_file}.migrated")
+        print(f"Migrated {len(sessions)} sessions from {self.legacy_file} to {self.log_file}")
+
+    def _write_sessions(self, sessions):
+        """
+        Atomically replaces the log with one record per session and rebuilds the index.
+        """
+        tmp_path = f"{self.log_file}.tmp"
+        with open(tmp_path, 'wb') as f:
+            for session in sessions:
+                f.write(self._encode(self._session_record(session)))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.log_file)
+        self._index = self._rebuild_index()
+
+    @staticmethod
+    def _session_record(session):
+        record = {'event': 'start', 'instance_id': session['instance_id'], 'start_time': session['start_time']}
+        if session.get('end_time'):
+            record.update(event='stop', end_time=session['end_time'])
+        if session.get('bytes_in') or session.get('bytes_out'):
+            record.update(bytes_in=session.get('bytes_in', 0), bytes_out=session.get('bytes_out', 0))
+        return record
+
+    @staticmethod
+    def _encode(record):
+        return (json.dumps(record, separators=(',', ':')) + '\n').encode('utf-8')
+
+    def _load_index(self):
+        """
+        Returns the index, rebuilding it if it is missing or does not match the log.
+        """
+        if self._index is None:
+            try:
+                with open(self.index_file, 'r') as f:
+                    self._index = json.load(f)
+            except (FileNotFoundError, ValueError):
+                self._index = None
+        size = os.path.getsize(self.log_file) if os.path.exists(self.log_file) else 0
+        if self._index is None or self._index.get('size') != size \
+                or self._index.get('version') != INDEX_VERSION:
+            self._index = self._rebuild_index()
+        return self._index
+
+    def _rebuild_index(self):
         """
+        Scans the log once, truncating a torn final line left by an interrupted append.
+        """
+        index = {'version': INDEX_VERSION, 'size': 0, 'sessions': 0, 'closed': 0, 'redundant': 0, 'open': None}
         if os.path.exists(self.log_file):
-            with open(self.log_file, 'r') as f:
-                return json.load(f)
-        return []
+            with open(self.log_file, 'rb+') as f:
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        f.truncate(index['size'])
+                        break
+                    index['size'] += len(line)
+                    try:
+                        self._apply(index, json.loads(line))
+                    except ValueError:
+                        continue
+        self._save_index(index)
+        return index
+
+    @staticmethod
+    def _apply(index, record):
+        """
+        Updates the index counters for one appended record.
+        """
+        if record['event'] == 'start':
+            index['sessions'] += 1
+            index['open'] = {'instance_id': record['instance_id'], 'start_time': record['start_time'],
+                             'bytes_in': record.get('bytes_in', 0), 'bytes_out': record.get('bytes_out', 0)}
+        elif record['event'] == 'traffic':
+            if index['open'] and index['open']['start_time'] == record['start_time']:
+                index['open']['bytes_in'] += record['bytes_in']
+                index['open']['bytes_out'] += record['bytes_out']
+                index['redundant'] += 1
+        elif record['event'] == 'stop':
+            if index['open'] and index['open']['start_time'] == record['start_time']:
+                index['redundant'] += 1
+            else:
+                index['sessions'] += 1
+            index['closed'] += 1
+            index['open'] = None
+
+    def _save_index(self, index):
+        tmp_path = f"{self.index_file}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.index_file)
 
-    def _save_log(self):
+    def _append(self, record):
         """
-        Saves the current session data to the JSON log file.
+        Appends one record with a single fsync'd write, then updates the index.
         """
-        with open(self.log_file, 'w') as f:
-            json.dump(self.session_data, f, indent=4)
+        index = self._load_index()
+        data = self._encode(record)
+        fd = os.open(self.log_file, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            written = 0
+            while written < len(data):
+                written += os.write(fd, data[written:])
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        index['size'] += len(data)
+        self._apply(index, record)
+        self._save_index(index)
+
+    def iter_sessions(self):
+        """
+        Streams sessions from the log in order, without loading it whole.
+
+        Yields:
+            dict: 'instance_id', 'start_time', 'end_time' (None while open),
+                  'bytes_in' and 'bytes_out'.
+        """
+        if not os.path.exists(self.log_file):
+            return
+        pending = None
+        with open(self.log_file, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record['event'] == 'start':
+                    if pending:
+                        yield pending
+                    pending = {'instance_id': record['instance_id'], 'start_time': record['start_time'],
+                               'end_time': None, 'bytes_in': record.get('bytes_in', 0),
+                               'bytes_out': record.get('bytes_out', 0)}
+                elif record['event'] == 'traffic':
+                    if pending and pending['start_time'] == record['start_time']:
+                        pending['bytes_in'] += record['bytes_in']
+                        pending['bytes_out'] += record['bytes_out']
+                elif record['event'] == 'stop':
+                    if pending and pending['start_time'] != record['start_time']:
+                        yield pending
+                    pending = None
+                    yield {'instance_id': record['instance_id'], 'start_time': record['start_time'],
+                           'end_time': record['end_time'], 'bytes_in': record.get('bytes_in', 0),
+                           'bytes_out': record.get('bytes_out', 0)}
+        if pending:
+            yield pending
+
+    def compact(self):
+        """
+        Rewrites the log with one record per session, dropping superseded start and traffic records.
+
+        Returns:
+            int: The number of records removed.
+        """
+        with self._lock:
+            removed = self._load_index()['redundant']
+            if removed:
+                self._write_sessions(self.iter_sessions())
+            return removed
+
+    # --- Session logging ---
+
+    def open_session(self):
+        """
+        Returns the open session from the index, or None.
+        """
+        with self._lock:
+            session = self._load_index()['open']
+            return dict(session) if session else None
 
     def log_start(self, instance_id):
         """
         Logs the start time of a new session.
         """
-        new_session = {
-            "instance_id": instance_id,
-            "start_time": datetime.datetime.now().isoformat(),
-            "end_time": None
-        }
-        self.session_data.append(new_session)
-        self._save_log()
-        print(f"Session started at {new_session['start_time']}")
+        start_time = self.clock().isoformat()
+        with self._lock:
+            self._append({'event': 'start', 'instance_id': instance_id, 'start_time': start_time})
+        print(f"Session started at {start_time}")
+
+    def log_traffic(self, bytes_in, bytes_out):
+        """
+        Adds a traffic summary to the open session.
+
+        Args:
+            bytes_in (int): Bytes received through the proxy since the last summary.
+            bytes_out (int): Bytes sent through the proxy since the last summary.
+
+        Returns:
+            bool: False if there was no open session to attribute the traffic to.
+        """
+        with self._lock:
+            session = self.open_session()
+            if session is None:
+                return False
+            if bytes_in or bytes_out:
+                self._append({'event': 'traffic', 'start_time': session['start_time'],
+                              'bytes_in': bytes_in, 'bytes_out': bytes_out})
+            return True
 
     def log_stop(self):
         """
-        Logs the stop time for the last open session.
+        Logs the stop time for the last open session and folds it into the rollups.
         """
-        if not self.session_data:
-            print("No active session to stop.")
-            return
+        with self._lock:
+            session = self.open_session()
+            if session is None:
+                print("No active session to stop.")
+                return
 
-        last_session = self.session_data[-1]
-        if last_session["end_time"] is None:
-            last_session["end_time"] = datetime.datetime.now().isoformat()
-            self._save_log()
-            print(f"Session stopped at {last_session['end_time']}")
-        else:
-            print("No active session to stop.")
+            rollups = self._load_rollups()
+            end_time = self.clock().isoformat()
+            session['end_time'] = end_time
+            self._append(self._session_record(session))
+            self._add_to_rollups(rollups, session)
+            rollups['closed'] = self._index['closed']
+            self._save_rollups(rollups)
+            print(f"Session stopped at {end_time}")
+            if self.compact_after and self._index['redundant'] >= self.compact_after:
+                self.compact()
+
+    # --- Rollups ---
+
+    def _load_rollups(self):
+        """
+        Returns the rollups, rebuilding them if they do not cover every closed session.
+        """
+        with self._lock:
+            if self._rollups is None:
+                try:
+                    with open(self.rollup_file, 'r') as f:
+                        self._rollups = json.load(f)
+                except (FileNotFoundError, ValueError):
+                    self._rollups = None
+            if self._rollups is None or self._rollups.get('closed') != self._load_index()['closed']:
+                self._rollups = self._rebuild_rollups()
+            return self._rollups
+
+    def _rebuild_rollups(self):
+        rollups = {'closed': 0, 'total_seconds': 0, 'days': {}, 'months': {}, 'instances': {}, 'traffic_months': {}}
+        for session in self.iter_sessions():
+            if session['end_time']:
+                self._add_to_rollups(rollups, session)
+        rollups['closed'] = self._load_index()['closed']
+        self._save_rollups(rollups)
+        return rollups
+
+    def _save_rollups(self, rollups):
+        tmp_path = f"{self.rollup_file}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(rollups, f)
+        os.replace(tmp_path, self.rollup_file)
+        self._rollups = rollups
+
+    @staticmethod
+    def _add_to_rollups(rollups, session):
+        start = datetime.datetime.fromisoformat(session['start_time'])
+        end = datetime.datetime.fromisoformat(session['end_time'])
+        seconds = (end - start).total_seconds()
+        rollups['total_seconds'] += seconds
+        instances = rollups['instances']
+        instances[session['instance_id']] = instances.get(session['instance_id'], 0) + seconds
+        traffic = rollups.setdefault('traffic_months', {})
+        month = end.strftime('%Y-%m')
+        traffic[month] = traffic.get(month, 0) + session.get('bytes_in', 0) + session.get('bytes_out', 0)
+        for day, day_seconds in _split_by_day(start, end):
+            rollups['days'][day.isoformat()] = rollups['days'].get(day.isoformat(), 0) + day_seconds
+            month = day.strftime('%Y-%m')
+            rollups['months'][month] = rollups['months'].get(month, 0) + day_seconds
+
+    def rollups(self):
+        """
+        Returns a copy of the rollups: 'total_seconds' plus seconds keyed by
+        day ('YYYY-MM-DD'), month ('YYYY-MM') and instance OCID, and bytes by
+        month of the session's end in 'traffic_months'. Closed sessions only.
+        """
+        return json.loads(json.dumps(self._load_rollups()))
+
+    def hours_this_month(self, now=None):
+        """
+        Returns the hours used in the current calendar month, including the open session.
+
+        Answered from the monthly rollup plus the open session's share of the month,
+        so it never scans the log.
+        """
+        now = now or self.clock()
+        seconds = self._load_rollups()['months'].get(now.strftime('%Y-%m'), 0)
+        session = self.open_session()
+        if session:
+            month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+            start = max(datetime.datetime.fromisoformat(session['start_time']), month_start)
+            seconds += max((now - start).total_seconds(), 0)
+        return seconds / 3600
+
+    def bytes_this_month(self, now=None):
+        """
+        Returns the bytes moved through the proxy this month, including the open session.
+        """
+        now = now or self.clock()
+        total = self._load_rollups().get('traffic_months', {}).get(now.strftime('%Y-%m'), 0)
+        session = self.open_session()
+        if session:
+            total += session['bytes_in'] + session['bytes_out']
+        return total
 
-    def generate_report(self):
+    # --- Reporting ---
+
+    def iter_report(self, since=None, until=None, fmt='text'):
         """
-        Generates a summary report of all sessions.
+        Streams a usage report line by line.
+
+        Sessions overlapping the range are included, with durations clipped to it.
+
+        Args:
+            since (datetime.date): First day to include, or None for no lower bound.
+            until (datetime.date): Last day to include, or None for no upper bound.
+            fmt (str): 'text', 'csv' or 'json'.
+
+        Yields:
+            str: One line of the report.
         """
+        if fmt not in ('text', 'csv', 'json'):
+            raise ValueError(f"Unknown report format '{fmt}'.")
+        now = self.clock()
+        lower = datetime.datetime.combine(since, datetime.time()) if since else None
+        upper = datetime.datetime.combine(until + datetime.timedelta(days=1), datetime.time()) if until else None
+
         total_duration = datetime.timedelta(0)
-        report_lines = ["--- Usage Report ---"]
-        
-        for session in self.session_data:
+        total_bytes = 0
+        first = True
+        if fmt == 'text':
+            yield "--- Usage Report ---"
+        elif fmt == 'csv':
+            yield _csv_row(['instance_id', 'start_time', 'end_time', 'bytes_in', 'bytes_out', 'duration_seconds'])
+        else:
+            yield "["
+
+        for session in self.iter_sessions():
             start_time = datetime.datetime.fromisoformat(session['start_time'])
-            end_time = datetime.datetime.fromisoformat(session['end_time']) if session['end_time'] else datetime.datetime.now()
-            
-            duration = end_time - start_time
+            end_time = datetime.datetime.fromisoformat(session['end_time']) if session['end_time'] else now
+            if (upper and start_time >= upper) or (lower and end_time < lower):
+                continue
+            duration = min(end_time, upper or end_time) - max(start_time, lower or start_time)
             total_duration += duration
-            
-            report_lines.append(f"Session ID: {session['instance_id']}")
-            report_lines.append(f"Start: {start_time.strftime('%Y-%m-%d %H:%M:%S')}")
-            report_lines.append(f"End: {end_time.strftime('%Y-%m-%d %H:%M:%S') if session['end_time'] else 'Active'}")
-            report_lines.append(f"Duration: {duration}")
-            report_lines.append("-" * 20)
-            
-        report_lines.append(f"Total OCI Usage: {total_duration}")
-        return "\n".join(report_lines)
+            total_bytes += session['bytes_in'] + session['bytes_out']
+
+            if fmt == 'text':
+                yield f"Session ID: {session['instance_id']}"
+                yield f"Start: {start_time.strftime('%Y-%m-%d %H:%M:%S')}"
+                yield f"End: {end_time.strftime('%Y-%m-%d %H:%M:%S') if session['end_time'] else 'Active'}"
+                yield f"Duration: {duration}"
+                if session['bytes_in'] or session['bytes_out']:
+                    yield f"Traffic: {_megabytes(session['bytes_in'])} in / {_megabytes(session['bytes_out'])} out"
+                yield "-" * 20
+            elif fmt == 'csv':
+                yield _csv_row([session['instance_id'], session['start_time'], session['end_time'] or '',
+                                session['bytes_in'], session['bytes_out'], int(duration.total_seconds())])
+            else:
+                row = dict(session, duration_seconds=int(duration.total_seconds()))
+                yield ("  " if first else ", ") + json.dumps(row)
+            first = False
+
+        if fmt == 'text':
+            yield f"Total OCI Usage: {total_duration}"
+            yield f"Total Traffic: {_megabytes(total_bytes)}"
+            yield f"Hours this month: {self.hours_this_month(now):.2f}"
+        elif fmt == 'json':
+            yield "]"
+
+    def generate_report(self, since=None, until=None, fmt='text'):
+        """
+        Generates a report of all sessions, optionally filtered by date range.
+        """
+        return "\n".join(self.iter_report(since, until, fmt))
+
+
+def _split_by_day(start, end):
+    """
+    Splits [start, end) at midnight boundaries.
+
+    Yields:
+        tuple: (datetime.date, seconds) for every day the interval touches.
+    """
+    while start < end:
+        midnight = datetime.datetime.combine(start.date() + datetime.timedelta(days=1), datetime.time())
+        chunk_end = min(midnight, end)
+        yield start.date(), (chunk_end - start).total_seconds()
+        start = chunk_end
+
+
+def _megabytes(count):
+    return f"{count / 1e6:.1f} MB"
+
+
+def _csv_row(values):
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator='').writerow(values)
+    return buffer.getvalue()
@@ -0,0 +1,168 @@
+# Shared pytest fixtures for tests that need local network stand-ins.
+
+import socket
+import socketserver
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+
+class _RouteHandler(BaseHTTPRequestHandler):
+    """Serves scripted responses: routes map a path to (delay, status, body)."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if self.path.startswith('/bytes/'):
+            # Bulk download endpoint for throughput measurements.
+            size = int(self.path.rsplit('/', 1)[1])
+            self.send_response(200)
+            self.send_header('Content-Length', str(size))
+            self.end_headers()
+            block = bytes(min(size, 65536))
+            while size > 0:
+                self.wfile.write(block[:size])
+                size -= len(block)
+            return
+        if self.path.startswith('/chunked/') or self.path.startswith('/until-close/'):
+            # Bodies without Content-Length: chunked, or delimited by closing the connection.
+            size = int(self.path.rsplit('/', 1)[1])
+            chunked = self.path.startswith('/chunked/')
+            self.send_response(200)
+            if chunked:
+                self.send_header('Transfer-Encoding', 'chunked')
+            else:
+                self.send_header('Connection', 'close')
+                self.close_connection = True
+            self.end_headers()
+            while size > 0:
+                block = bytes(min(size, 40000))
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(block), block) if chunked else block)
+                size -= len(block)
+            if chunked:
+                self.wfile.write(b'0\r\n\r\n')
+            return
+        delay, status, body = self.server.routes.get(self.path, (0, 404, b''))
+        self.server.hits.append(self.path)
+        time.sleep(delay)
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.server.hits.append(self.path)
+        remaining = int(self.headers.get('Content-Length', 0))
+        while remaining > 0:
+            remaining -= len(self.rfile.read(min(remaining, 65536)))
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _Socks5Handler(socketserver.BaseRequestHandler):
+    """A minimal SOCKS5 (no auth, CONNECT only) relay used as a local proxy stand-in."""
+
+    def handle(self):
+        client = self.request
+        client.recv(262)
+        client.sendall(b'\x05\x00')
+        _, command, _, address_type = self._recv(4)
+        if address_type == 1:
+            host = socket.inet_ntoa(self._recv(4))
+        elif address_type == 4:
+            host = socket.inet_ntop(socket.AF_INET6, self._recv(16))
+        else:
+            host = self._recv(self._recv(1)[0]).decode('idna')
+        port = struct.unpack('!H', self._recv(2))[0]
+        time.sleep(self.server.latency)
+        try:
+            upstream = socket.create_connection((host, port), timeout=10)
+        except OSError:
+            client.sendall(b'\x05\x05\x00\x01' + bytes(6))
+            return
+        self.server.connections += 1
+        client.sendall(b'\x05\x00\x00\x01' + bytes(6))
+        pump = threading.Thread(target=self._pipe, args=(upstream, client), daemon=True)
+        pump.start()
+        self._pipe(client, upstream)
+        pump.join()
+        upstream.close()
+
+    def _recv(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("client closed")
+            data += chunk
+        return data
+
+    @staticmethod
+    def _pipe(source, destination):
+        try:
+            while True:
+                data = source.recv(65536)
+                if not data:
+                    break
+                destination.sendall(data)
+        except OSError:
+            pass
+        try:
+            destination.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+
+
+class _ThreadingTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+@pytest.fixture
+def http_server():
+    """
+    Starts local HTTP servers on demand.
+
+    Usage: base_url, hits = http_server({'/ip': (0.1, 200, '198.51.100.7')})
+    """
+    servers = []
+
+    def start(routes):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), _RouteHandler)
+        server.daemon_threads = True
+        server.routes = routes
+        server.hits = []
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}", server.hits
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def socks5_server():
+    """
+    Starts a local SOCKS5 stand-in; returns (host, port, server).
+
+    Set server.latency to add a delay before each CONNECT is answered.
+    """
+    server = _ThreadingTCPServer(('127.0.0.1', 0), _Socks5Handler)
+    server.latency = 0
+    server.connections = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield '127.0.0.1', server.server_address[1], server
+    server.shutdown()
+    server.server_close()
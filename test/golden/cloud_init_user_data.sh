@@ -0,0 +1,35 @@
+#!/bin/bash
+# Generated by OCI Shadowsocks Manager; runs once on first boot.
+set -eu
+exec >>/var/log/shadowsocks-bootstrap.log 2>&1
+changed=0
+
+# install
+if ! ( command -v ss-server >/dev/null ); then
+  echo "applying install"
+  if command -v apt-get >/dev/null; then sudo DEBIAN_FRONTEND=noninteractive apt-get update -q && sudo DEBIAN_FRONTEND=noninteractive apt-get install -y -q shadowsocks-libev; else sudo dnf install -y -q dnf-plugins-core && sudo dnf copr enable -y librehat/shadowsocks && sudo dnf install -y -q shadowsocks-libev; fi
+  changed=1
+fi
+
+# write-config
+if ! ( test "$(cat /etc/shadowsocks-libev/config.hash 2>/dev/null)" = a6bcdcca91b8df18 ); then
+  echo "applying write-config"
+  sudo mkdir -p /etc/shadowsocks-libev && echo ewogICAgImZhc3Rfb3BlbiI6IHRydWUsCiAgICAibWV0aG9kIjogImNoYWNoYTIwLWlldGYtcG9seTEzMDUiLAogICAgIm1vZGUiOiAidGNwX2FuZF91ZHAiLAogICAgInBhc3N3b3JkIjogImdvbGRlbi1wYXNzd29yZCIsCiAgICAic2VydmVyIjogIjAuMC4wLjAiLAogICAgInNlcnZlcl9wb3J0IjogODM4OCwKICAgICJ0aW1lb3V0IjogMzAwCn0K | base64 -d | sudo tee /etc/shadowsocks-libev/config.json >/dev/null && echo a6bcdcca91b8df18 | sudo tee /etc/shadowsocks-libev/config.hash >/dev/null
+  changed=1
+fi
+
+# open-firewall
+if ! ( ! command -v firewall-cmd >/dev/null || sudo firewall-cmd --query-port=8388/tcp ); then
+  echo "applying open-firewall"
+  sudo firewall-cmd --permanent --add-port=8388/tcp --add-port=8388/udp && sudo firewall-cmd --reload
+  changed=1
+fi
+
+# enable-service
+if [ "$changed" = 1 ] || ! ( systemctl is-active --quiet shadowsocks-libev ); then
+  echo "applying enable-service"
+  sudo systemctl enable shadowsocks-libev && sudo systemctl restart shadowsocks-libev
+  changed=1
+fi
+
+echo "shadowsocks bootstrap complete"
@@ -0,0 +1,100 @@
+# Tests that lightweight subcommands do not load the OCI SDK or other heavy packages.
+# Each command runs main.main() in a fresh interpreter inside a scratch directory.
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+import pytest
+
+from src.import_bench import HEAVY_PACKAGES, measure_command, parse_importtime
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+RUNNER = """
+import sys
+sys.path.insert(0, {root!r})
+sys.argv = ['main.py'] + {argv!r}
+import main
+main.main()
+print('HEAVY=' + ','.join(p for p in {heavy!r} if p in sys.modules))
+"""
+
+
+@pytest.fixture
+def workdir(tmp_path):
+    (tmp_path / "config").mkdir()
+    shutil.copy(os.path.join(REPO_ROOT, "config", "config.yaml"), tmp_path / "config" / "config.yaml")
+    return tmp_path
+
+
+def _run(workdir, *argv, returncode=0):
+    result = subprocess.run(
+        [sys.executable, '-c', RUNNER.format(root=REPO_ROOT, argv=list(argv), heavy=HEAVY_PACKAGES)],
+        cwd=workdir, capture_output=True, text=True, timeout=60
+    )
+    assert result.returncode == returncode, result.stderr
+    return result.stdout
+
+
+def test_report_skips_heavy_imports(workdir):
+    output = _run(workdir, 'report')
+
+    assert "--- Usage Report ---" in output
+    assert "HEAVY=\n" in output
+
+
+def test_status_answers_from_fresh_state_without_sdk(workdir):
+    (workdir / "instance_state.json").write_text(json.dumps({
+        'shadowsocks-proxy': {
+            'instance_id': 'ocid1.instance.test',
+            'lifecycle_state': 'RUNNING',
+            'last_verified': time.time(),
+        }
+    }))
+
+    output = _run(workdir, 'status')
+
+    assert "OCI instance status: RUNNING" in output
+    assert "HEAVY=\n" in output
+
+
+def test_parse_importtime_sums_top_level_imports():
+    stderr = "\n".join([
+        "import time: self [us] | cumulative | imported package",
+        "import time:       100 |        100 |   yaml.error",
+        "import time:       300 |        400 | yaml",
+        "import time:        50 |         50 | json",
+    ])
+
+    total_us, modules = parse_importtime(stderr)
+
+    assert total_us == 450
+    assert modules == {'yaml.error', 'yaml', 'json'}
+
+
+def test_bench_measures_the_real_dispatch():
+    # Without a stored record `status` asks OCI, which loads the SDK.
+    status = measure_command('status', repeat=1)
+    report = measure_command('report', repeat=1)
+
+    assert 'oci' in status['heavy']
+    assert report['heavy'] == []
+    assert report['status'] == 'ok'
+
+
+def test_bench_marks_failing_commands_instead_of_timing_them():
+    result = measure_command('no-such-command', repeat=1)
+
+    assert result['status'] == 'failed'
+    assert result['wall_ms'] is None and result['import_ms'] is None
+    assert "invalid choice" in result['error']
+
+
+def test_export_android_needs_a_known_server_ip(workdir):
+    output = _run(workdir, 'export-android', returncode=1)
+
+    assert "No known server IP" in output
@@ -0,0 +1,125 @@
+# Tests for the ss-local supervisor.
+# A small Python script stands in for ss-local: it reads the generated JSON
+# config and listens on local_port with SO_REUSEPORT, like the real client.
+
+import json
+import os
+import socket
+import stat
+import sys
+import time
+
+import pytest
+
+from src.client_supervisor import ClientSupervisor
+from src.local_client_manager import LocalClientManager
+
+FAKE_SS_LOCAL = f"""#!{sys.executable}
+import json, socket, sys
+config = json.load(open(sys.argv[2]))
+sock = socket.socket()
+sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+sock.bind((config['local_address'], config['local_port']))
+sock.listen(16)
+while True:
+    conn, _ = sock.accept()
+    conn.close()
+"""
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+@pytest.fixture
+def client_manager(tmp_path):
+    executable = tmp_path / "ss-local"
+    executable.write_text(FAKE_SS_LOCAL)
+    executable.chmod(executable.stat().st_mode | stat.S_IEXEC)
+    manager = LocalClientManager({
+        'server_ip': '203.0.113.10',
+        'server_port': 8388,
+        'local_port': _free_port(),
+        'password': 'pw',
+        'method': 'aes-256-gcm',
+    })
+    manager.client_executable = str(executable)
+    manager.client_config_path = str(tmp_path / "ss-local-temp.json")
+    yield manager
+    if manager.client_process is not None and manager.client_process.poll() is None:
+        manager.client_process.kill()
+        manager.client_process.wait()
+
+
+def test_start_waits_for_socks_port(client_manager):
+    """The supervisor only reports success once the local port accepts."""
+    supervisor = ClientSupervisor(client_manager, check_interval=0.05)
+    try:
+        success, message = supervisor.start()
+        assert success is True, message
+        assert "ready" in message
+        with socket.create_connection(('127.0.0.1', client_manager.config['local_port']), timeout=1):
+            pass
+    finally:
+        supervisor.stop()
+
+    assert client_manager.get_client_status()[0] == "STOPPED"
+    assert not os.path.exists(client_manager.client_config_path)
+
+
+def test_crashed_client_is_restarted(client_manager):
+    """A killed ss-local is detected and replaced after the backoff."""
+    events = []
+    supervisor = ClientSupervisor(client_manager, check_interval=0.05, min_backoff=0.05, on_event=events.append)
+    try:
+        assert supervisor.start()[0]
+        first_pid = client_manager.client_process.pid
+        client_manager.client_process.kill()
+
+        assert _wait_until(lambda: supervisor.restart_count == 1
+                           and client_manager.get_client_status()[0] == "RUNNING")
+        assert client_manager.client_process.pid != first_pid
+        assert any("not healthy" in event for event in events)
+    finally:
+        supervisor.stop()
+
+
+def test_switch_server_keeps_port_open(client_manager):
+    """A hot swap starts the replacement before stopping the old process."""
+    supervisor = ClientSupervisor(client_manager, check_interval=0.05)
+    try:
+        assert supervisor.start()[0]
+        old_process = client_manager.client_process
+
+        success, message = supervisor.switch_server('198.51.100.20')
+
+        assert success is True, message
+        assert client_manager.client_process is not old_process
+        assert old_process.poll() is not None
+        with open(client_manager.client_config_path) as f:
+            assert json.load(f)['server'] == '198.51.100.20'
+        with socket.create_connection(('127.0.0.1', client_manager.config['local_port']), timeout=1):
+            pass
+    finally:
+        supervisor.stop()
+
+
+def test_start_fails_when_executable_missing(client_manager):
+    client_manager.client_executable = "/nonexistent/ss-local"
+
+    success, message = ClientSupervisor(client_manager).start()
+
+    assert success is False
+    assert "not found" in message
@@ -0,0 +1,111 @@
+# Tests for the cloud-init bootstrap path and the port readiness probe.
+# The rendered user-data script is compared against a golden file; refresh it
+# with render_user_data(GOLDEN_CONFIG) when the provisioning steps change.
+
+import base64
+import os
+import socket
+import subprocess
+import threading
+import unittest.mock as mock
+
+import pytest
+
+from src.cloud_init import encode_user_data, render_user_data
+from src.instance_state import InstanceStateStore
+from src.net_probe import probe_port, wait_for_port
+from src.oci_manager import OCIManager
+from src.server_config import CONFIG_HASH_TAG, config_hash
+
+GOLDEN_CONFIG = {
+    'server_port': 8388,
+    'password': 'golden-password',
+    'method': 'chacha20-ietf-poly1305',
+    'local_port': 1080,
+}
+GOLDEN_FILE = os.path.join(os.path.dirname(__file__), "golden", "cloud_init_user_data.sh")
+
+
+def test_user_data_matches_golden_file():
+    """TC-CI-001: The rendered script is byte-for-byte stable."""
+    with open(GOLDEN_FILE, 'r') as f:
+        expected = f.read()
+
+    assert render_user_data(GOLDEN_CONFIG) == expected
+
+
+def test_user_data_is_valid_bash():
+    """TC-CI-002: The script parses as bash."""
+    result = subprocess.run(['bash', '-n'], input=render_user_data(GOLDEN_CONFIG), text=True)
+
+    assert result.returncode == 0
+
+
+def test_user_data_tracks_config_changes():
+    """TC-CI-003: A different password yields a different embedded hash."""
+    changed = dict(GOLDEN_CONFIG, password='other')
+
+    assert config_hash(changed) in render_user_data(changed)
+    assert config_hash(GOLDEN_CONFIG) not in render_user_data(changed)
+
+
+def test_launch_passes_user_data_and_config_hash(tmp_path):
+    """TC-CI-004: cloud-init launches carry the script and are tagged as configured."""
+    config = {
+        'oci': {'compartment_id': 'ocid1.compartment.test', 'key_file': '/nonexistent/key'},
+        'compute': {
+            'availability_domain': 'AD-1',
+            'instance_shape': 'VM.Standard.E2.1.Micro',
+            'image_id': 'ocid1.image.test',
+            'subnet_id': 'ocid1.subnet.test',
+            'bootstrap': 'cloud-init',
+        },
+        'shadowsocks': GOLDEN_CONFIG,
+    }
+    compute_client = mock.MagicMock()
+    launched = compute_client.launch_instance.return_value.data
+    launched.id, launched.lifecycle_state, launched.freeform_tags = 'ocid1.instance.new', 'PROVISIONING', {}
+    manager = OCIManager(config, compute_client, mock.MagicMock(),
+                         InstanceStateStore(str(tmp_path / "state.json")))
+
+    manager.launch_instance('ssh-rsa AAAA')
+
+    details = compute_client.launch_instance.call_args[1]['launch_instance_details']
+    script = base64.b64decode(details.metadata['user_data']).decode('utf-8')
+    assert script == render_user_data(GOLDEN_CONFIG)
+    assert details.freeform_tags[CONFIG_HASH_TAG] == config_hash(GOLDEN_CONFIG)
+    assert encode_user_data(script) == details.metadata['user_data']
+
+
+def test_wait_for_port_detects_late_listener():
+    """TC-CI-005: The probe succeeds once a listener appears on the port."""
+    with socket.socket() as reserve:
+        reserve.bind(('127.0.0.1', 0))
+        port = reserve.getsockname()[1]
+    listener = socket.socket()
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+    def listen():
+        listener.bind(('127.0.0.1', port))
+        listener.listen(1)
+
+    assert probe_port('127.0.0.1', port, timeout=0.5) is None
+    timer = threading.Timer(0.3, listen)
+    timer.start()
+    try:
+        waited = wait_for_port('127.0.0.1', port, timeout=5, interval=0.05)
+    finally:
+        timer.join()
+        listener.close()
+
+    assert waited >= 0.25
+
+
+def test_wait_for_port_times_out():
+    """TC-CI-006: A closed port raises once the timeout expires."""
+    with socket.socket() as reserve:
+        reserve.bind(('127.0.0.1', 0))
+        port = reserve.getsockname()[1]
+
+    with pytest.raises(TimeoutError):
+        wait_for_port('127.0.0.1', port, timeout=0.3, interval=0.05)
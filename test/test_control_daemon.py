@@ -0,0 +1,146 @@
+# Tests for the Unix-socket control daemon and its thin-client proxies.
+
+import datetime
+import os
+import socket
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+
+from src.control_daemon import (
+    INVALID_REQUEST,
+    METHOD_NOT_FOUND,
+    ControlDaemon,
+    DaemonClient,
+    DaemonError,
+    RemoteOCIManager,
+    RemoteUsageTracker,
+)
+from src.usage_tracker import UsageTracker
+
+
+@pytest.fixture
+def oci_manager():
+    manager = MagicMock()
+    manager.get_instance_status.return_value = ("RUNNING", "Instance is currently RUNNING.")
+    manager.stop_instance.return_value = (True, "Instance stopped.")
+    return manager
+
+
+@pytest.fixture
+def running_daemon(tmp_path, oci_manager):
+    clock = lambda: datetime.datetime(2024, 6, 1, 12, 0, 0)
+    tracker = UsageTracker({}, log_file=str(tmp_path / "usage.jsonl"), legacy_file=None, clock=clock)
+    daemon = ControlDaemon({}, socket_path=str(tmp_path / "run" / "ctl.sock"),
+                           oci_manager=oci_manager, usage_tracker=tracker)
+    daemon.bind()
+    thread = threading.Thread(target=daemon.serve_forever, daemon=True)
+    thread.start()
+    yield daemon
+    daemon.shutdown()
+    thread.join(timeout=5)
+
+
+def test_thin_client_proxies(running_daemon, oci_manager):
+    client = DaemonClient.connect(running_daemon.socket_path)
+    try:
+        assert client.call('ping') == 'pong'
+        assert RemoteOCIManager(client).get_instance_status() == ("RUNNING", "Instance is currently RUNNING.")
+        assert RemoteOCIManager(client).stop_instance() == (True, "Instance stopped.")
+
+        running_daemon.usage_tracker.log_start('ocid1.instance.a')
+        usage = RemoteUsageTracker(client)
+        assert usage.open_session()['instance_id'] == 'ocid1.instance.a'
+        lines = list(usage.iter_report(since=datetime.date(2024, 6, 1), fmt='csv'))
+        assert lines[0].startswith('instance_id,')
+        assert lines[1].startswith('ocid1.instance.a,')
+    finally:
+        client.close()
+
+    # Both OCI calls reused the daemon's single manager.
+    assert oci_manager.get_instance_status.call_count == 1
+    assert oci_manager.stop_instance.call_count == 1
+
+
+def test_errors_are_reported(running_daemon, oci_manager):
+    oci_manager.get_instance_status.side_effect = RuntimeError("boom")
+    client = DaemonClient.connect(running_daemon.socket_path)
+    try:
+        with pytest.raises(DaemonError, match="boom"):
+            client.call('oci.get_instance_status')
+        with pytest.raises(DaemonError) as excinfo:
+            client.call('oci.launch_instance')
+        assert excinfo.value.code == METHOD_NOT_FOUND
+        # The connection stays usable after errors.
+        assert client.call('ping') == 'pong'
+    finally:
+        client.close()
+
+
+def test_socket_is_owner_only(running_daemon):
+    assert os.stat(running_daemon.socket_path).st_mode & 0o077 == 0
+
+
+def test_second_daemon_refuses_to_start(running_daemon, oci_manager):
+    with pytest.raises(RuntimeError, match="already listening"):
+        ControlDaemon({}, socket_path=running_daemon.socket_path, oci_manager=oci_manager,
+                      usage_tracker=MagicMock()).bind()
+
+
+def test_shutdown_removes_socket(running_daemon):
+    client = DaemonClient.connect(running_daemon.socket_path)
+    assert client.call('shutdown') is True
+    client.close()
+
+    for _ in range(50):
+        if not os.path.exists(running_daemon.socket_path):
+            break
+        threading.Event().wait(0.05)
+    assert not os.path.exists(running_daemon.socket_path)
+    assert DaemonClient.connect(running_daemon.socket_path) is None
+
+
+def test_stale_socket_is_ignored_and_replaced(tmp_path, oci_manager):
+    path = str(tmp_path / "stale.sock")
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(path)
+    stale.close()
+
+    assert DaemonClient.connect(path) is None
+    daemon = ControlDaemon({}, socket_path=path, oci_manager=oci_manager, usage_tracker=MagicMock())
+    daemon.bind()
+    daemon._server.server_close()
+
+
+def test_slow_stop_outlasts_the_call_timeout(tmp_path, oci_manager):
+    """Stopping waits for STOPPED, which takes longer than ordinary calls may."""
+    def slow_stop():
+        threading.Event().wait(0.5)
+        return True, "Instance stopped."
+    oci_manager.stop_instance.side_effect = slow_stop
+    daemon = ControlDaemon({}, socket_path=str(tmp_path / "ctl.sock"), oci_manager=oci_manager,
+                           usage_tracker=MagicMock())
+    daemon.bind()
+    thread = threading.Thread(target=daemon.serve_forever, daemon=True)
+    thread.start()
+    try:
+        client = DaemonClient.connect(daemon.socket_path, timeout=0.1)
+        assert RemoteOCIManager(client).stop_instance() == (True, "Instance stopped.")
+        # Ordinary calls keep their limit, and a timed-out client is closed.
+        oci_manager.get_instance_status.side_effect = lambda: slow_stop()
+        with pytest.raises(OSError):
+            client.call('oci.get_instance_status')
+        with pytest.raises(OSError):
+            client.call('ping')
+    finally:
+        daemon.shutdown()
+        thread.join(timeout=5)
+
+
+def test_non_object_request_is_invalid(running_daemon):
+    for line in ('[1, 2]', '42', '"ping"'):
+        response = running_daemon.dispatch(line)
+
+        assert response['error']['code'] == INVALID_REQUEST
+        assert response['id'] is None
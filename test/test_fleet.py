@@ -0,0 +1,164 @@
+# Tests for fleet mode, using stubbed OCI and client managers whose calls
+# sleep to stand in for API latency.
+
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+from src.fleet import Fleet, format_table
+from src.instance_state import InstanceStateStore
+
+CONFIG = {
+    'oci': {'region': 'us-ashburn-1', 'compartment_id': 'c1'},
+    'compute': {'availability_domain': 'AD-1', 'state_ttl_seconds': 60},
+    'shadowsocks': {'server_port': 443, 'password': 'p', 'method': 'aes-256-gcm', 'local_port': 1080},
+    'pool': {'members': [
+        {'name': 'ashburn'},
+        {'name': 'frankfurt-1', 'oci': {'region': 'eu-frankfurt-1'}},
+        {'name': 'frankfurt-2', 'oci': {'region': 'eu-frankfurt-1'}},
+        {'name': 'frankfurt-3', 'oci': {'region': 'eu-frankfurt-1'}},
+        {'name': 'tokyo', 'oci': {'region': 'ap-tokyo-1'}},
+    ]},
+}
+
+
+class _Tracker:
+    """Counts concurrent calls per region."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = {}
+        self.peak = {}
+
+    def enter(self, region):
+        with self.lock:
+            self.active[region] = self.active.get(region, 0) + 1
+            self.peak[region] = max(self.peak.get(region, 0), self.active[region])
+
+    def leave(self, region):
+        with self.lock:
+            self.active[region] -= 1
+
+
+def _factory(tracker=None, delay=0.2, failing=()):
+    def build(member):
+        region = member['oci']['region']
+        manager = MagicMock()
+
+        def status():
+            if tracker:
+                tracker.enter(region)
+            time.sleep(delay)
+            if tracker:
+                tracker.leave(region)
+            if member['compute']['project_tag'].endswith(failing):
+                raise RuntimeError("ServiceError 500")
+            return "RUNNING", f"Instance in {region} is RUNNING."
+        manager.get_instance_status.side_effect = status
+        return manager
+    return build
+
+
+def test_members_run_concurrently():
+    fleet = Fleet(CONFIG, manager_factory=_factory(delay=0.2))
+    started = time.monotonic()
+    rows = fleet.run('status')
+    elapsed = time.monotonic() - started
+
+    assert [row['name'] for row in rows] == ['ashburn', 'frankfurt-1', 'frankfurt-2', 'frankfurt-3', 'tokyo']
+    assert all(row['ok'] and row['status'] == "RUNNING" for row in rows)
+    assert rows[1]['region'] == 'eu-frankfurt-1'
+    # Five members of 0.2 s each: about as long as one, far from the serial 1.0 s.
+    assert elapsed < 0.6
+
+
+def test_per_region_limit_is_respected():
+    tracker = _Tracker()
+    fleet = Fleet(CONFIG, per_region_limit=2, manager_factory=_factory(tracker, delay=0.1))
+    fleet.run('status')
+
+    assert tracker.peak['eu-frankfurt-1'] == 2
+    assert tracker.peak['us-ashburn-1'] == 1
+
+
+def test_failures_become_error_rows():
+    events = []
+    fleet = Fleet(CONFIG, names=['ashburn', 'tokyo'], manager_factory=_factory(delay=0, failing=('tokyo',)),
+                  on_event=events.append)
+    rows = fleet.run('status')
+
+    assert rows[0]['ok'] is True
+    assert rows[1]['ok'] is False
+    assert rows[1]['status'] == "ERROR"
+    assert rows[1]['message'] == "ServiceError 500"
+    assert sorted(event.split(':')[0] for event in events) == ['ashburn', 'tokyo']
+
+
+def test_stop_reports_each_member():
+    manager = MagicMock()
+    manager.stop_instance.return_value = (True, "Instance stopped.")
+    fleet = Fleet(CONFIG, names=['tokyo'], manager_factory=lambda member: manager)
+    rows = fleet.run('stop')
+
+    manager.stop_instance.assert_called_once_with()
+    assert rows[0]['ok'] is True
+    assert rows[0]['status'] == "STOPPED"
+    assert rows[0]['message'] == "Instance stopped."
+
+
+def test_failed_stop_is_an_error_row():
+    manager = MagicMock()
+    manager.stop_instance.return_value = (False, "OCI Service Error: boom")
+    rows = Fleet(CONFIG, names=['tokyo'], manager_factory=lambda member: manager).run('stop')
+
+    assert (rows[0]['ok'], rows[0]['status']) == (False, "ERROR")
+
+
+def test_unknown_member_and_action():
+    try:
+        Fleet(CONFIG, names=['nowhere'])
+    except KeyError:
+        pass
+    else:
+        raise AssertionError("expected KeyError")
+    try:
+        Fleet(CONFIG).run('reboot')
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("expected ValueError")
+
+
+def test_default_managers_share_one_state_store():
+    fleet = Fleet(CONFIG, names=['ashburn', 'tokyo'])
+    with patch('src.oci_manager.OCIManager') as manager_class:
+        fleet.manager_factory(fleet.member_configs['ashburn'])
+        fleet.manager_factory(fleet.member_configs['tokyo'])
+
+    stores = [call.kwargs['state_store'] for call in manager_class.call_args_list]
+    assert stores[0] is stores[1]
+
+
+def test_state_store_concurrent_puts_keep_all_records(tmp_path):
+    path = str(tmp_path / "state.json")
+    store = InstanceStateStore(path=path)
+    threads = [threading.Thread(target=store.put, args=(f"tag-{i}",), kwargs={'instance_id': f"id-{i}"})
+               for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(InstanceStateStore(path=path)._load()) == 20
+
+
+def test_format_table():
+    rows = [
+        {'name': 'ashburn', 'region': 'us-ashburn-1', 'status': 'RUNNING', 'seconds': 1.25, 'message': 'ok'},
+        {'name': 'tokyo', 'region': 'ap-tokyo-1', 'status': 'ERROR', 'seconds': 0.5, 'message': 'boom'},
+    ]
+    lines = format_table(rows).splitlines()
+
+    assert lines[0].split() == ['MEMBER', 'REGION', 'STATUS', 'TIME', 'DETAILS']
+    assert lines[1].split() == ['ashburn', 'us-ashburn-1', 'RUNNING', '1.2s', 'ok']
+    assert lines[2].index('ERROR') == lines[1].index('RUNNING')
@@ -0,0 +1,154 @@
+# Tests for idle-based auto-shutdown, driven by a fake clock.
+
+import socket
+from unittest.mock import MagicMock
+
+import pytest
+
+from src.idle_watcher import IdleWatcher
+from src.local_client_manager import LocalClientManager
+from src.proxy_bench import measure_download
+from src.traffic_meter import TrafficMeter
+
+
+class FakeTime:
+    """A clock whose waits advance time instantly and record the requested delays."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.waits = []
+
+    def clock(self):
+        return self.now
+
+    def wait(self, seconds):
+        self.waits.append(seconds)
+        self.now += seconds
+        return False
+
+
+class ScriptedActivity:
+    """Returns meter snapshots as a function of the fake time."""
+
+    def __init__(self, fake_time, busy_until):
+        self.fake_time = fake_time
+        self.busy_until = busy_until
+        self.bytes = 0
+
+    def __call__(self):
+        if self.fake_time.now < self.busy_until:
+            self.bytes += 1000
+        return {'active_connections': 0, 'bytes_in': self.bytes, 'bytes_out': 0}
+
+
+@pytest.fixture
+def fake_time():
+    return FakeTime()
+
+
+@pytest.fixture
+def oci_manager():
+    manager = MagicMock()
+    manager.stop_instance.return_value = (True, "Instance stopped.")
+    return manager
+
+
+def test_stops_instance_after_idle_window(fake_time, oci_manager):
+    tracker = MagicMock()
+    activity = ScriptedActivity(fake_time, busy_until=1000.0 + 601)
+    watcher = IdleWatcher(oci_manager, tracker, activity, idle_minutes=30, check_interval=30,
+                          clock=fake_time.clock, wait=fake_time.wait)
+
+    success, message = watcher.run()
+
+    assert success is True
+    oci_manager.stop_instance.assert_called_once()
+    tracker.log_stop.assert_called_once()
+    # The last traffic was seen at t+600s, so shutdown happens 30 minutes later.
+    assert fake_time.now == pytest.approx(1000.0 + 600 + 1800)
+
+
+def test_open_connection_counts_as_activity(fake_time, oci_manager):
+    watcher = IdleWatcher(oci_manager, MagicMock(), lambda: {'active_connections': 1, 'bytes_in': 0, 'bytes_out': 0},
+                          idle_minutes=1, check_interval=10, clock=fake_time.clock, wait=fake_time.wait)
+
+    for _ in range(20):
+        assert watcher.check() == 0
+        fake_time.now += 10
+
+    oci_manager.stop_instance.assert_not_called()
+
+
+def test_ticks_do_not_drift_when_checks_are_slow(fake_time, oci_manager):
+    def slow_activity():
+        fake_time.now += 4
+        return {'active_connections': 0, 'bytes_in': 0, 'bytes_out': 0}
+
+    watcher = IdleWatcher(oci_manager, MagicMock(), slow_activity, idle_minutes=1, check_interval=10,
+                          clock=fake_time.clock, wait=fake_time.wait)
+
+    watcher.run()
+
+    assert fake_time.waits[:3] == [6, 6, 6]
+
+
+def test_failed_stop_keeps_session_open(fake_time, oci_manager):
+    oci_manager.stop_instance.return_value = (False, "ServiceError")
+    tracker = MagicMock()
+    watcher = IdleWatcher(oci_manager, tracker, lambda: {'active_connections': 0, 'bytes_in': 0, 'bytes_out': 0},
+                          idle_minutes=1, check_interval=10, clock=fake_time.clock, wait=fake_time.wait)
+
+    success, message = watcher.run()
+
+    assert success is False
+    assert "ServiceError" in message
+    tracker.log_stop.assert_not_called()
+
+
+def test_stop_ends_the_watch(oci_manager):
+    watcher = IdleWatcher(oci_manager, MagicMock(), lambda: {'active_connections': 0, 'bytes_in': 0, 'bytes_out': 0},
+                          idle_minutes=30, check_interval=0.01)
+    watcher.stop()
+
+    success, message = watcher.run()
+
+    assert success is False
+    oci_manager.stop_instance.assert_not_called()
+
+
+def test_metered_traffic_is_flushed_before_the_session_closes(fake_time, oci_manager):
+    calls = []
+    tracker = MagicMock()
+    tracker.log_stop.side_effect = lambda: calls.append('log_stop')
+    watcher = IdleWatcher(oci_manager, tracker, lambda: {'active_connections': 0, 'bytes_in': 0, 'bytes_out': 0},
+                          idle_minutes=1, check_interval=10, on_stopped=lambda: calls.append('flush'),
+                          clock=fake_time.clock, wait=fake_time.wait)
+
+    watcher.run()
+
+    assert calls == ['flush', 'log_stop']
+
+
+def test_watcher_sees_traffic_sent_to_the_pac_proxy(fake_time, oci_manager, http_server, socks5_server):
+    """With metering on, the PAC points applications at the meter, so their traffic keeps the instance up."""
+    base, _ = http_server({})
+    _, socks_port, _ = socks5_server
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        meter_port = probe.getsockname()[1]
+    manager = LocalClientManager({'local_port': socks_port}, meter_port=meter_port)
+    pac_port = int(manager.pac_proxy().split(';')[0].rsplit(':', 1)[1])
+    meter = TrafficMeter(meter_port, socks_port, sample_interval=60)
+    meter.start()
+    watcher = IdleWatcher(oci_manager, MagicMock(), meter.snapshot, idle_minutes=1, check_interval=10,
+                          clock=fake_time.clock, wait=fake_time.wait)
+    watcher.last_activity = fake_time.now
+    try:
+        watcher.check()
+        fake_time.now += 50
+        measure_download(f"{base}/bytes/10000", '127.0.0.1', pac_port)
+
+        assert pac_port == meter_port
+        assert watcher.check() == 0
+    finally:
+        meter.stop()
@@ -0,0 +1,233 @@
+# Tests for the capacity-aware launch strategy. The OCI manager is a stub
+# whose launches fail, succeed or take a while per availability domain.
+
+import asyncio
+import threading
+import unittest.mock as mock
+
+import oci
+import pytest
+
+from src.launch_strategy import (CapacityCache, LaunchError, LaunchStrategy, candidate_label,
+                                 candidates_from_config)
+from src.lifecycle_waiter import LifecycleWaitError
+
+COMPUTE = {
+    'availability_domain': 'AD-1',
+    'instance_shape': 'VM.Standard.A1.Flex',
+    'ocpus': 2,
+    'memory_in_gbs': 12,
+    'image_id': 'ocid1.image.arm',
+    'subnet_id': 'ocid1.subnet.test',
+    'launch_candidates': [
+        {'availability_domain': 'AD-2'},
+        {'availability_domain': 'AD-3'},
+        {'instance_shape': 'VM.Standard.E2.1.Micro', 'image_id': 'ocid1.image.x86', 'ignored': True},
+    ],
+}
+
+
+def _capacity_error():
+    return oci.exceptions.ServiceError(500, 'InternalError', {}, 'Out of host capacity.')
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class FakeManager:
+    """Launches per AD: 'capacity' fails, a number is seconds until RUNNING, 'dies' ends TERMINATED."""
+
+    def __init__(self, behaviour):
+        self.behaviour = behaviour
+        self.launched = []
+        self.terminated = []
+        self.remembered = []
+        self.lock = threading.Lock()
+        self.waiter = mock.MagicMock()
+        self.waiter.wait_async.side_effect = self._wait
+
+    def launch_instance(self, ssh_public_key, candidate):
+        outcome = self.behaviour[candidate['availability_domain']]
+        if outcome == 'capacity':
+            raise _capacity_error()
+        with self.lock:
+            instance = mock.MagicMock(id=f"ocid1.instance.{candidate['availability_domain']}")
+            instance.candidate = candidate
+            self.launched.append(instance.id)
+        return instance
+
+    async def _wait(self, instance_id, state, timeout):
+        outcome = self.behaviour[instance_id.rsplit('.', 1)[1]]
+        if outcome == 'dies':
+            raise LifecycleWaitError(f"Instance {instance_id} is TERMINATED.", 'TERMINATED')
+        if outcome == 'fails':
+            raise LifecycleWaitError(f"Instance {instance_id} failed.")
+        await asyncio.sleep(outcome)
+        return mock.MagicMock(id=instance_id, lifecycle_state='RUNNING')
+
+    def terminate_instance(self, instance_id):
+        with self.lock:
+            self.terminated.append(instance_id)
+
+    def _remember(self, instance):
+        self.remembered.append(instance.id)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return CapacityCache(str(tmp_path / "capacity_cache.json"), ttl_seconds=1800, clock=FakeClock())
+
+
+def test_candidates_from_config():
+    candidates = candidates_from_config(COMPUTE)
+
+    assert [c['availability_domain'] for c in candidates] == ['AD-1', 'AD-2', 'AD-3', 'AD-1']
+    assert candidates[1]['ocpus'] == 2
+    assert candidates[3]['instance_shape'] == 'VM.Standard.E2.1.Micro'
+    assert candidates[3]['image_id'] == 'ocid1.image.x86'
+    assert 'ignored' not in candidates[3]
+    assert candidate_label(candidates[0]) == "AD-1/VM.Standard.A1.Flex (2 OCPU, 12 GB)"
+    assert candidate_label(candidates[3]) == "AD-1/VM.Standard.E2.1.Micro"
+    assert candidates_from_config({'availability_domain': 'AD-1', 'launch_candidates': [{}]}) == \
+        [{'availability_domain': 'AD-1'}]
+
+
+def test_falls_back_after_capacity_error_and_remembers_it(cache):
+    manager = FakeManager({'AD-1': 'capacity', 'AD-2': 0})
+    strategy = LaunchStrategy(manager, candidates_from_config(COMPUTE)[:2], cache)
+
+    result = strategy.launch('ssh-rsa AAAA')
+
+    assert result['instance'].id == 'ocid1.instance.AD-2'
+    assert result['candidate']['availability_domain'] == 'AD-2'
+    assert [(label.split('/')[0], outcome) for label, outcome, _ in result['attempts']] == \
+        [('AD-1', 'Out of host capacity.'), ('AD-2', 'RUNNING')]
+    assert result['time_to_running'] >= 0
+    assert manager.remembered == ['ocid1.instance.AD-2']
+    assert cache.failed_at({'availability_domain': 'AD-1', 'instance_shape': 'VM.Standard.A1.Flex'}) is not None
+
+
+def test_recent_capacity_failures_are_skipped(cache):
+    candidates = candidates_from_config(COMPUTE)[:2]
+    cache.record_failure(candidates[0], "Out of host capacity.")
+    manager = FakeManager({'AD-1': 0, 'AD-2': 0})
+    events = []
+
+    result = LaunchStrategy(manager, candidates, cache, on_event=events.append).launch('key')
+
+    assert result['candidate']['availability_domain'] == 'AD-2'
+    assert manager.launched == ['ocid1.instance.AD-2']
+    assert any(event.startswith("Skipping AD-1") for event in events)
+
+
+def test_failures_expire_and_all_blocked_candidates_are_still_tried(cache):
+    candidates = candidates_from_config(COMPUTE)[:2]
+    cache.record_failure(candidates[1])
+    cache.clock.now += 10
+    cache.record_failure(candidates[0])
+    strategy = LaunchStrategy(FakeManager({}), candidates, cache)
+
+    # Both blocked: least recently failed first.
+    assert [c['availability_domain'] for c in strategy.ordered_candidates()] == ['AD-2', 'AD-1']
+    cache.clock.now += 1800
+    assert [c['availability_domain'] for c in strategy.ordered_candidates()] == ['AD-1', 'AD-2']
+
+
+def test_success_clears_the_failure(cache):
+    candidates = candidates_from_config(COMPUTE)[:1]
+    cache.record_failure(candidates[0])
+    LaunchStrategy(FakeManager({'AD-1': 0}), candidates, cache).launch('key')
+
+    assert cache.failed_at(candidates[0]) is None
+
+
+def test_instance_terminated_after_launch_counts_as_capacity_failure(cache):
+    manager = FakeManager({'AD-1': 'dies', 'AD-2': 0})
+    candidates = candidates_from_config(COMPUTE)[:2]
+
+    result = LaunchStrategy(manager, candidates, cache).launch('key')
+
+    assert result['candidate']['availability_domain'] == 'AD-2'
+    # OCI already terminated it.
+    assert manager.terminated == []
+    assert cache.failed_at(candidates[0]) is not None
+
+
+def test_other_wait_failures_terminate_without_caching(cache):
+    manager = FakeManager({'AD-1': 'fails', 'AD-2': 0})
+    candidates = candidates_from_config(COMPUTE)[:2]
+
+    result = LaunchStrategy(manager, candidates, cache).launch('key')
+
+    assert result['candidate']['availability_domain'] == 'AD-2'
+    assert manager.terminated == ['ocid1.instance.AD-1']
+    assert cache.failed_at(candidates[0]) is None
+
+
+def test_failing_terminate_does_not_stop_the_fallback(cache):
+    manager = FakeManager({'AD-1': 'fails', 'AD-2': 0})
+
+    def terminate(instance_id):
+        raise oci.exceptions.ServiceError(409, 'Conflict', {}, 'Instance is already terminating.')
+    manager.terminate_instance = terminate
+    events = []
+
+    result = LaunchStrategy(manager, candidates_from_config(COMPUTE)[:2], cache, on_event=events.append).launch('key')
+
+    assert result['candidate']['availability_domain'] == 'AD-2'
+    assert "Could not terminate ocid1.instance.AD-1: Instance is already terminating." in events
+
+
+def test_race_keeps_the_fastest_and_terminates_the_others(cache):
+    manager = FakeManager({'AD-1': 0.5, 'AD-2': 0.05, 'AD-3': 0.5})
+    strategy = LaunchStrategy(manager, candidates_from_config(COMPUTE)[:3], cache, parallel=3)
+
+    result = strategy.launch('key')
+
+    assert result['instance'].id == 'ocid1.instance.AD-2'
+    assert sorted(manager.terminated) == ['ocid1.instance.AD-1', 'ocid1.instance.AD-3']
+    outcomes = {label.split('/')[0]: outcome for label, outcome, _ in result['attempts']}
+    assert outcomes == {'AD-1': 'cancelled', 'AD-2': 'RUNNING', 'AD-3': 'cancelled'}
+    # The losers' capacity is fine; only real capacity errors are cached.
+    assert cache.failed_at(candidates_from_config(COMPUTE)[0]) is None
+
+
+def test_race_refills_the_window_after_a_failure(cache):
+    manager = FakeManager({'AD-1': 'capacity', 'AD-2': 'capacity', 'AD-3': 0})
+    strategy = LaunchStrategy(manager, candidates_from_config(COMPUTE)[:3], cache, parallel=2)
+
+    assert strategy.launch('key')['candidate']['availability_domain'] == 'AD-3'
+    assert manager.terminated == []
+
+
+def test_all_candidates_failing_raises(cache):
+    manager = FakeManager({'AD-1': 'capacity', 'AD-2': 'capacity'})
+
+    with pytest.raises(LaunchError) as excinfo:
+        LaunchStrategy(manager, candidates_from_config(COMPUTE)[:2], cache).launch('key')
+
+    assert len(excinfo.value.attempts) == 2
+    assert "Out of host capacity." in str(excinfo.value)
+
+
+def test_other_errors_fall_back_without_caching(cache):
+    manager = FakeManager({'AD-2': 0})
+    manager.behaviour['AD-1'] = 'limit'
+    original = manager.launch_instance
+
+    def launch(ssh_public_key, candidate):
+        if candidate['availability_domain'] == 'AD-1':
+            raise oci.exceptions.ServiceError(400, 'LimitExceeded', {}, 'Service limit exceeded.')
+        return original(ssh_public_key, candidate)
+    manager.launch_instance = launch
+    candidates = candidates_from_config(COMPUTE)[:2]
+
+    result = LaunchStrategy(manager, candidates, cache).launch('key')
+
+    assert result['candidate']['availability_domain'] == 'AD-2'
+    assert cache.failed_at(candidates[0]) is None
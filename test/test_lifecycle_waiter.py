@@ -0,0 +1,140 @@
+# Tests for the adaptive lifecycle waiter.
+# A fake clock is advanced by the waiter's own sleeps so long waits run instantly.
+
+import threading
+import unittest.mock as mock
+
+import pytest
+
+from src.lifecycle_waiter import (
+    LifecycleWaiter,
+    LifecycleWaitError,
+    LifecycleWaitTimeout,
+    LifecycleWaitCancelled,
+)
+
+
+class FakeClock:
+    """A monotonic clock whose time only moves when a sleep is simulated."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+
+class FakeCancelEvent:
+    """A cancel event whose wait() advances the fake clock instead of blocking."""
+
+    def __init__(self, clock, cancel_after=None):
+        self.clock = clock
+        self.cancel_after = cancel_after
+
+    def is_set(self):
+        return self.cancel_after is not None and self.clock.now >= self.cancel_after
+
+    def wait(self, timeout):
+        self.clock.sleeps.append(timeout)
+        self.clock.now += timeout
+        return self.is_set()
+
+
+def _compute_client(states):
+    """Builds a compute client whose get_instance walks through `states`."""
+    client = mock.MagicMock()
+    responses = []
+    for state in states:
+        response = mock.MagicMock()
+        response.data.lifecycle_state = state
+        responses.append(response)
+    client.get_instance.side_effect = responses + [responses[-1]] * 1000
+    return client
+
+
+def test_poll_interval_follows_transition_window():
+    """Sleeps to the window start, polls fast inside it and backs off after it."""
+    waiter = LifecycleWaiter(mock.MagicMock(), fast_interval=2, slow_interval=10, max_interval=30)
+
+    assert waiter.poll_interval('RUNNING', 0) == 10
+    assert waiter.poll_interval('RUNNING', 10) == 5
+    assert waiter.poll_interval('RUNNING', 14.5) == 2
+    assert waiter.poll_interval('RUNNING', 60) == 2
+    assert 10 < waiter.poll_interval('RUNNING', 140) <= 30
+    assert waiter.poll_interval('RUNNING', 10000) == 30
+
+
+def test_wait_returns_instance_with_few_polls():
+    """Reaches the target state with far fewer calls than fixed 1s polling."""
+    clock = FakeClock()
+    client = _compute_client(['PROVISIONING'] * 3 + ['STARTING'] * 5 + ['RUNNING'])
+    waiter = LifecycleWaiter(client, clock=clock)
+
+    instance = waiter.wait('ocid1.instance.test', 'RUNNING', cancel_event=FakeCancelEvent(clock))
+
+    assert instance.lifecycle_state == 'RUNNING'
+    assert waiter.poll_count == 9
+    assert clock.sleeps[:2] == [10, 5]
+
+
+def test_wait_times_out_at_deadline():
+    """Raises once the deadline passes and never sleeps beyond it."""
+    clock = FakeClock()
+    waiter = LifecycleWaiter(_compute_client(['STOPPING']), clock=clock)
+
+    with pytest.raises(LifecycleWaitTimeout):
+        waiter.wait('ocid1.instance.test', 'STOPPED', timeout=45, cancel_event=FakeCancelEvent(clock))
+
+    assert clock.now == 45
+
+
+def test_wait_fails_fast_on_dead_end_state():
+    """A terminated instance can never become RUNNING."""
+    waiter = LifecycleWaiter(_compute_client(['TERMINATED']))
+
+    with pytest.raises(LifecycleWaitError, match="can no longer reach RUNNING"):
+        waiter.wait('ocid1.instance.test', 'RUNNING')
+
+
+def test_wait_can_be_cancelled():
+    """Setting the cancel event aborts the wait."""
+    clock = FakeClock()
+    waiter = LifecycleWaiter(_compute_client(['STARTING']), clock=clock)
+
+    with pytest.raises(LifecycleWaitCancelled):
+        waiter.wait('ocid1.instance.test', 'RUNNING', cancel_event=FakeCancelEvent(clock, cancel_after=30))
+
+
+def test_wait_with_real_event_is_interruptible():
+    """A real threading.Event cancels a sleeping wait from another thread."""
+    cancel_event = threading.Event()
+    waiter = LifecycleWaiter(_compute_client(['STARTING']), slow_interval=60)
+    threading.Timer(0.05, cancel_event.set).start()
+
+    with pytest.raises(LifecycleWaitCancelled):
+        waiter.wait('ocid1.instance.test', 'RUNNING', cancel_event=cancel_event)
+
+
+def test_wait_many_waits_concurrently():
+    """Several instances are awaited from one event loop; failures are reported per instance."""
+    client = mock.MagicMock()
+    states = {'a': ['STARTING', 'RUNNING'], 'b': ['STOPPING', 'STOPPED'], 'c': ['TERMINATED']}
+    calls = {key: 0 for key in states}
+
+    def get_instance(instance_id):
+        sequence = states[instance_id]
+        response = mock.MagicMock()
+        response.data.lifecycle_state = sequence[min(calls[instance_id], len(sequence) - 1)]
+        calls[instance_id] += 1
+        return response
+
+    client.get_instance.side_effect = get_instance
+    waiter = LifecycleWaiter(client, fast_interval=0.01, slow_interval=0.01)
+    waiter.TRANSITION_WINDOWS = {}
+
+    results = waiter.wait_many({'a': 'RUNNING', 'b': 'STOPPED', 'c': 'RUNNING'}, timeout=5)
+
+    assert results['a'].lifecycle_state == 'RUNNING'
+    assert results['b'].lifecycle_state == 'STOPPED'
+    assert isinstance(results['c'], LifecycleWaitError)
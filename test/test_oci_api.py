@@ -0,0 +1,222 @@
+# Tests for the rate-limited OCI client wrapper. The SDK client is a stub,
+# and time, sleeps and jitter are injected so backoff is instant.
+
+import threading
+import time
+from unittest.mock import MagicMock
+
+import oci
+import pytest
+
+from src.oci_api import ApiMetrics, RateLimitedClient, TokenBucket, format_metrics, is_retryable
+
+
+class FakeClock:
+    def __init__(self, now=100.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def _error(status, headers=None):
+    return oci.exceptions.ServiceError(status, 'Code', headers or {}, 'message')
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def wrap(clock):
+    def build(client, **kwargs):
+        bucket = kwargs.pop('bucket', None) or TokenBucket(1000, 1000, clock=clock, sleep=clock.sleep)
+        kwargs.setdefault('metrics', ApiMetrics())
+        return RateLimitedClient(client, bucket, clock=clock, sleep=clock.sleep, jitter=lambda: 1.0, **kwargs)
+    return build
+
+
+def test_token_bucket_limits_rate(clock):
+    bucket = TokenBucket(rate=2, burst=2, clock=clock, sleep=clock.sleep)
+    waits = [bucket.acquire() for _ in range(6)]
+
+    assert waits[:2] == [0, 0]
+    # After the burst, one token every 0.5 s.
+    assert clock.now == pytest.approx(102.0)
+
+
+def test_throttled_read_is_retried_with_backoff(wrap, clock):
+    client = MagicMock()
+    client.get_instance.side_effect = [_error(429), _error(503), 'response']
+    wrapped = wrap(client, backoff_base=0.5)
+
+    assert wrapped.get_instance('ocid1.instance.a') == 'response'
+    assert client.get_instance.call_count == 3
+    # Full jitter at its maximum: 0.5 s, then 1 s.
+    assert clock.now == pytest.approx(101.5)
+    stats = wrapped._metrics.snapshot()['get_instance']
+    assert (stats['calls'], stats['retries'], stats['throttled'], stats['errors']) == (3, 2, 1, 0)
+
+
+def test_retry_after_header_is_honoured(wrap, clock):
+    client = MagicMock()
+    client.list_instances.side_effect = [_error(429, {'retry-after': '7'}), 'response']
+
+    assert wrap(client).list_instances(compartment_id='c') == 'response'
+    assert clock.now == pytest.approx(107.0)
+
+
+def test_retries_give_up(wrap):
+    client = MagicMock()
+    client.get_instance.side_effect = _error(500)
+    wrapped = wrap(client, max_retries=2)
+
+    with pytest.raises(oci.exceptions.ServiceError):
+        wrapped.get_instance('a')
+    assert client.get_instance.call_count == 3
+    assert wrapped._metrics.snapshot()['get_instance']['errors'] == 1
+
+
+def test_client_errors_are_not_retried(wrap):
+    client = MagicMock()
+    client.get_instance.side_effect = _error(404)
+
+    with pytest.raises(oci.exceptions.ServiceError):
+        wrap(client).get_instance('a')
+    assert client.get_instance.call_count == 1
+
+
+def test_writes_retry_server_errors_only_with_retry_token():
+    assert is_retryable(_error(429), write=True)
+    assert not is_retryable(_error(500), write=True)
+    assert is_retryable(_error(500), write=True, idempotent=True)
+    assert not is_retryable(_error(409))
+
+
+def test_write_without_retry_token_is_not_repeated(wrap):
+    client = MagicMock()
+    client.instance_action.side_effect = _error(502)
+
+    with pytest.raises(oci.exceptions.ServiceError):
+        wrap(client).instance_action('a', 'START')
+    assert client.instance_action.call_count == 1
+
+
+def test_launch_with_retry_token_is_retried(wrap):
+    client = MagicMock()
+    client.launch_instance.side_effect = [_error(502), 'launched']
+
+    assert wrap(client).launch_instance(launch_instance_details='d', opc_retry_token='t') == 'launched'
+    assert client.launch_instance.call_count == 2
+
+
+def test_reads_are_cached_until_ttl_or_write(wrap, clock):
+    client = MagicMock()
+    client.get_instance.side_effect = lambda instance_id: object()
+    wrapped = wrap(client, cache_ttl=1.0)
+
+    first = wrapped.get_instance('a')
+    assert wrapped.get_instance('a') is first
+    assert wrapped.get_instance('b') is not first
+    wrapped.instance_action('a', 'STOP')
+    assert wrapped.get_instance('a') is not first
+    clock.now += 1.5
+    wrapped.get_instance('a')
+
+    assert client.get_instance.call_count == 4
+    assert wrapped._metrics.snapshot()['get_instance']['cache_hits'] == 1
+
+
+def test_failed_write_still_invalidates_cache(wrap):
+    client = MagicMock()
+    client.get_security_list.side_effect = ['v1', 'v2']
+    client.update_security_list.side_effect = _error(412)
+    wrapped = wrap(client)
+
+    assert wrapped.get_security_list('sl') == 'v1'
+    with pytest.raises(oci.exceptions.ServiceError):
+        wrapped.update_security_list('sl', 'details', if_match='etag')
+    assert wrapped.get_security_list('sl') == 'v2'
+
+
+def test_identical_reads_in_flight_are_coalesced():
+    release = threading.Event()
+    client = MagicMock()
+
+    def slow_get(instance_id):
+        release.wait(5)
+        return 'response'
+    client.get_instance.side_effect = slow_get
+    wrapped = RateLimitedClient(client, TokenBucket(1000, 1000), cache_ttl=0, metrics=ApiMetrics())
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(wrapped.get_instance('a'))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == ['response'] * 5
+    assert client.get_instance.call_count == 1
+    assert wrapped._metrics.snapshot()['get_instance']['coalesced'] == 4
+
+
+def test_coalesced_followers_see_the_error():
+    release = threading.Event()
+    client = MagicMock()
+
+    def failing_get(instance_id):
+        release.wait(5)
+        raise _error(404)
+    client.get_instance.side_effect = failing_get
+    wrapped = RateLimitedClient(client, TokenBucket(1000, 1000), metrics=ApiMetrics())
+    errors = []
+
+    def call():
+        try:
+            wrapped.get_instance('a')
+        except oci.exceptions.ServiceError as e:
+            errors.append(e.status)
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert errors == [404] * 3
+    assert client.get_instance.call_count == 1
+
+
+def test_non_callable_attributes_pass_through(wrap):
+    class Client:
+        endpoint = 'https://iaas.example'
+
+    assert wrap(Client()).endpoint == 'https://iaas.example'
+
+
+def test_format_metrics():
+    metrics = ApiMetrics()
+    metrics.record('get_instance', calls=3, retries=1, throttled=1)
+    metrics.record_latency('get_instance', 0.120)
+    lines = format_metrics(metrics.snapshot()).splitlines()
+
+    assert lines[0].split()[:3] == ['OPERATION', 'CALLS', 'ERRORS']
+    assert lines[1].split() == ['get_instance', '3', '0', '1', '1', '0', '0', '120ms', '120ms']
+    assert format_metrics({}) == "No OCI API calls recorded."
+
+
+def test_capacity_errors_are_not_retried(wrap):
+    client = MagicMock()
+    client.launch_instance.side_effect = _error(500)
+    client.launch_instance.side_effect.message = 'Out of host capacity.'
+
+    with pytest.raises(oci.exceptions.ServiceError):
+        wrap(client).launch_instance(launch_instance_details='d', opc_retry_token='t')
+    assert client.launch_instance.call_count == 1
@@ -0,0 +1,257 @@
+# Tests for OCIManager instance lookup and its local state cache.
+# The compute and network clients are stubs; the state store writes to a
+# temporary directory.
+
+import unittest.mock as mock
+
+import oci
+import pytest
+
+from src.instance_state import InstanceStateStore
+from src.oci_manager import OCIManager
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def app_config():
+    return {
+        'oci': {'compartment_id': 'ocid1.compartment.test', 'key_file': '/nonexistent/key'},
+        'compute': {'subnet_id': 'ocid1.subnet.test'},
+    }
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def state_store(tmp_path, clock):
+    return InstanceStateStore(str(tmp_path / "instance_state.json"), ttl_seconds=60, clock=clock)
+
+
+def _instance(instance_id, state, tagged=True):
+    instance = mock.MagicMock()
+    instance.id = instance_id
+    instance.lifecycle_state = state
+    instance.freeform_tags = {'project': 'shadowsocks-proxy'} if tagged else {}
+    return instance
+
+
+def _page(instances, next_page=None):
+    response = mock.MagicMock()
+    response.data = instances
+    response.next_page = next_page
+    return response
+
+
+def test_fresh_record_needs_no_api_calls(app_config, state_store):
+    """A record verified within the TTL answers the lookup on its own."""
+    state_store.put('shadowsocks-proxy', instance_id='ocid1.instance.a', lifecycle_state='RUNNING')
+    compute_client = mock.MagicMock()
+    manager = OCIManager(app_config, compute_client, mock.MagicMock(), state_store)
+
+    instance = manager.find_existing_instance()
+
+    assert instance.id == 'ocid1.instance.a'
+    compute_client.get_instance.assert_not_called()
+    compute_client.list_instances.assert_not_called()
+
+
+def test_stale_record_is_revalidated_with_one_get(app_config, state_store, clock):
+    """An expired record costs a single get_instance instead of a listing."""
+    state_store.put('shadowsocks-proxy', instance_id='ocid1.instance.a', lifecycle_state='RUNNING')
+    clock.now += 120
+    compute_client = mock.MagicMock()
+    compute_client.get_instance.return_value.data = _instance('ocid1.instance.a', 'RUNNING')
+    manager = OCIManager(app_config, compute_client, mock.MagicMock(), state_store)
+
+    instance = manager.find_existing_instance()
+
+    assert instance.id == 'ocid1.instance.a'
+    compute_client.get_instance.assert_called_once_with('ocid1.instance.a')
+    compute_client.list_instances.assert_not_called()
+    assert state_store.is_fresh(state_store.get('shadowsocks-proxy'))
+
+
+def test_vanished_instance_falls_back_to_lazy_listing(app_config, state_store, clock):
+    """A deleted cached instance triggers a paginated search that stops at the first match."""
+    state_store.put('shadowsocks-proxy', instance_id='ocid1.instance.gone', lifecycle_state='RUNNING')
+    clock.now += 120
+    compute_client = mock.MagicMock()
+    compute_client.get_instance.side_effect = oci.exceptions.ServiceError(404, 'NotAuthorizedOrNotFound', {}, 'gone')
+    compute_client.list_instances.side_effect = [
+        _page([_instance('ocid1.instance.other', 'RUNNING', tagged=False)], next_page='page-2'),
+        _page([_instance('ocid1.instance.b', 'RUNNING')], next_page='page-3'),
+        _page([_instance('ocid1.instance.c', 'RUNNING')]),
+    ]
+    manager = OCIManager(app_config, compute_client, mock.MagicMock(), state_store)
+
+    instance = manager.find_existing_instance()
+
+    assert instance.id == 'ocid1.instance.b'
+    assert compute_client.list_instances.call_count == 2
+    assert compute_client.list_instances.call_args[1]['page'] == 'page-2'
+    assert state_store.get('shadowsocks-proxy')['instance_id'] == 'ocid1.instance.b'
+
+
+def test_status_survives_between_invocations(app_config, state_store, tmp_path, clock):
+    """The instance OCID is persisted, so a later CLI call can report status."""
+    compute_client = mock.MagicMock()
+    compute_client.list_instances.return_value = _page([_instance('ocid1.instance.a', 'STOPPED')])
+    OCIManager(app_config, compute_client, mock.MagicMock(), state_store).get_instance_status()
+
+    reloaded = InstanceStateStore(state_store.path, ttl_seconds=60, clock=clock)
+    second_client = mock.MagicMock()
+    manager = OCIManager(app_config, second_client, mock.MagicMock(), reloaded)
+
+    assert manager.instance_id == 'ocid1.instance.a'
+    assert manager.get_instance_status()[0] == 'STOPPED'
+    second_client.list_instances.assert_not_called()
+
+
+def test_public_ip_is_cached_for_the_recorded_instance(app_config, state_store):
+    """The VNIC lookup runs once while the record is fresh."""
+    state_store.put('shadowsocks-proxy', instance_id='ocid1.instance.a', lifecycle_state='RUNNING')
+    compute_client = mock.MagicMock()
+    attachment = mock.MagicMock(lifecycle_state='ATTACHED', vnic_id='ocid1.vnic.a')
+    compute_client.list_vnic_attachments.return_value.data = [attachment]
+    networking_client = mock.MagicMock()
+    networking_client.get_vnic.return_value.data.public_ip = '203.0.113.10'
+    manager = OCIManager(app_config, compute_client, networking_client, state_store)
+
+    assert manager.get_public_ip('ocid1.instance.a') == '203.0.113.10'
+    assert manager.get_public_ip('ocid1.instance.a') == '203.0.113.10'
+    networking_client.get_vnic.assert_called_once()
+
+
+def test_public_ip_lookup_does_not_refresh_a_stale_record(app_config, state_store, clock):
+    """Storing the IP leaves the lifecycle state as old as it was."""
+    state_store.put('shadowsocks-proxy', instance_id='ocid1.instance.a', lifecycle_state='STOPPED')
+    clock.now += 61
+    compute_client = mock.MagicMock()
+    attachment = mock.MagicMock(lifecycle_state='ATTACHED', vnic_id='ocid1.vnic.a')
+    compute_client.list_vnic_attachments.return_value.data = [attachment]
+    networking_client = mock.MagicMock()
+    networking_client.get_vnic.return_value.data.public_ip = '203.0.113.10'
+    manager = OCIManager(app_config, compute_client, networking_client, state_store)
+
+    assert manager.get_public_ip('ocid1.instance.a') == '203.0.113.10'
+    record = state_store.get('shadowsocks-proxy')
+    assert record['public_ip'] == '203.0.113.10'
+    assert not state_store.is_fresh(record)
+
+
+def test_warm_standby_resumes_stopped_instance(app_config, state_store):
+    """create_or_get_instance starts the stopped proxy rather than launching a new one."""
+    app_config['compute']['warm_standby'] = True
+    compute_client = mock.MagicMock()
+    compute_client.list_instances.return_value = _page([_instance('ocid1.instance.a', 'STOPPED')])
+    compute_client.get_instance.return_value.data = _instance('ocid1.instance.a', 'RUNNING')
+    manager = OCIManager(app_config, compute_client, mock.MagicMock(), state_store)
+
+    instance, message = manager.create_or_get_instance()
+
+    assert instance.lifecycle_state == 'RUNNING'
+    assert "Resumed" in message
+    compute_client.instance_action.assert_called_once_with('ocid1.instance.a', 'START')
+    compute_client.launch_instance.assert_not_called()
+
+
+def test_stopped_instance_ignored_without_warm_standby(app_config, state_store):
+    """Only running instances are reused when warm standby is disabled."""
+    manager = OCIManager(app_config, mock.MagicMock(), mock.MagicMock(), state_store)
+
+    assert manager.reusable_states() == ('RUNNING',)
+
+
+def test_launch_candidate_overrides_compute_config(app_config, state_store):
+    """A launch candidate replaces the AD, shape, size and image of the launch."""
+    app_config['compute'].update({'availability_domain': 'AD-1', 'instance_shape': 'VM.Standard.E2.1.Micro',
+                                  'image_id': 'ocid1.image.x86'})
+    compute_client = mock.MagicMock()
+    compute_client.launch_instance.return_value.data = _instance('ocid1.instance.new', 'PROVISIONING')
+    manager = OCIManager(app_config, compute_client, mock.MagicMock(), state_store)
+
+    manager.launch_instance('ssh-rsa AAAA', {'availability_domain': 'AD-2', 'instance_shape': 'VM.Standard.A1.Flex',
+                                             'ocpus': 2, 'memory_in_gbs': 12, 'image_id': 'ocid1.image.arm'})
+
+    details = compute_client.launch_instance.call_args[1]['launch_instance_details']
+    assert (details.availability_domain, details.shape, details.image_id) == \
+        ('AD-2', 'VM.Standard.A1.Flex', 'ocid1.image.arm')
+    assert (details.shape_config.ocpus, details.shape_config.memory_in_gbs) == (2, 12)
+    assert compute_client.launch_instance.call_args[1]['opc_retry_token']
+
+
+def test_terminate_forgets_only_its_own_record(app_config, state_store):
+    """Terminating a losing launch leaves the winner's record alone."""
+    state_store.put('shadowsocks-proxy', instance_id='ocid1.instance.winner', lifecycle_state='RUNNING')
+    compute_client = mock.MagicMock()
+    manager = OCIManager(app_config, compute_client, mock.MagicMock(), state_store)
+
+    manager.terminate_instance('ocid1.instance.loser')
+    assert state_store.get('shadowsocks-proxy')['instance_id'] == 'ocid1.instance.winner'
+    manager.terminate_instance('ocid1.instance.winner')
+
+    assert state_store.get('shadowsocks-proxy') is None
+    compute_client.terminate_instance.assert_called_with('ocid1.instance.winner', preserve_boot_volume=False)
+
+
+def test_stop_looks_up_an_instance_launched_by_another_process(app_config, state_store, clock):
+    """A long-lived manager (the daemon's) stops the instance a later `start` launched."""
+    compute_client = mock.MagicMock()
+    compute_client.list_instances.return_value = _page([])
+    manager = OCIManager(app_config, compute_client, mock.MagicMock(), state_store)
+    assert manager.instance_id is None
+
+    # Another process launches an instance and records it.
+    clock.now += 1
+    other = InstanceStateStore(state_store.path, ttl_seconds=60, clock=clock)
+    other.put('shadowsocks-proxy', instance_id='ocid1.instance.new', lifecycle_state='RUNNING')
+    manager.waiter = mock.MagicMock()
+    manager.waiter.wait.return_value = _instance('ocid1.instance.new', 'STOPPED')
+
+    assert manager.stop_instance() == (True, "Instance stopped.")
+    compute_client.instance_action.assert_called_once_with('ocid1.instance.new', 'SOFTSTOP')
+
+
+def test_stop_without_running_instance(app_config, state_store):
+    compute_client = mock.MagicMock()
+    compute_client.list_instances.return_value = _page([])
+    manager = OCIManager(app_config, compute_client, mock.MagicMock(), state_store)
+
+    assert manager.stop_instance() == (True, "No running instance to stop.")
+    compute_client.instance_action.assert_not_called()
+
+
+def test_store_merges_records_written_by_other_processes(tmp_path, clock):
+    """Saving never drops records another store instance wrote in the meantime."""
+    path = str(tmp_path / "instance_state.json")
+    daemon_store = InstanceStateStore(path, clock=clock)
+    daemon_store.put('shadowsocks-proxy', instance_id='ocid1.instance.a', lifecycle_state='RUNNING')
+
+    InstanceStateStore(path, clock=clock).put('shadowsocks-proxy-tokyo', instance_id='ocid1.instance.b',
+                                              lifecycle_state='RUNNING')
+    daemon_store.put('shadowsocks-proxy', lifecycle_state='STOPPED')
+
+    reloaded = InstanceStateStore(path, clock=clock)
+    assert reloaded.get('shadowsocks-proxy')['lifecycle_state'] == 'STOPPED'
+    assert reloaded.get('shadowsocks-proxy-tokyo')['instance_id'] == 'ocid1.instance.b'
+
+
+def test_configure_closes_the_ssh_connection(app_config, state_store):
+    """The pooled SSH connection does not outlive provisioning, even when it fails."""
+    manager = OCIManager(app_config, mock.MagicMock(), mock.MagicMock(), state_store)
+    manager.ssh_pool = mock.MagicMock()
+    manager.provisioner = mock.MagicMock()
+    manager.provisioner.provision.side_effect = RuntimeError("boom")
+
+    assert manager.configure_instance(_instance('ocid1.instance.a', 'RUNNING'), '203.0.113.10')[0] is False
+    manager.ssh_pool.close.assert_called_once_with('203.0.113.10')
@@ -0,0 +1,77 @@
+# Tests for SIP002 URL generation and the batch profile exporter.
+
+import json
+import os
+from unittest import mock
+
+import pytest
+
+from src.local_client_manager import LocalClientManager
+from src.profile_exporter import MANIFEST_FILE, ProfileExporter, sip002_url
+
+SHADOWSOCKS = {'server_port': 8388, 'password': 'test', 'method': 'aes-128-gcm', 'local_port': 1080}
+
+
+@pytest.mark.parametrize('kwargs, expected', [
+    # The examples from the SIP002 specification.
+    ({'server': '192.168.100.1', 'server_port': 8888, 'method': 'aes-128-gcm', 'password': 'test', 'tag': 'Example1'},
+     'ss://YWVzLTEyOC1nY206dGVzdA@192.168.100.1:8888#Example1'),
+    ({'server': '192.168.100.1', 'server_port': 8888, 'method': 'rc4-md5', 'password': 'passwd',
+      'plugin': 'obfs-local', 'plugin_opts': 'obfs=http', 'tag': 'Example2'},
+     'ss://cmM0LW1kNTpwYXNzd2Q@192.168.100.1:8888/?plugin=obfs-local%3Bobfs%3Dhttp#Example2'),
+    ({'server': '192.168.100.1', 'server_port': 8888, 'method': '2022-blake3-aes-256-gcm',
+      'password': 'YctPZ6U7xPPcU+gp3u+0tx/tRizJN9K8y+uKlW2qjlI=', 'tag': 'Example3'},
+     'ss://2022-blake3-aes-256-gcm:YctPZ6U7xPPcU%2Bgp3u%2B0tx%2FtRizJN9K8y%2BuKlW2qjlI%3D@192.168.100.1:8888#Example3'),
+    ({'server': '2001:db8::1', 'server_port': 443, 'method': 'aes-128-gcm', 'password': 'test'},
+     'ss://YWVzLTEyOC1nY206dGVzdA@[2001:db8::1]:443'),
+])
+def test_sip002_url(kwargs, expected):
+    assert sip002_url(**kwargs) == expected
+
+
+@mock.patch('qrcode.make')
+def test_connection_details_use_sip002(mock_qrcode_make):
+    url, _ = LocalClientManager(dict(SHADOWSOCKS, server_ip='192.168.100.1')).generate_connection_details()
+
+    assert url == 'ss://YWVzLTEyOC1nY206dGVzdA@192.168.100.1:8388'
+
+
+def test_device_overrides(tmp_path):
+    exporter = ProfileExporter(SHADOWSOCKS, output_dir=str(tmp_path))
+    profiles = exporter.build_profiles('203.0.113.7', [
+        {'name': 'alice phone'},
+        {'name': 'laptop', 'server_port': 8443, 'plugin': 'v2ray-plugin', 'plugin_opts': 'tls'},
+    ])
+
+    assert profiles[0]['url'] == 'ss://YWVzLTEyOC1nY206dGVzdA@203.0.113.7:8388#alice%20phone'
+    assert profiles[0]['file'] == str(tmp_path / 'alice-phone.svg')
+    assert profiles[1]['url'].startswith('ss://YWVzLTEyOC1nY206dGVzdA@203.0.113.7:8443/?plugin=v2ray-plugin%3Btls#')
+    with pytest.raises(ValueError):
+        exporter.build_profiles('203.0.113.7', [{'name': 'a b'}, {'name': 'a-b'}])
+
+
+def test_unchanged_profiles_are_not_rendered_again(tmp_path):
+    devices = [{'name': 'phone'}, {'name': 'tablet'}, {'name': 'laptop', 'password': 'other'}]
+    exporter = ProfileExporter(SHADOWSOCKS, output_dir=str(tmp_path), fmt='terminal', workers=1)
+
+    assert exporter.export('203.0.113.7', devices)[1] == 3
+    assert exporter.export('203.0.113.7', devices)[1] == 0
+    devices[2]['password'] = 'rotated'
+    assert exporter.export('203.0.113.7', devices)[1] == 1
+    assert exporter.export('203.0.113.8', devices)[1] == 3
+
+    with open(tmp_path / "profiles.json") as f:
+        assert [p['name'] for p in json.load(f)] == ['phone', 'tablet', 'laptop']
+    assert '█' in (tmp_path / "phone.txt").read_text(encoding='utf-8')
+    assert os.path.exists(tmp_path / MANIFEST_FILE)
+
+
+def test_svg_rendering_in_process_pool(tmp_path):
+    exporter = ProfileExporter(SHADOWSOCKS, output_dir=str(tmp_path), fmt='svg', workers=2)
+
+    profiles, rendered = exporter.export('203.0.113.7', [{'name': f'device-{i}'} for i in range(4)])
+
+    assert rendered == 4
+    for profile in profiles:
+        with open(profile['file']) as f:
+            assert f.read().lstrip().startswith('<?xml')
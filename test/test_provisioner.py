@@ -0,0 +1,241 @@
+# Tests for the SSH provisioning engine.
+# A paramiko server stub listens on localhost and answers exec requests from
+# a scripted table, so the real SSH code paths are exercised without sshd.
+
+import socket
+import threading
+import time
+
+import paramiko
+import pytest
+
+from src.provisioner import (
+    Provisioner,
+    ProvisioningError,
+    ProvisioningStep,
+    SSHSessionPool,
+    shadowsocks_steps,
+)
+
+HOST_KEY = paramiko.RSAKey.generate(2048)
+
+
+class StubSSHServer(paramiko.ServerInterface):
+    """Accepts any public key and runs exec requests through a responder."""
+
+    def __init__(self, responder, executed):
+        self.responder = responder
+        self.executed = executed
+
+    def check_auth_publickey(self, username, key):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def get_allowed_auths(self, username):
+        return 'publickey'
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED
+
+    def check_channel_exec_request(self, channel, command):
+        command = command.decode('utf-8')
+        self.executed.append(command)
+        threading.Thread(target=self._respond, args=(channel, command), daemon=True).start()
+        return True
+
+    def _respond(self, channel, command):
+        # Let paramiko acknowledge the exec request before answering on the channel.
+        time.sleep(0.05)
+        exit_status, stdout, stderr = self.responder(command)
+        if stdout:
+            channel.sendall(stdout.encode('utf-8'))
+        if stderr:
+            channel.sendall_stderr(stderr.encode('utf-8'))
+        channel.send_exit_status(exit_status)
+        channel.close()
+
+
+class StubSSHHost:
+    """A localhost SSH endpoint counting connections and executed commands."""
+
+    def __init__(self, responder, port=0, start_delay=0):
+        self.responder = responder
+        self.executed = []
+        self.connections = 0
+        self.sock = None
+        self.port = port
+        self.transports = []
+        if start_delay:
+            threading.Timer(start_delay, self._listen).start()
+        else:
+            self._listen()
+
+    def _listen(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(('127.0.0.1', self.port))
+        self.port = self.sock.getsockname()[1]
+        self.sock.listen(8)
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+
+    def _accept_loop(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            self.connections += 1
+            transport = paramiko.Transport(conn)
+            transport.add_server_key(HOST_KEY)
+            transport.start_server(server=StubSSHServer(self.responder, self.executed))
+            self.transports.append(transport)
+
+    def close(self):
+        for transport in self.transports:
+            transport.close()
+        if self.sock:
+            self.sock.close()
+
+
+@pytest.fixture
+def client_key(tmp_path):
+    path = tmp_path / "id_rsa"
+    paramiko.RSAKey.generate(2048).write_private_key_file(str(path))
+    return str(path)
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _table(results):
+    """Builds a responder that looks commands up by prefix."""
+    def responder(command):
+        for prefix, result in results.items():
+            if command.startswith(prefix):
+                return result
+        return 0, '', ''
+    return responder
+
+
+def test_applies_only_steps_whose_check_fails(client_key):
+    """Satisfied steps are skipped; the rest run with streamed output."""
+    host = StubSSHHost(_table({
+        'check-a': (0, '', ''),
+        'check-b': (1, '', ''),
+        'apply-b': (0, 'line one\nline two\n', 'warning\n'),
+    }))
+    output = []
+    pool = SSHSessionPool('opc', client_key, port=host.port)
+    provisioner = Provisioner(pool, on_output=lambda h, stream, line: output.append((stream, line)))
+    steps = [
+        ProvisioningStep('a', 'apply-a', check='check-a'),
+        ProvisioningStep('b', 'apply-b', check='check-b'),
+        ProvisioningStep('restart', 'apply-restart', check='check-a', rerun_on_change=True),
+    ]
+
+    try:
+        result = provisioner.provision('127.0.0.1', steps)
+    finally:
+        pool.close_all()
+        host.close()
+
+    assert result['applied'] == ['b', 'restart']
+    assert result['skipped'] == ['a']
+    assert 'apply-a' not in host.executed
+    assert ('stdout', 'line one') in output and ('stdout', 'line two') in output
+    assert ('stderr', 'warning') in output
+    assert host.connections == 1
+
+
+def test_failed_step_raises(client_key):
+    """A non-zero exit status stops provisioning with a clear error."""
+    host = StubSSHHost(_table({'check': (1, '', ''), 'apply': (2, '', 'boom\n')}))
+    pool = SSHSessionPool('opc', client_key, port=host.port)
+    try:
+        with pytest.raises(ProvisioningError, match="'x' failed"):
+            Provisioner(pool).provision('127.0.0.1', [ProvisioningStep('x', 'apply', check='check')])
+    finally:
+        pool.close_all()
+        host.close()
+
+
+def test_hanging_command_times_out(client_key):
+    """A command that never exits is abandoned after command_timeout."""
+    release = threading.Event()
+
+    def responder(command):
+        if command.startswith('apply'):
+            release.wait(10)
+        return 1, '', ''
+
+    host = StubSSHHost(responder)
+    pool = SSHSessionPool('opc', client_key, port=host.port)
+    try:
+        started = time.monotonic()
+        with pytest.raises(ProvisioningError, match="did not finish within 0.3s"):
+            Provisioner(pool, command_timeout=0.3).provision('127.0.0.1', [ProvisioningStep('x', 'apply', check='check')])
+        assert time.monotonic() - started < 2
+    finally:
+        release.set()
+        pool.close_all()
+        host.close()
+
+
+def test_pool_retries_until_sshd_is_up_and_reuses_connection(client_key):
+    """Connection refusals while the server boots are retried, then the session is reused."""
+    port = _free_port()
+    host = StubSSHHost(_table({}), port=port, start_delay=0.3)
+    pool = SSHSessionPool('opc', client_key, port=port, retry_deadline=10, retry_interval=0.1)
+    try:
+        started = time.monotonic()
+        first = pool.get('127.0.0.1')
+        assert time.monotonic() - started >= 0.25
+        assert pool.get('127.0.0.1') is first
+    finally:
+        pool.close_all()
+        host.close()
+    assert host.connections == 1
+
+
+def test_provision_many_runs_hosts_in_parallel(client_key):
+    """Slow steps on several hosts overlap instead of adding up."""
+    def slow(command):
+        time.sleep(0.3)
+        return 0, '', ''
+
+    hosts = [StubSSHHost(slow) for _ in range(3)]
+    pools = {}
+
+    class PerPortPool:
+        def get(self, name):
+            port = int(name.split(':')[1])
+            pools.setdefault(port, SSHSessionPool('opc', client_key, port=port))
+            return pools[port].get('127.0.0.1')
+
+    try:
+        started = time.monotonic()
+        results = Provisioner(PerPortPool()).provision_many(
+            [f"127.0.0.1:{h.port}" for h in hosts], [ProvisioningStep('s', 'apply')])
+        elapsed = time.monotonic() - started
+    finally:
+        for pool in pools.values():
+            pool.close_all()
+        for h in hosts:
+            h.close()
+
+    assert all(result['applied'] == ['s'] for result in results.values())
+    assert elapsed < 0.8
+
+
+def test_shadowsocks_steps_are_idempotent_by_config_hash():
+    """The config step is skipped by comparing the remote hash with the local one."""
+    steps = shadowsocks_steps({'server_port': 8388, 'password': 'pw', 'method': 'aes-256-gcm'})
+    names = [step.name for step in steps]
+    write_config = steps[names.index('write-config')]
+
+    assert names == ['install', 'write-config', 'open-firewall', 'enable-service']
+    assert 'config.hash' in write_config.check
+    assert 'pw' not in write_config.command
+    assert steps[-1].rerun_on_change
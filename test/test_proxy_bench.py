@@ -0,0 +1,108 @@
+# Tests for the proxy benchmark suite.
+# Runs fully offline: a local SOCKS5 stand-in relays to a local HTTP target.
+
+import json
+
+import pytest
+
+from src.proxy_bench import (
+    BenchError,
+    compare_results,
+    measure_download,
+    measure_upload,
+    percentiles,
+    run_benchmark,
+    save_results,
+    load_results,
+    socks5_connect,
+)
+
+
+def test_percentiles_use_nearest_rank():
+    summary = percentiles(list(range(1, 101)))
+
+    assert summary['p50'] == 50
+    assert summary['p95'] == 95
+    assert summary['p99'] == 99
+    assert summary['min'] == 1 and summary['max'] == 100
+    assert percentiles([]) is None
+
+
+def test_download_and_upload_through_socks(http_server, socks5_server):
+    base, _ = http_server({})
+    proxy_host, proxy_port, proxy = socks5_server
+
+    download = measure_download(f"{base}/bytes/200000", proxy_host, proxy_port)
+    upload = measure_upload(f"{base}/upload", proxy_host, proxy_port, 300000)
+
+    assert download['bytes'] == 200000
+    assert download['connect'] > 0 and download['ttfb'] > 0
+    assert upload['bytes'] == 300000
+    assert proxy.connections == 2
+
+
+@pytest.mark.parametrize('framing', ['chunked', 'until-close'])
+def test_download_without_content_length(http_server, socks5_server, framing):
+    base, _ = http_server({})
+    proxy_host, proxy_port, _ = socks5_server
+
+    download = measure_download(f"{base}/{framing}/150000", proxy_host, proxy_port, timeout=5)
+
+    assert download['bytes'] == 150000
+
+
+def test_upload_keeps_the_query_string(http_server, socks5_server):
+    base, hits = http_server({})
+    proxy_host, proxy_port, _ = socks5_server
+
+    measure_upload(f"{base}/upload?run=7", proxy_host, proxy_port, 1000)
+
+    assert hits == ['/upload?run=7']
+
+
+def test_connect_latency_reflects_proxy_delay(http_server, socks5_server):
+    """A slow CONNECT on the proxy shows up in the connect percentiles."""
+    base, _ = http_server({})
+    proxy_host, proxy_port, proxy = socks5_server
+    proxy.latency = 0.05
+
+    results = run_benchmark(f"{base}/bytes/1000", proxy_host, proxy_port, streams=2, requests_per_stream=3)
+
+    assert results['requests'] == 6
+    assert results['errors'] == 0
+    assert results['connect_ms']['p50'] >= 50
+
+
+def test_benchmark_results_are_json_and_comparable(http_server, socks5_server, tmp_path):
+    base, _ = http_server({})
+    proxy_host, proxy_port, proxy = socks5_server
+
+    baseline = run_benchmark(f"{base}/bytes/100000", proxy_host, proxy_port, streams=4, requests_per_stream=2,
+                             upload_url=f"{base}/upload", upload_bytes=100000)
+    path = str(tmp_path / "baseline.json")
+    save_results(baseline, path)
+    assert load_results(path) == json.loads(json.dumps(baseline))
+    assert baseline['download_mbps'] > 0 and baseline['upload_mbps'] > 0
+
+    proxy.latency = 0.2
+    slower = run_benchmark(f"{base}/bytes/100000", proxy_host, proxy_port, streams=4, requests_per_stream=2)
+
+    regressions = compare_results(baseline, slower)
+    assert any(r.startswith('connect_ms.p50') for r in regressions)
+    assert compare_results(baseline, baseline) == []
+
+
+def test_errors_are_counted_not_raised(socks5_server):
+    proxy_host, proxy_port, _ = socks5_server
+
+    results = run_benchmark("http://127.0.0.1:1/bytes/10", proxy_host, proxy_port, streams=1, requests_per_stream=2)
+
+    assert results['errors'] == 2
+    assert results['connect_ms'] is None
+
+
+def test_socks_connect_rejects_failed_connect(socks5_server):
+    proxy_host, proxy_port, _ = socks5_server
+
+    with pytest.raises(BenchError, match="reply code 5"):
+        socks5_connect(proxy_host, proxy_port, '127.0.0.1', 1)
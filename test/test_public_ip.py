@@ -0,0 +1,104 @@
+# Tests for the racing, cached public IP detector.
+# Resolvers are local HTTP stand-ins with scripted delays and answers.
+
+import os
+import time
+
+import pytest
+
+from src.public_ip import PublicIPDetector
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_fastest_valid_resolver_wins(http_server, tmp_path):
+    """The answer arrives as soon as the quickest resolver responds."""
+    base, _ = http_server({
+        '/slow': (1.5, 200, '203.0.113.1'),
+        '/fast': (0.05, 200, '198.51.100.7\n'),
+    })
+    detector = PublicIPDetector({4: [f"{base}/slow", f"{base}/fast"]}, timeout=3,
+                                cache_path=str(tmp_path / "ip.json"))
+
+    started = time.monotonic()
+    ip = detector.detect()
+
+    assert ip == '198.51.100.7'
+    assert time.monotonic() - started < 1.0
+
+
+def test_invalid_and_failing_resolvers_are_ignored(http_server, tmp_path):
+    base, _ = http_server({
+        '/garbage': (0, 200, '<html>rate limited</html>'),
+        '/error': (0, 503, ''),
+        '/good': (0.1, 200, '198.51.100.7'),
+    })
+    detector = PublicIPDetector({4: [f"{base}/garbage", f"{base}/error", f"{base}/good"]},
+                                cache_path=str(tmp_path / "ip.json"))
+
+    assert detector.detect() == '198.51.100.7'
+
+
+def test_quorum_waits_for_agreement(http_server, tmp_path):
+    """With a quorum of two, a lone dissenting fast answer is outvoted."""
+    base, _ = http_server({
+        '/liar': (0, 200, '203.0.113.1'),
+        '/a': (0.1, 200, '198.51.100.7'),
+        '/b': (0.2, 200, '198.51.100.7'),
+    })
+    detector = PublicIPDetector({4: [f"{base}/liar", f"{base}/a", f"{base}/b"]}, quorum=2,
+                                cache_path=str(tmp_path / "ip.json"))
+
+    assert detector.detect() == '198.51.100.7'
+
+
+def test_ipv6_answers_are_validated_by_family(http_server, tmp_path):
+    base, _ = http_server({'/v4': (0, 200, '198.51.100.7'), '/v6': (0.05, 200, '2001:db8::7')})
+    detector = PublicIPDetector({6: [f"{base}/v4", f"{base}/v6"]}, cache_path=str(tmp_path / "ip.json"))
+
+    assert detector.detect(version=6) == '2001:db8::7'
+
+
+def test_cached_answer_is_reused_within_ttl(http_server, tmp_path):
+    """A second process within the TTL does not hit the network."""
+    base, hits = http_server({'/ip': (0, 200, '198.51.100.7')})
+    clock = FakeClock()
+    cache_path = str(tmp_path / "ip.json")
+    PublicIPDetector({4: [f"{base}/ip"]}, cache_path=cache_path, clock=clock).detect()
+
+    second = PublicIPDetector({4: [f"{base}/ip"]}, cache_path=cache_path, ttl_seconds=120, clock=clock)
+    assert second.detect() == '198.51.100.7'
+    assert hits == ['/ip']
+
+    clock.now += 121
+    second.detect()
+    assert hits == ['/ip', '/ip']
+
+
+def test_timeout_raises_when_nothing_answers(http_server, tmp_path):
+    base, _ = http_server({'/hang': (2, 200, '198.51.100.7')})
+    detector = PublicIPDetector({4: [f"{base}/hang"]}, timeout=0.3, cache_path=str(tmp_path / "ip.json"))
+
+    with pytest.raises(Exception, match="Could not detect public IPv4"):
+        detector.detect()
+
+
+def test_unconfirmed_answer_fails_the_quorum(http_server, tmp_path):
+    """Disagreeing resolvers do not fall back to the most common answer."""
+    base, _ = http_server({
+        '/a': (0, 200, '203.0.113.1'),
+        '/b': (0, 200, '198.51.100.7'),
+        '/error': (0, 503, ''),
+    })
+    cache_path = str(tmp_path / "ip.json")
+    detector = PublicIPDetector({4: [f"{base}/a", f"{base}/b", f"{base}/error"]}, quorum=2, cache_path=cache_path)
+
+    with pytest.raises(Exception, match="no address confirmed by 2 resolvers"):
+        detector.detect()
+    assert not os.path.exists(cache_path)
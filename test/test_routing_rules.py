@@ -0,0 +1,135 @@
+# Tests for the routing-rule compiler and PAC generator.
+
+import json
+import shutil
+import subprocess
+
+import pytest
+
+from src.routing_rules import (
+    DIRECT,
+    PROXY,
+    DomainTrie,
+    IntervalMap,
+    RuleError,
+    compile_rules,
+    load_rules,
+    render_pac,
+)
+
+RULES = {
+    'proxy_domains': ['*.openai.com', 'exact.example.org', 'api-*.example.net'],
+    'direct_domains': ['*.cn', 'cdn.openai.com', '*.internal.openai.com'],
+    'proxy_cidrs': ['203.0.113.0/24', '10.1.2.0/24', '2001:db8::/32'],
+    'direct_cidrs': ['10.0.0.0/8'],
+    'default_action': 'DIRECT',
+}
+
+CASES = [
+    ('openai.com', PROXY),
+    ('chat.openai.com', PROXY),
+    ('cdn.openai.com', DIRECT),            # exact beats suffix
+    ('x.internal.openai.com', DIRECT),     # longer suffix wins
+    ('notopenai.com', DIRECT),
+    ('exact.example.org', PROXY),
+    ('sub.exact.example.org', DIRECT),     # bare names are exact only
+    ('api-eu.example.net', PROXY),         # glob
+    ('www.baidu.cn', DIRECT),
+    ('unknown.test', DIRECT),
+    ('203.0.113.9', PROXY),
+    ('10.1.2.3', PROXY),                   # more specific CIDR wins
+    ('10.9.9.9', DIRECT),
+    ('198.51.100.1', DIRECT),
+    ('2001:db8::1', PROXY),
+    ('[2001:db8:0:0:0:0:0:ff]', PROXY),
+    ('2001:db9::1', DIRECT),
+    ('::ffff:203.0.113.9', DIRECT),        # IPv4-mapped addresses are IPv6 rules' business
+    ('2001:db8::1::2', DIRECT),            # not an address, so a (non-matching) host name
+]
+
+
+@pytest.fixture
+def ruleset():
+    return compile_rules(RULES)
+
+
+@pytest.mark.parametrize('host, expected', CASES)
+def test_match(ruleset, host, expected):
+    assert ruleset.match(host) == expected
+
+
+def test_ipv6_and_case_handling(ruleset):
+    assert ruleset.match('[2001:db8::1]') == PROXY
+    assert ruleset.match('Chat.OpenAI.com.') == PROXY
+
+
+def test_trie_round_trips_rules():
+    trie = DomainTrie()
+    trie.add('openai.com', PROXY, suffix=True)
+    trie.add('cdn.openai.com', DIRECT, suffix=False)
+
+    assert sorted(trie.items()) == [('cdn.openai.com', DIRECT, False), ('openai.com', PROXY, True)]
+
+
+def test_interval_map_paints_specific_over_general():
+    import ipaddress
+    networks = [(ipaddress.ip_network('10.0.0.0/8'), DIRECT), (ipaddress.ip_network('10.1.0.0/16'), PROXY),
+                (ipaddress.ip_network('11.0.0.0/8'), DIRECT)]
+
+    table = IntervalMap.build(networks, 4)
+
+    # 10/8 is split around 10.1/16; the DIRECT remainder merges with the adjacent 11/8.
+    assert len(table) == 3
+    assert table.actions == [DIRECT, PROXY, DIRECT]
+
+
+def test_lists_are_loaded_relative_to_rules_file(tmp_path):
+    (tmp_path / "lists").mkdir()
+    (tmp_path / "lists" / "blocked.txt").write_text("# comment\nblocked.example\n\n192.0.2.0/24  # docs\n")
+    rules_file = tmp_path / "rules.yaml"
+    rules_file.write_text("proxy_lists: [lists/blocked.txt]\ndefault_action: DIRECT\n")
+
+    rules, inputs = load_rules(str(rules_file))
+    ruleset = compile_rules(rules)
+
+    assert inputs == [str(rules_file), str(tmp_path / "lists" / "blocked.txt")]
+    assert ruleset.match('blocked.example') == PROXY
+    assert ruleset.match('192.0.2.55') == PROXY
+
+
+def test_invalid_rules_raise():
+    with pytest.raises(RuleError):
+        compile_rules({'default_action': 'REJECT'})
+    with pytest.raises(RuleError):
+        compile_rules({'proxy_cidrs': ['10.0.0.0/33']})
+
+
+@pytest.mark.skipif(shutil.which('node') is None, reason="node is needed to evaluate the PAC file")
+def test_pac_agrees_with_python_engine(ruleset):
+    """The generated PAC returns the same decisions as RuleSet.match for IPv4, IPv6 and domains."""
+    pac = render_pac(ruleset, "SOCKS5 127.0.0.1:1080")
+    hosts = [host for host, _ in CASES]
+    script = pac + """
+function shExpMatch(str, pattern) {
+    var re = new RegExp("^" + pattern.replace(/[.+^${}()|[\\]\\\\]/g, "\\\\$&")
+        .replace(/\\*/g, ".*").replace(/\\?/g, ".") + "$");
+    return re.test(str);
+}
+console.log(JSON.stringify(%s.map(function (h) { return FindProxyForURL("http://" + h + "/", h); })));
+""" % json.dumps(hosts)
+
+    output = subprocess.run(['node', '-e', script], capture_output=True, text=True, check=True).stdout
+
+    expected = ["SOCKS5 127.0.0.1:1080" if action == PROXY else "DIRECT" for _, action in CASES]
+    assert json.loads(output) == expected
+
+
+def test_overlapping_glob_prefers_proxy():
+    """PROXY wins for globs listed as both proxy and direct, as it does for names and suffixes."""
+    ruleset = compile_rules({'direct_domains': ['api-*.ex.net', 'cdn-?.ex.net'],
+                             'proxy_domains': ['api-*.ex.net']})
+
+    assert ruleset.match('api-1.ex.net') == PROXY
+    assert ruleset.match('cdn-1.ex.net') == DIRECT
+    pac = render_pac(ruleset, "SOCKS5 127.0.0.1:1080")
+    assert pac.index('["api-*.ex.net",0]') < pac.index('["api-*.ex.net",1]')
@@ -0,0 +1,88 @@
+# Tests for the compiled-rule cache, atomic PAC publishing and the rules watcher.
+
+import os
+from unittest.mock import patch
+
+import pytest
+
+from src.local_client_manager import LocalClientManager
+from src.routing_rules import DIRECT, PROXY
+from src.rule_cache import PAC_KEY_PREFIX, RuleCache, RulesWatcher
+
+
+@pytest.fixture
+def rules_file(tmp_path):
+    (tmp_path / "blocked.txt").write_text("blocked.example\n192.0.2.0/24\n")
+    path = tmp_path / "rules.yaml"
+    path.write_text("proxy_lists: [blocked.txt]\ndefault_action: DIRECT\n")
+    return path
+
+
+@pytest.fixture
+def manager():
+    with patch('src.local_client_manager.os.path.exists', return_value=True):
+        return LocalClientManager({'local_port': 1080, 'client_config_path': 'ss-local-temp.json'})
+
+
+def test_unchanged_rules_are_loaded_from_disk(tmp_path, rules_file):
+    first, digest, inputs = RuleCache(str(tmp_path / "cache")).compile(str(rules_file))
+
+    cache = RuleCache(str(tmp_path / "cache"))
+    with patch('src.rule_cache.compile_rules', side_effect=AssertionError("recompiled")):
+        ruleset, cached_digest, _ = cache.compile(str(rules_file))
+
+    assert cached_digest == digest
+    assert (cache.hits, cache.misses) == (1, 0)
+    assert ruleset.match('blocked.example') == PROXY
+    assert inputs == [str(rules_file), str(tmp_path / "blocked.txt")]
+
+
+def test_changed_list_changes_the_key(tmp_path, rules_file):
+    cache = RuleCache(str(tmp_path / "cache"), keep=1)
+    _, before, _ = cache.compile(str(rules_file))
+    (tmp_path / "blocked.txt").write_text("other.example\n")
+    ruleset, after, _ = cache.compile(str(rules_file))
+
+    assert after != before
+    assert ruleset.match('blocked.example') == DIRECT
+    assert ruleset.match('other.example') == PROXY
+    assert os.listdir(tmp_path / "cache") == [f"{after}.pickle"]
+
+
+def test_current_pac_is_not_rewritten(tmp_path, rules_file, manager):
+    cache = RuleCache(str(tmp_path / "cache"))
+    pac_file = str(tmp_path / "proxy.pac")
+
+    assert manager.generate_pac_file(str(rules_file), pac_file, rule_cache=cache)
+    with open(pac_file) as f:
+        assert f.readline().startswith(PAC_KEY_PREFIX)
+    with patch('src.rule_cache.publish_pac') as publish:
+        assert manager.generate_pac_file(str(rules_file), pac_file, rule_cache=cache)
+    publish.assert_not_called()
+    assert not os.path.exists(pac_file + ".tmp")
+
+
+def test_watcher_republishes_on_change_and_keeps_old_pac_on_error(tmp_path, rules_file, manager):
+    cache = RuleCache(str(tmp_path / "cache"))
+    pac_file = str(tmp_path / "proxy.pac")
+    events = []
+
+    def publish():
+        if not manager.generate_pac_file(str(rules_file), pac_file, rule_cache=cache):
+            return None
+        return cache.inputs
+
+    watcher = RulesWatcher(publish, publish(), on_event=events.append)
+    assert watcher.poll() is False
+
+    (tmp_path / "blocked.txt").write_text("blocked.example\nnew.example\n")
+    assert watcher.poll() is True
+    with open(pac_file) as f:
+        assert 'new.example' in f.read()
+
+    rules_file.write_text("default_action: REJECT\n")
+    assert watcher.poll() is False
+    with open(pac_file) as f:
+        assert 'new.example' in f.read()
+    assert watcher.rebuilds == 1
+    assert "not reloaded" in events[-1]
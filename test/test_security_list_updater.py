@@ -0,0 +1,102 @@
+# Tests for the incremental Network Security List updater.
+# The virtual network client is a stub; rules are real OCI SDK models.
+
+import unittest.mock as mock
+
+import oci
+import pytest
+
+from src.security_list_updater import (
+    MANAGED_RULE_DESCRIPTION,
+    SecurityListUpdater,
+    client_cidr,
+    desired_rules,
+    diff_ingress_rules,
+)
+
+SSH_RULE = oci.core.models.IngressSecurityRule(
+    protocol='6', source='0.0.0.0/0', source_type='CIDR_BLOCK',
+    tcp_options=oci.core.models.TcpOptions(destination_port_range=oci.core.models.PortRange(min=22, max=22)),
+)
+
+
+def _security_list(rules):
+    return oci.core.models.SecurityList(id='ocid1.securitylist.test', ingress_security_rules=rules)
+
+
+def _networking_client(rules, etag='etag-1'):
+    client = mock.MagicMock()
+    client.get_security_list.return_value.data = _security_list(rules)
+    client.get_security_list.return_value.headers = {'etag': etag}
+    return client
+
+
+def test_client_cidr_handles_ipv4_and_ipv6():
+    assert client_cidr('198.51.100.7') == '198.51.100.7/32'
+    assert client_cidr('2001:db8::1') == '2001:db8::1/128'
+
+
+def test_diff_replaces_stale_managed_rules_only():
+    """Old client IPs are dropped, the new one added and foreign rules kept."""
+    stale = desired_rules('203.0.113.5/32', 443)
+    rules, added, removed = diff_ingress_rules([SSH_RULE] + stale, desired_rules('198.51.100.7/32', 443))
+
+    assert SSH_RULE in rules
+    assert len(added) == 2 and len(removed) == 2
+    assert {rule.source for rule in rules if rule.description == MANAGED_RULE_DESCRIPTION} == {'198.51.100.7/32'}
+
+
+def test_diff_is_empty_when_rules_already_match():
+    current = [SSH_RULE] + desired_rules('198.51.100.7/32', 443)
+
+    rules, added, removed = diff_ingress_rules(current, desired_rules('198.51.100.7/32', 443))
+
+    assert added == [] and removed == []
+    assert rules == current
+
+
+def test_update_skips_no_op_writes():
+    """No write is issued when the current IP is already allowed."""
+    client = _networking_client([SSH_RULE] + desired_rules('198.51.100.7/32', 443))
+
+    result = SecurityListUpdater(client).update('ocid1.securitylist.test', '198.51.100.7', 443)
+
+    assert result == {'changed': False, 'added': 0, 'removed': 0}
+    client.update_security_list.assert_not_called()
+
+
+def test_update_writes_once_with_if_match():
+    """All rule changes go out in a single update guarded by the ETag."""
+    client = _networking_client([SSH_RULE] + desired_rules('203.0.113.5/32', 443) + desired_rules('203.0.113.6/32', 443))
+
+    result = SecurityListUpdater(client).update('ocid1.securitylist.test', '198.51.100.7', 443)
+
+    assert result == {'changed': True, 'added': 2, 'removed': 4}
+    client.update_security_list.assert_called_once()
+    args, kwargs = client.update_security_list.call_args
+    assert kwargs['if_match'] == 'etag-1'
+    assert len(args[1].ingress_security_rules) == 3
+
+
+def test_update_uses_prefetched_list_and_retries_on_conflict():
+    """A 412 from a concurrent writer triggers a re-read and a second attempt."""
+    client = _networking_client([SSH_RULE], etag='etag-2')
+    client.update_security_list.side_effect = [
+        oci.exceptions.ServiceError(412, 'NoEtagMatch', {}, 'etag mismatch'),
+        mock.MagicMock(),
+    ]
+    prefetched = (_security_list([SSH_RULE]), 'etag-1')
+
+    result = SecurityListUpdater(client).update('ocid1.securitylist.test', '198.51.100.7', 443, prefetched)
+
+    assert result['changed'] is True
+    client.get_security_list.assert_called_once()
+    assert [call[1]['if_match'] for call in client.update_security_list.call_args_list] == ['etag-1', 'etag-2']
+
+
+def test_update_raises_other_service_errors():
+    client = _networking_client([SSH_RULE])
+    client.update_security_list.side_effect = oci.exceptions.ServiceError(404, 'NotFound', {}, 'missing')
+
+    with pytest.raises(oci.exceptions.ServiceError):
+        SecurityListUpdater(client).update('ocid1.securitylist.test', '198.51.100.7', 443)
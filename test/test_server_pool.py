@@ -0,0 +1,164 @@
+# Tests for the multi-region server pool, using stubbed OCI managers and
+# local TCP listeners whose round-trip time is stretched by a delayed probe.
+
+import asyncio
+import copy
+import json
+import socket
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+from src.server_pool import ServerPool, member_config, tcp_rtt
+
+CONFIG = {
+    'oci': {'region': 'us-ashburn-1', 'compartment_id': 'c1'},
+    'compute': {'availability_domain': 'AD-1', 'state_ttl_seconds': 60},
+    'shadowsocks': {'server_port': 443, 'password': 'p', 'method': 'aes-256-gcm', 'local_port': 1080},
+    'pool': {'members': [
+        {'name': 'frankfurt', 'oci': {'region': 'eu-frankfurt-1'}, 'shadowsocks': {'server_port': 8443}},
+        {'name': 'tokyo', 'oci': {'region': 'ap-tokyo-1'}, 'compute': {'project_tag': 'tokyo-proxy'}},
+    ]},
+}
+
+
+@pytest.fixture
+def listeners():
+    """Three local endpoints; the last one is closed and never accepts."""
+    sockets = []
+    for _ in range(3):
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        sock.listen(16)
+        sockets.append(sock)
+    ports = [sock.getsockname()[1] for sock in sockets]
+    sockets[2].close()
+    yield ports
+    for sock in sockets[:2]:
+        sock.close()
+
+
+def _manager(address):
+    manager = MagicMock()
+    manager.find_existing_instance.return_value = MagicMock(id=f"ocid1.instance.{address}")
+    manager.get_public_ip.return_value = address
+    return manager
+
+
+def _delayed_probe(latency):
+    async def probe(host, port, timeout):
+        await asyncio.sleep(latency[port])
+        rtt = await tcp_rtt(host, port, timeout)
+        return None if rtt is None else rtt + latency[port]
+    return probe
+
+
+def test_member_config_merges_over_defaults():
+    frankfurt = member_config(CONFIG, 'frankfurt')
+
+    assert frankfurt['oci'] == {'region': 'eu-frankfurt-1', 'compartment_id': 'c1'}
+    assert frankfurt['shadowsocks']['server_port'] == 8443
+    assert frankfurt['shadowsocks']['password'] == 'p'
+    assert frankfurt['compute']['project_tag'] == 'shadowsocks-proxy-frankfurt'
+    assert member_config(CONFIG, 'tokyo')['compute']['project_tag'] == 'tokyo-proxy'
+    assert CONFIG['oci']['region'] == 'us-ashburn-1'
+    with pytest.raises(KeyError):
+        member_config(CONFIG, 'paris')
+
+
+def test_picks_fastest_healthy_member_probing_concurrently(listeners):
+    near, far, dead = listeners
+    latency = {near: 0.05, far: 0.15, dead: 0.0}
+    pool = ServerPool({'near': (_manager('127.0.0.1'), near), 'far': (_manager('127.0.0.1'), far),
+                       'dead': (_manager('127.0.0.1'), dead), 'stopped': (_manager(None), near)},
+                      samples=2, rtt_probe=_delayed_probe(latency))
+    pool.members['stopped'][0].find_existing_instance.return_value = None
+
+    started = time.perf_counter()
+    assert pool.evaluate() == 'near'
+    elapsed = time.perf_counter() - started
+
+    # Members are probed in parallel: the slowest member's two samples bound the time.
+    assert elapsed < 0.45
+    assert [name for name, _ in pool.ranking()][:2] == ['near', 'far']
+    assert pool.results['dead']['healthy'] is False
+    assert pool.results['stopped'] == {'address': None, 'rtt': None, 'throughput': None, 'healthy': False}
+
+
+def test_hysteresis_keeps_current_member():
+    results = {'a': {'healthy': True, 'rtt': 0.100}, 'b': {'healthy': True, 'rtt': 0.090}}
+    pool = ServerPool({}, hysteresis=0.2)
+
+    pool.current = 'a'
+    assert pool.choose(results) == 'a'
+    results['b']['rtt'] = 0.070
+    assert pool.choose(results) == 'b'
+    results['a']['healthy'] = False
+    results['b']['rtt'] = 0.095
+    assert pool.choose(results) == 'b'
+
+
+def test_run_switches_when_a_member_becomes_faster(listeners):
+    first, second, _ = listeners
+    latency = {first: 0.01, second: 0.05}
+    now = [0.0]
+    ticks = []
+
+    def wait(seconds):
+        now[0] += seconds
+        ticks.append(now[0])
+        if len(ticks) == 2:
+            latency[first], latency[second] = 0.05, 0.01
+        return len(ticks) > 3
+
+    switch = MagicMock(return_value=(True, "switched"))
+    pool = ServerPool({'first': (_manager('127.0.0.1'), first), 'second': (_manager('127.0.0.1'), second)},
+                      samples=1, rtt_probe=_delayed_probe(latency), clock=lambda: now[0], wait=wait)
+
+    success, _ = pool.run(switch, interval=60)
+
+    assert success
+    assert ticks == [60, 120, 180, 240]
+    assert [call.args for call in switch.call_args_list] == [('first', '127.0.0.1'), ('second', '127.0.0.1')]
+    assert pool.current == 'second'
+
+
+def test_throughput_probe_marks_slow_members_unhealthy(http_server, listeners):
+    from src.server_pool import http_throughput_probe
+    base_url, _ = http_server({})
+    port = int(base_url.rsplit(':', 1)[1])
+
+    pool = ServerPool({'a': (_manager('127.0.0.1'), listeners[0])}, samples=1,
+                      throughput_probe=http_throughput_probe(f"http://{{host}}:{port}/bytes/200000"))
+    pool.resolve()
+    assert pool.probe()['a']['throughput'] > 0
+    assert pool.choose() == 'a'
+
+    pool.min_throughput = 10 ** 15
+    assert pool.probe()['a']['healthy'] is False
+
+
+def test_concurrent_resolve_keeps_every_members_record(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    config = copy.deepcopy(CONFIG)
+    config['oci']['key_file'] = str(tmp_path / "key.pem")
+    config['pool']['members'] = [{'name': f"member-{i}"} for i in range(12)]
+    events = []
+    pool = ServerPool.from_config(config, on_event=events.append)
+    for name, (manager, _) in pool.members.items():
+        instance = MagicMock(id=f"ocid1.instance.{name}", lifecycle_state='RUNNING',
+                             freeform_tags={'project': manager.PROJECT_TAG})
+        manager.compute_client = MagicMock()
+        manager.compute_client.list_instances.return_value = MagicMock(data=[instance], next_page=None)
+        manager.compute_client.list_vnic_attachments.return_value = MagicMock(
+            data=[MagicMock(lifecycle_state='ATTACHED', vnic_id=f"vnic-{name}")])
+        manager.networking_client = MagicMock()
+        manager.networking_client.get_vnic.return_value = MagicMock(data=MagicMock(public_ip=f"ip-{name}"))
+
+    addresses = pool.resolve()
+
+    assert events == []
+    assert addresses == {name: f"ip-{name}" for name in pool.members}
+    with open(tmp_path / "instance_state.json") as f:
+        assert len(json.load(f)) == 12
@@ -0,0 +1,254 @@
+# Tests for the embedded SOCKS5-over-Shadowsocks client, using the AEADServer
+# stand-in and a local echo server as the final destination.
+
+import asyncio
+import hashlib
+import os
+import socket
+import struct
+import threading
+
+import pytest
+
+from src.local_client_manager import LocalClientManager
+from src.ss_local import (
+    CIPHERS,
+    MAX_PAYLOAD,
+    AEADServer,
+    Decryptor,
+    EmbeddedClient,
+    Encryptor,
+    ShadowsocksError,
+    _Socks5Protocol,
+    benchmark,
+    evp_bytes_to_key,
+)
+
+
+async def _echo(reader, writer):
+    while True:
+        data = await reader.read(65536)
+        if not data:
+            break
+        writer.write(data)
+        await writer.drain()
+    writer.close()
+
+
+@pytest.fixture
+def backend():
+    """Runs an echo server and an AEADServer on a background loop; yields (echo port, server factory)."""
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    echo = asyncio.run_coroutine_threadsafe(asyncio.start_server(_echo, '127.0.0.1', 0), loop).result()
+
+    def server(method, password):
+        ss_server = AEADServer(method, password)
+        asyncio.run_coroutine_threadsafe(ss_server.start(), loop).result()
+        return ss_server
+
+    yield echo.sockets[0].getsockname()[1], server
+
+    async def cancel_handlers():
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    asyncio.run_coroutine_threadsafe(cancel_handlers(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+
+def _socks5_roundtrip(local_port, target_port, payload):
+    with socket.create_connection(('127.0.0.1', local_port), timeout=5) as sock:
+        sock.sendall(b'\x05\x01\x00')
+        assert sock.recv(2) == b'\x05\x00'
+        sock.sendall(b'\x05\x01\x00\x03\x09localhost' + struct.pack('!H', target_port))
+        reply = b''
+        while len(reply) < 10:
+            chunk = sock.recv(10 - len(reply))
+            if not chunk:
+                return None
+            reply += chunk
+        assert reply[1] == 0
+        sock.sendall(payload)
+        sock.shutdown(socket.SHUT_WR)
+        received = b''
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                return received
+            received += chunk
+
+
+def test_master_key_matches_evp_bytes_to_key():
+    first = hashlib.md5(b'password').digest()
+    assert evp_bytes_to_key('password', 32) == first + hashlib.md5(first + b'password').digest()
+
+
+@pytest.mark.parametrize('method', list(CIPHERS))
+def test_frames_round_trip_across_arbitrary_splits(method):
+    key = evp_bytes_to_key('secret', CIPHERS[method][0])
+    payload = os.urandom(3 * MAX_PAYLOAD + 123)
+    encryptor = Encryptor(method, key)
+    stream = b''.join(encryptor.encrypt(payload[:100]) + encryptor.encrypt(payload[100:]))
+
+    decryptor = Decryptor(method, key, buffer_size=80 * 1024)
+    received = []
+    for offset in range(0, len(stream), 7001):
+        received.extend(decryptor.feed(stream[offset:offset + 7001]))
+
+    assert b''.join(received) == payload
+
+
+def test_tampered_frame_is_rejected():
+    key = evp_bytes_to_key('secret', 32)
+    stream = bytearray(b''.join(Encryptor('aes-256-gcm', key).encrypt(b'hello')))
+    stream[-1] ^= 1
+
+    with pytest.raises(ShadowsocksError):
+        Decryptor('aes-256-gcm', key).feed(stream)
+
+
+@pytest.mark.parametrize('method', list(CIPHERS))
+def test_socks5_connect_through_server(backend, method):
+    echo_port, server = backend
+    ss_server = server(method, 'secret')
+    client = EmbeddedClient('127.0.0.1', ss_server.port, method, 'secret', local_port=0)
+    port = client.start()
+    try:
+        payload = os.urandom(200000)
+        assert _socks5_roundtrip(port, echo_port, payload) == payload
+        assert client.bytes_out == client.bytes_in == len(payload)
+    finally:
+        client.stop()
+    assert not client.running
+
+
+def test_wrong_password_yields_no_data(backend):
+    echo_port, server = backend
+    ss_server = server('aes-256-gcm', 'right')
+    client = EmbeddedClient('127.0.0.1', ss_server.port, 'aes-256-gcm', 'wrong', local_port=0)
+    port = client.start()
+    try:
+        assert not _socks5_roundtrip(port, echo_port, b'ping')
+    finally:
+        client.stop()
+
+
+def test_upstream_is_closed_when_the_application_left_during_connect():
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1)
+    client = EmbeddedClient('127.0.0.1', listener.getsockname()[1], 'aes-256-gcm', 'secret')
+    # A protocol whose connection_lost already ran has no transport.
+    protocol = _Socks5Protocol(client)
+    try:
+        asyncio.run(protocol._connect(b'', b''))
+        upstream, _ = listener.accept()
+        upstream.settimeout(2)
+        assert upstream.recv(1) == b''
+        upstream.close()
+    finally:
+        listener.close()
+
+
+def test_unsupported_method():
+    with pytest.raises(ShadowsocksError):
+        EmbeddedClient('127.0.0.1', 8388, 'rc4-md5', 'secret')
+
+
+def test_local_client_manager_embedded_lifecycle(backend):
+    echo_port, server = backend
+    first, second = server('aes-256-gcm', 'secret'), server('aes-256-gcm', 'secret')
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        local_port = probe.getsockname()[1]
+    manager = LocalClientManager({'server_port': first.port, 'local_port': local_port, 'password': 'secret',
+                                  'method': 'aes-256-gcm', 'client': 'embedded'})
+
+    assert manager.start_client('127.0.0.1')[0]
+    assert manager.get_client_status()[0] == "RUNNING"
+    assert _socks5_roundtrip(local_port, echo_port, b'one') == b'one'
+
+    # Switching keeps the listener; the next connection uses the new server.
+    manager.config['server_port'] = second.port
+    manager.embedded_client.server_port = second.port
+    assert manager.switch_server('localhost')[0]
+    assert _socks5_roundtrip(local_port, echo_port, b'two') == b'two'
+    assert (first.connections, second.connections) == (1, 1)
+
+    assert manager.stop_client()[0]
+    assert manager.get_client_status()[0] == "STOPPED"
+
+
+def test_benchmark_reports_throughput():
+    result, = benchmark(size=1024 * 1024, methods=('chacha20-ietf-poly1305',))
+
+    assert result['download_mbps'] > 0 and result['upload_mbps'] > 0
+
+
+def test_pooled_upstreams_are_used_and_replaced(backend):
+    echo_port, server = backend
+    ss_server = server('aes-256-gcm', 'secret')
+    client = EmbeddedClient('127.0.0.1', ss_server.port, 'aes-256-gcm', 'secret', local_port=0, pool_size=2)
+    port = client.start()
+    try:
+        for payload in (b'one', b'two', b'three'):
+            for _ in range(100):
+                if len(client.pool) == 2:
+                    break
+                threading.Event().wait(0.01)
+            assert _socks5_roundtrip(port, echo_port, payload) == payload
+        assert (client.pool.hits, client.pool.misses) == (3, 0)
+    finally:
+        client.stop()
+
+
+def test_pool_evicts_idle_and_server_closed_connections():
+    async def scenario():
+        closing_server = await asyncio.start_server(lambda reader, writer: writer.close(), '127.0.0.1', 0)
+        quiet_connections = []
+        quiet_server = await asyncio.start_server(lambda reader, writer: quiet_connections.append(writer),
+                                                  '127.0.0.1', 0)
+        now = [0.0]
+        try:
+            client = EmbeddedClient('127.0.0.1', closing_server.sockets[0].getsockname()[1], 'aes-256-gcm',
+                                    'secret', local_port=0, pool_size=2, pool_idle_seconds=30)
+            await client.listen()
+            await asyncio.sleep(0.1)
+            # The server hung up on both warm connections.
+            assert len(client.pool) == 0
+
+            client.pool.close()
+            client.server_port = quiet_server.sockets[0].getsockname()[1]
+            pool = client.pool = type(client.pool)(client, 2, max_idle=30, clock=lambda: now[0])
+            pool.fill()
+            await asyncio.sleep(0.1)
+            assert len(pool) == 2 and len(quiet_connections) == 2
+
+            now[0] = 31
+            pool.evict()
+            await asyncio.sleep(0.1)
+            assert len(pool) == 2 and len(quiet_connections) == 4
+            pool.close()
+            client._server.close()
+        finally:
+            for writer in quiet_connections:
+                writer.close()
+            closing_server.close()
+            quiet_server.close()
+
+    asyncio.run(scenario())
+
+
+def test_pool_saves_the_connection_round_trip():
+    from src.ss_local import ttfb_benchmark
+    cold, pooled = ttfb_benchmark(rtt=0.04, requests=5, pool_size=2)
+
+    assert cold['median_ttfb_ms'] >= 40
+    assert pooled['median_ttfb_ms'] < cold['median_ttfb_ms'] / 2
+    assert pooled['pool_hits'] == 5
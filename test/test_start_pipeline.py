@@ -0,0 +1,173 @@
+# Tests for the asynchronous `start` pipeline.
+# The OCI compute and network clients are replaced by stubs so the pipeline
+# can be exercised end to end without touching a real tenancy.
+
+import time
+import unittest.mock as mock
+
+import pytest
+
+from src.instance_state import InstanceStateStore
+from src.oci_manager import OCIManager
+from src.server_config import CONFIG_HASH_TAG, config_hash
+from src.start_pipeline import StartPipeline, format_timings
+
+SHADOWSOCKS = {'server_port': 443, 'password': 'secret', 'method': 'aes-256-gcm', 'local_port': 1080}
+
+
+@pytest.fixture
+def app_config(tmp_path):
+    """Provides a minimal application configuration with a local SSH key."""
+    key_file = tmp_path / "id_rsa"
+    (tmp_path / "id_rsa.pub").write_text("ssh-rsa AAAA test@host\n")
+    return {
+        'oci': {'compartment_id': 'ocid1.compartment.test', 'key_file': str(key_file)},
+        'compute': {
+            'availability_domain': 'AD-1',
+            'instance_shape': 'VM.Standard.E2.1.Micro',
+            'image_id': 'ocid1.image.test',
+            'subnet_id': 'ocid1.subnet.test',
+            'warm_standby': True,
+        },
+        'shadowsocks': SHADOWSOCKS,
+    }
+
+
+def _instance(instance_id, state, tagged=True, configured=False):
+    instance = mock.MagicMock()
+    instance.id = instance_id
+    instance.lifecycle_state = state
+    instance.freeform_tags = {'project': 'shadowsocks-proxy'} if tagged else {}
+    if configured:
+        instance.freeform_tags[CONFIG_HASH_TAG] = config_hash(SHADOWSOCKS)
+    return instance
+
+
+@pytest.fixture
+def compute_client():
+    """A stub compute client with no existing instances."""
+    client = mock.MagicMock()
+    client.list_instances.return_value.data = []
+    client.list_instances.return_value.next_page = None
+    client.launch_instance.return_value.data = _instance('ocid1.instance.new', 'PROVISIONING')
+    client.get_instance.return_value.data = _instance('ocid1.instance.new', 'RUNNING')
+    client.update_instance.return_value.data = _instance('ocid1.instance.new', 'RUNNING', configured=True)
+    attachment = mock.MagicMock(lifecycle_state='ATTACHED', vnic_id='ocid1.vnic.test')
+    client.list_vnic_attachments.return_value.data = [attachment]
+    return client
+
+
+@pytest.fixture
+def networking_client():
+    """A stub virtual network client with one security list on the subnet."""
+    client = mock.MagicMock()
+    client.get_vnic.return_value.data.public_ip = '203.0.113.10'
+    client.get_subnet.return_value.data.security_list_ids = ['ocid1.securitylist.test']
+    client.get_security_list.return_value.data.id = 'ocid1.securitylist.test'
+    client.get_security_list.return_value.data.ingress_security_rules = []
+    client.get_security_list.return_value.headers = {'etag': 'etag-1'}
+    return client
+
+
+@pytest.fixture
+def state_store(tmp_path):
+    return InstanceStateStore(str(tmp_path / "instance_state.json"))
+
+
+@pytest.fixture
+def local_client_manager():
+    manager = mock.MagicMock()
+    manager.generate_connection_details.return_value = ('ss://abc', 'shadowsocks_qrcode.png')
+    manager.write_client_config.return_value = 'ss-local-temp.json'
+    return manager
+
+
+def test_pipeline_launches_and_reports_timings(app_config, compute_client, networking_client, local_client_manager,
+        state_store):
+    """Launches a new instance and wires its IP into every downstream stage."""
+    oci_manager = OCIManager(app_config, compute_client, networking_client, state_store)
+    with mock.patch.object(oci_manager, 'detect_public_ip', return_value='198.51.100.7'), \
+            mock.patch.object(oci_manager, 'configure_instance', return_value=(True, 'ok')) as configure, \
+            mock.patch.object(oci_manager, 'update_network_security_list', return_value=(True, 'ok')) as update_nsl:
+        result = StartPipeline(oci_manager, local_client_manager, 443).run()
+
+    assert result['server_ip'] == '203.0.113.10'
+    assert result['configured'] is True
+    assert configure.call_args[0][1] == '203.0.113.10'
+    tags = compute_client.update_instance.call_args[0][1].freeform_tags
+    assert tags[CONFIG_HASH_TAG] == config_hash(SHADOWSOCKS)
+    assert result['ss_url'] == 'ss://abc'
+    launch_details = compute_client.launch_instance.call_args[1]['launch_instance_details']
+    assert launch_details.metadata['ssh_authorized_keys'] == 'ssh-rsa AAAA test@host'
+    update_nsl.assert_called_once()
+    assert update_nsl.call_args[0][:2] == ('198.51.100.7', 443)
+    local_client_manager.generate_connection_details.assert_called_once_with('203.0.113.10')
+    local_client_manager.write_client_config.assert_called_once_with('203.0.113.10')
+    for stage in ('detect_public_ip', 'load_ssh_key', 'prepare_security_list',
+                  'provision_instance', 'update_security_list', 'total'):
+        assert stage in result['timings']
+
+
+def test_pipeline_reuses_existing_instance(app_config, compute_client, networking_client, local_client_manager,
+        state_store):
+    """Does not launch when a tagged running instance already exists."""
+    compute_client.list_instances.return_value.data = [_instance('ocid1.instance.old', 'RUNNING', configured=True)]
+    oci_manager = OCIManager(app_config, compute_client, networking_client, state_store)
+    with mock.patch.object(oci_manager, 'detect_public_ip', return_value='198.51.100.7'), \
+            mock.patch.object(oci_manager, 'configure_instance') as configure:
+        result = StartPipeline(oci_manager, local_client_manager, 443).run()
+
+    assert result['instance'].id == 'ocid1.instance.old'
+    assert result['configured'] is False
+    compute_client.launch_instance.assert_not_called()
+    configure.assert_not_called()
+
+
+def test_pipeline_resumes_warm_standby_instance(app_config, compute_client, networking_client, local_client_manager,
+        state_store):
+    """A stopped, already configured instance is started instead of launching a new one."""
+    compute_client.list_instances.return_value.data = [_instance('ocid1.instance.old', 'STOPPED', configured=True)]
+    compute_client.get_instance.return_value.data = _instance('ocid1.instance.old', 'RUNNING', configured=True)
+    oci_manager = OCIManager(app_config, compute_client, networking_client, state_store)
+    with mock.patch.object(oci_manager, 'detect_public_ip', return_value='198.51.100.7'), \
+            mock.patch.object(oci_manager, 'configure_instance') as configure:
+        result = StartPipeline(oci_manager, local_client_manager, 443).run()
+
+    compute_client.instance_action.assert_called_once_with('ocid1.instance.old', 'START')
+    compute_client.launch_instance.assert_not_called()
+    configure.assert_not_called()
+    assert result['instance'].lifecycle_state == 'RUNNING'
+
+
+def test_pipeline_overlaps_independent_stages(app_config, compute_client, networking_client, local_client_manager,
+        state_store):
+    """Slow independent stages run concurrently rather than back to back."""
+    def slow(value):
+        def call(*args, **kwargs):
+            time.sleep(0.2)
+            return value
+        return call
+
+    oci_manager = OCIManager(app_config, compute_client, networking_client, state_store)
+    with mock.patch.object(oci_manager, 'detect_public_ip', side_effect=slow('198.51.100.7')), \
+            mock.patch.object(oci_manager, 'fetch_security_lists', side_effect=slow([])), \
+            mock.patch.object(oci_manager, 'find_existing_instance', side_effect=slow(None)), \
+            mock.patch.object(oci_manager, 'ensure_configured', return_value=False), \
+            mock.patch.object(oci_manager, 'update_network_security_list', return_value=(True, 'ok')):
+        result = StartPipeline(oci_manager, local_client_manager, 443).run()
+
+    assert result['timings']['total'] < 0.5
+
+
+def test_pipeline_propagates_stage_failure(app_config, compute_client, networking_client, local_client_manager,
+        state_store):
+    """A failing stage aborts the pipeline and keeps the timings gathered so far."""
+    networking_client.get_vnic.return_value.data.public_ip = None
+    oci_manager = OCIManager(app_config, compute_client, networking_client, state_store)
+    pipeline = StartPipeline(oci_manager, local_client_manager, 443)
+    with mock.patch.object(oci_manager, 'detect_public_ip', return_value='198.51.100.7'):
+        with pytest.raises(Exception, match="no public IP"):
+            pipeline.run()
+
+    assert 'provision_instance' in pipeline.timings
+    assert 'provision_instance' in format_timings(pipeline.timings)
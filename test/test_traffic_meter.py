@@ -0,0 +1,86 @@
+# Tests for the traffic-metering relay and quota alerts.
+# The relay sits in front of the local SOCKS5 stand-in from conftest.py.
+
+import datetime
+
+import pytest
+
+from src.proxy_bench import measure_download, measure_upload
+from src.traffic_meter import TrafficMeter, TrafficSeries, UsageRecorder
+from src.usage_tracker import UsageTracker
+
+
+@pytest.fixture
+def tracker(tmp_path):
+    clock = lambda: datetime.datetime(2024, 5, 10, 12, 0, 0)
+    tracker = UsageTracker({}, log_file=str(tmp_path / "usage_log.jsonl"), legacy_file=None, clock=clock)
+    tracker.log_start('ocid1.instance.a')
+    return tracker
+
+
+def test_series_is_a_ring_buffer():
+    series = TrafficSeries(capacity=3)
+    for second in range(5):
+        series.add(second, 100, 10)
+
+    assert len(series) == 3
+    assert series.rate(2) == (100.0, 10.0)
+
+
+def test_meter_counts_relayed_bytes(http_server, socks5_server):
+    base, _ = http_server({})
+    _, socks_port, proxy = socks5_server
+    samples = []
+    meter = TrafficMeter(0, socks_port, sample_interval=60, on_sample=lambda i, o: samples.append((i, o)))
+    port = meter.start()
+    try:
+        download = measure_download(f"{base}/bytes/500000", '127.0.0.1', port)
+        measure_upload(f"{base}/upload", '127.0.0.1', port, 200000)
+    finally:
+        meter.stop()
+
+    assert download['bytes'] == 500000
+    assert meter.total_connections == 2 and meter.active_connections == 0
+    # Payload plus SOCKS handshakes and HTTP headers.
+    assert 500000 < meter.bytes_in < 501000
+    assert 200000 < meter.bytes_out < 201000
+    assert samples == [(meter.bytes_in, meter.bytes_out)]
+    assert proxy.connections == 2
+
+
+def test_meter_refuses_when_port_taken(socks5_server):
+    host, socks_port, _ = socks5_server
+
+    with pytest.raises(OSError):
+        TrafficMeter(socks_port, socks_port).start()
+
+
+def test_recorder_flushes_traffic_into_the_session(tracker):
+    now = [0]
+    recorder = UsageRecorder(tracker, flush_interval=60, clock=lambda: now[0])
+
+    recorder(1000, 200)
+    assert tracker.open_session()['bytes_in'] == 0
+    now[0] = 61
+    recorder(500, 100)
+
+    assert tracker.open_session()['bytes_in'] == 1500
+    tracker.log_stop()
+    session = list(tracker.iter_sessions())[-1]
+    assert (session['bytes_in'], session['bytes_out']) == (1500, 300)
+    assert tracker.bytes_this_month() == 1800
+
+
+def test_quota_alerts_fire_once_per_level(tracker):
+    alerts = []
+    recorder = UsageRecorder(tracker, monthly_quota_bytes=10000, alert_threshold=80, flush_interval=0,
+                             on_alert=alerts.append)
+
+    recorder(7000, 0)
+    assert alerts == []
+    recorder(1000, 500)
+    recorder(100, 0)
+    assert len(alerts) == 1 and "85.0%" in alerts[0]
+    recorder(2000, 0)
+
+    assert len(alerts) == 2 and "106.0%" in alerts[1]
@@ -0,0 +1,210 @@
+# Tests for the append-only usage log.
+
+import datetime
+import json
+import os
+import threading
+
+import pytest
+
+from src.usage_tracker import UsageTracker
+
+
+class FakeClock:
+    def __init__(self, start=datetime.datetime(2024, 1, 1, 8, 0, 0)):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, **kwargs):
+        self.now += datetime.timedelta(**kwargs)
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def make_tracker(tmp_path, clock):
+    def make(**config):
+        return UsageTracker(config, log_file=str(tmp_path / "usage_log.jsonl"),
+                            legacy_file=str(tmp_path / "usage_log.json"), clock=clock)
+    return make
+
+
+def _lines(tracker):
+    with open(tracker.log_file) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_start_and_stop_append_one_line_each(make_tracker, clock):
+    tracker = make_tracker()
+
+    tracker.log_start('ocid1.instance.a')
+    clock.advance(hours=2)
+    tracker.log_stop()
+
+    records = _lines(tracker)
+    assert [r['event'] for r in records] == ['start', 'stop']
+    assert records[1]['start_time'] == records[0]['start_time']
+    assert list(tracker.iter_sessions()) == [{
+        'instance_id': 'ocid1.instance.a',
+        'start_time': '2024-01-01T08:00:00',
+        'end_time': '2024-01-01T10:00:00',
+        'bytes_in': 0,
+        'bytes_out': 0,
+    }]
+    assert "Total OCI Usage: 2:00:00" in tracker.generate_report()
+
+
+def test_open_session_comes_from_the_index(make_tracker, monkeypatch):
+    """A fresh tracker finds the open session without scanning the log."""
+    make_tracker().log_start('ocid1.instance.a')
+    tracker = make_tracker()
+    monkeypatch.setattr(tracker, 'iter_sessions', None)
+    monkeypatch.setattr(tracker, '_rebuild_index', None)
+
+    assert tracker.open_session()['instance_id'] == 'ocid1.instance.a'
+
+
+def test_stop_without_open_session(make_tracker, capsys):
+    tracker = make_tracker()
+
+    tracker.log_stop()
+
+    assert "No active session to stop." in capsys.readouterr().out
+    assert not os.path.exists(tracker.log_file)
+
+
+def test_torn_append_is_discarded(make_tracker, clock):
+    """A crash mid-append leaves a partial line; the index is rebuilt and the tail truncated."""
+    tracker = make_tracker()
+    tracker.log_start('ocid1.instance.a')
+    with open(tracker.log_file, 'ab') as f:
+        f.write(b'{"event":"stop","inst')
+
+    tracker = make_tracker()
+    clock.advance(minutes=30)
+    tracker.log_stop()
+
+    records = _lines(tracker)
+    assert [r['event'] for r in records] == ['start', 'stop']
+    assert tracker.open_session() is None
+
+
+def test_compaction_keeps_sessions(make_tracker, clock):
+    tracker = make_tracker(usage_log_compact_after=0)
+    for instance in ('a', 'b', 'c'):
+        tracker.log_start(instance)
+        clock.advance(hours=1)
+        tracker.log_stop()
+    tracker.log_start('d')
+    before = list(tracker.iter_sessions())
+
+    assert tracker.compact() == 3
+
+    assert len(_lines(tracker)) == 4
+    assert list(tracker.iter_sessions()) == before
+    assert make_tracker().open_session()['instance_id'] == 'd'
+
+
+def test_compaction_runs_automatically(make_tracker, clock):
+    tracker = make_tracker(usage_log_compact_after=2)
+    for instance in ('a', 'b'):
+        tracker.log_start(instance)
+        clock.advance(hours=1)
+        tracker.log_stop()
+
+    assert [r['event'] for r in _lines(tracker)] == ['stop', 'stop']
+
+
+def test_legacy_json_log_is_migrated(tmp_path, make_tracker):
+    legacy = tmp_path / "usage_log.json"
+    legacy.write_text(json.dumps([
+        {"instance_id": "a", "start_time": "2024-01-01T08:00:00", "end_time": "2024-01-01T09:00:00"},
+        {"instance_id": "b", "start_time": "2024-01-02T08:00:00", "end_time": None},
+    ], indent=4))
+
+    tracker = make_tracker()
+
+    assert not legacy.exists()
+    assert (tmp_path / "usage_log.json.migrated").exists()
+    assert [s['instance_id'] for s in tracker.iter_sessions()] == ['a', 'b']
+    assert tracker.open_session()['instance_id'] == 'b'
+
+
+def test_rollups_split_sessions_across_days_and_months(make_tracker, clock):
+    clock.now = datetime.datetime(2024, 1, 31, 22, 0, 0)
+    tracker = make_tracker()
+    tracker.log_start('a')
+    clock.advance(hours=4)
+    tracker.log_stop()
+
+    rollups = tracker.rollups()
+
+    assert rollups['days'] == {'2024-01-31': 7200, '2024-02-01': 7200}
+    assert rollups['months'] == {'2024-01': 7200, '2024-02': 7200}
+    assert rollups['instances'] == {'a': 14400}
+    assert rollups['total_seconds'] == 14400
+
+
+def test_hours_this_month_uses_rollups_and_open_session(make_tracker, clock, monkeypatch):
+    tracker = make_tracker()
+    tracker.log_start('a')
+    clock.advance(hours=3)
+    tracker.log_stop()
+    tracker.log_start('b')
+    clock.advance(hours=1, minutes=30)
+
+    tracker = make_tracker()
+    monkeypatch.setattr(tracker, 'iter_sessions', None)
+
+    assert tracker.hours_this_month() == pytest.approx(4.5)
+
+
+def test_rollups_are_rebuilt_when_stale(make_tracker, clock):
+    tracker = make_tracker()
+    tracker.log_start('a')
+    clock.advance(hours=1)
+    tracker.log_stop()
+    os.remove(tracker.rollup_file)
+
+    assert make_tracker().rollups()['instances'] == {'a': 3600}
+
+
+def test_report_filters_and_exports(make_tracker, clock):
+    tracker = make_tracker()
+    for day in range(1, 4):
+        clock.now = datetime.datetime(2024, 3, day, 23, 0, 0)
+        tracker.log_start(f"i{day}")
+        clock.advance(hours=2)
+        tracker.log_stop()
+
+    rows = list(tracker.iter_report(since=datetime.date(2024, 3, 2), until=datetime.date(2024, 3, 2), fmt='csv'))
+    assert rows[0] == 'instance_id,start_time,end_time,bytes_in,bytes_out,duration_seconds'
+    assert [row.split(',')[0] for row in rows[1:]] == ['i1', 'i2']
+    assert [row.split(',')[-1] for row in rows[1:]] == ['3600', '3600']
+
+    exported = json.loads(tracker.generate_report(fmt='json'))
+    assert [s['instance_id'] for s in exported] == ['i1', 'i2', 'i3']
+    assert all(s['duration_seconds'] == 7200 for s in exported)
+
+    with pytest.raises(ValueError):
+        list(tracker.iter_report(fmt='xml'))
+
+
+def test_traffic_logged_from_another_thread_is_not_lost(make_tracker, clock):
+    tracker = make_tracker()
+    tracker.log_start('a')
+
+    writers = [threading.Thread(target=lambda: [tracker.log_traffic(10, 1) for _ in range(50)]) for _ in range(4)]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+    tracker.log_stop()
+
+    session, = tracker.iter_sessions()
+    assert (session['bytes_in'], session['bytes_out']) == (2000, 200)